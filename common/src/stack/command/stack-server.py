@@ -0,0 +1,202 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import sys
+import json
+import time
+import select
+import signal
+import socket
+import struct
+import syslog
+import pkgutil
+import argparse
+import stack.cli
+import stack.commands
+from stack.commands import get_mysql_connection
+
+
+class Server:
+	"""
+	Resident server for the stack command line.
+
+	The server imports the entire command tree once and keeps a pool of
+	idle pre-forked workers, each already holding its own database
+	connection. A worker serves exactly one command and exits, so the
+	process state (cwd, environment, select cache) of one command never
+	leaks into the next. Commands that were not imported at startup
+	(e.g. from a pallet added later) are imported by the worker on
+	demand, but changes to already imported commands require a restart.
+	"""
+
+	def __init__(self, path, workers):
+		self.path    = path
+		self.workers = workers
+		self.idle    = set()
+		self.busy    = set()
+
+		if os.path.exists(path):
+			os.unlink(path)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.bind(path)
+		os.chmod(path, 0o600)
+		self.sock.listen(128)
+
+		# Workers write their pid here once they have accepted a
+		# connection so we know to replace them.
+		self.notify_r, self.notify_w = os.pipe()
+
+	def preload(self):
+		"""
+		Import every command module so forked workers inherit them.
+		"""
+
+		t0 = time.time()
+		count = 0
+		for module in pkgutil.walk_packages(stack.commands.__path__, 'stack.commands.',
+						    onerror=lambda name: None):
+			try:
+				__import__(module.name)
+				count += 1
+			except Exception as e:
+				syslog.syslog(syslog.LOG_WARNING, 'cannot preload %s: %s' % (module.name, e))
+
+		syslog.syslog(syslog.LOG_INFO, 'preloaded %d modules in %.3fs' % (count, time.time() - t0))
+
+	def spawn(self):
+		pid = os.fork()
+		if pid:
+			self.idle.add(pid)
+			return
+
+		# Never return into the server loop from a worker
+		rc = 1
+		try:
+			os.close(self.notify_r)
+			signal.signal(signal.SIGTERM, signal.SIG_DFL)
+			signal.signal(signal.SIGINT, signal.SIG_DFL)
+			db = get_mysql_connection()
+			conn, addr = self.sock.accept()
+			os.write(self.notify_w, struct.pack('i', os.getpid()))
+			self.sock.close()
+			rc = self.serve(conn, db)
+		except BaseException as e:
+			syslog.syslog(syslog.LOG_ERR, 'worker failed: %s' % e)
+		finally:
+			os._exit(rc)
+
+	def serve(self, conn, db):
+		"""
+		Run a single command for the client on CONN.
+		"""
+
+		# Only serve clients running as our own user, anyone else
+		# could use us to escalate their privileges.
+
+		pid, uid, gid = struct.unpack('3i', conn.getsockopt(
+			socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')
+		))
+		if uid != os.geteuid():
+			syslog.syslog(syslog.LOG_WARNING, 'rejected client pid %d uid %d' % (pid, uid))
+			return 1
+
+		data, fds = stack.cli.recv_fds(conn, 3)
+		request = json.loads(data)
+
+		conn.sendall((json.dumps({'pid': os.getpid()}) + '\n').encode())
+
+		os.chdir(request['cwd'])
+		os.environ.clear()
+		os.environ.update(request['env'])
+		for fd, stdfd in zip(fds, (0, 1, 2)):
+			os.dup2(fd, stdfd)
+			os.close(fd)
+
+		# The connection was opened while we sat idle, make sure the
+		# server did not drop it in the meantime.
+		if db is not None:
+			db.ping(reconnect=True)
+
+		signal.signal(signal.SIGINT, signal.default_int_handler)
+		syslog.openlog('SCL', syslog.LOG_PID, syslog.LOG_LOCAL0)
+		try:
+			rc = stack.cli.main(request['argv'], db)
+		except KeyboardInterrupt:
+			print('\nInterrupted')
+			rc = 0
+		except SystemExit as e:
+			rc = e.code
+		sys.stdout.flush()
+		sys.stderr.flush()
+
+		if rc is None:
+			rc = 0
+		conn.sendall((json.dumps({'rc': rc}) + '\n').encode())
+		conn.close()
+		return 0
+
+	def reap(self):
+		while True:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except ChildProcessError:
+				return
+			if not pid:
+				return
+			self.idle.discard(pid)
+			self.busy.discard(pid)
+
+	def run(self):
+		self.preload()
+
+		while True:
+			self.reap()
+			while len(self.idle) < self.workers:
+				self.spawn()
+
+			ready, _, _ = select.select([self.notify_r], [], [], 1)
+			if ready:
+				data = os.read(self.notify_r, 4096)
+				for i in range(0, len(data) - len(data) % 4, 4):
+					pid, = struct.unpack('i', data[i:i + 4])
+					self.idle.discard(pid)
+					self.busy.add(pid)
+
+	def shutdown(self):
+		for pid in self.idle:
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except ProcessLookupError:
+				pass
+		if os.path.exists(self.path):
+			os.unlink(self.path)
+
+
+def Handler(signal, frame):
+	sys.exit(0)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--socket', default=stack.cli.SOCKET,
+		    help='unix socket to accept commands on')
+parser.add_argument('--workers', type=int, default=4,
+		    help='number of idle workers to keep ready')
+args = parser.parse_args()
+
+syslog.openlog('stack-server', syslog.LOG_PID, syslog.LOG_LOCAL0)
+
+server = Server(args.socket, args.workers)
+signal.signal(signal.SIGTERM, Handler)
+signal.signal(signal.SIGINT, Handler)
+try:
+	server.run()
+finally:
+	server.shutdown()
@@ -1,3 +1,4 @@
+import os
 from stack.util import flatten
 from stack.exception import ArgNotFound
 from stack.argument_processors.pallet import Pallet
@@ -50,3 +51,20 @@ class BoxArgumentProcessor:
 		pallets.extend([Pallet(*row) for row in rows])
 
 		return pallets
+
+	def get_box_directories(self, box='default'):
+		"""
+		Returns the pallet and cart directories of a box, these
+		hold the graph and node files of the box's hosts.
+		"""
+
+		directories = []
+		for pallet in self.get_box_pallets(box):
+			directories.append(os.path.join('/export', 'stack', 'pallets',
+				pallet.name, pallet.version, pallet.rel, pallet.os, pallet.arch))
+
+		for row in self.call('list.cart'):
+			if box in row['boxes'].split():
+				directories.append(os.path.join('/export', 'stack', 'carts', row['name']))
+
+		return directories
@@ -295,8 +295,43 @@ class FirmwareArgumentProcessor:
 		If none of the interfaces on the common network have IP addresses, a CommandError is raised.
 		"""
 		host_interface_frontend = self.call(command = "list.host.interface", args = ["a:frontend"])
-		# try to get the set of all common networks between the front end and the target host
 		host_networks = set(host["network"] for host in self.call(command = "list.host.interface", args = [hostname]))
+		return self._pick_common_frontend_ip(
+			hostname = hostname,
+			host_networks = host_networks,
+			host_interface_frontend = host_interface_frontend,
+		)
+
+	def get_common_frontend_ips(self, hostnames):
+		"""Gets the common frontend IP of each of the provided hosts, as get_common_frontend_ip does for one host.
+
+		The interfaces of the hosts and the front end are all listed at once, so this is much faster than calling
+		get_common_frontend_ip for many hosts. The result is a dictionary of hostnames to IPs.
+
+		A CommandError is raised for the first host that get_common_frontend_ip would fail for.
+		"""
+		if not hostnames:
+			return {}
+
+		frontends = set(self.getHostnames(names = ["a:frontend"]))
+		interfaces = self.call(command = "list.host.interface", args = [*hostnames, "a:frontend"])
+		host_interface_frontend = [interface for interface in interfaces if interface["host"] in frontends]
+		networks_by_host = {}
+		for interface in interfaces:
+			networks_by_host.setdefault(interface["host"], set()).add(interface["network"])
+
+		return {
+			hostname: self._pick_common_frontend_ip(
+				hostname = hostname,
+				host_networks = networks_by_host.get(hostname, set()),
+				host_interface_frontend = host_interface_frontend,
+			)
+			for hostname in hostnames
+		}
+
+	def _pick_common_frontend_ip(self, hostname, host_networks, host_interface_frontend):
+		"""Picks the IP of one of the provided front end interfaces on one of the provided host networks."""
+		# try to get the set of all common networks between the front end and the target host
 		frontend_networks = set(frontend_interface["network"] for frontend_interface in host_interface_frontend)
 		common_networks = list(host_networks & frontend_networks)
 
@@ -327,9 +362,11 @@ class FirmwareArgumentProcessor:
 		# pick the first one and use it
 		return ip_addr[0]
 
-	def get_firmware_url(self, hostname, firmware_file):
+	def get_firmware_url(self, hostname, firmware_file, frontend_ip = None):
 		"""Attempts to get a url to allow a backend to download the provided firmware file from the front end.
 
+		The frontend_ip is looked up with get_common_frontend_ip unless it is provided.
+
 		If the frontend and the backend have no common networks, a CommandError is raised.
 		If none of the interfaces on the common network have IP addresses, a CommandError is raised.
 		If the file doesn't exist on disk, a CommandError is raised.
@@ -342,7 +379,7 @@ class FirmwareArgumentProcessor:
 				msg = f"Cannot resolve frontend URL for firmware file that does not exist: {exception}",
 			)
 
-		ip_addr = self.get_common_frontend_ip(hostname = hostname)
+		ip_addr = frontend_ip if frontend_ip is not None else self.get_common_frontend_ip(hostname = hostname)
 		# remove the /export/stack prefix from the file path, as /install points to /export/stack
 		firmware_file = Path().joinpath(*(part for part in firmware_file.parts if part not in ("/", "export", "stack")))
 
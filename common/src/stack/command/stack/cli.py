@@ -0,0 +1,260 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# @rocks@
+# Copyright (c) 2000 - 2010 The Regents of the University of California
+# All rights reserved. Rocks(r) v5.4 www.rocksclusters.org
+# https://github.com/Teradata/stacki/blob/master/LICENSE-ROCKS.txt
+# @rocks@
+
+import os
+import sys
+import json
+import array
+import signal
+import socket
+import syslog
+import getopt
+import traceback
+import stack
+from stack.bool import str2bool
+from stack.exception import CommandError
+
+# The command tree (and pymysql) is imported in main() so forwarding a
+# command to the server stays cheap.
+
+# Unix socket the stack-server daemon accepts commands on. Only clients
+# running as the same user as the server (root) are served, everyone
+# else runs the command in their own process.
+
+SOCKET = '/var/run/stack/command.sock'
+
+
+def run_command(args, db, debug=False):
+	# Check if the stack command has been quoted.
+
+	module = None
+	if not args:
+		return
+
+	cmd = args[0].split()
+	if len(cmd) > 1:
+		s = 'stack.commands.%s' % '.'.join(cmd)
+		try:
+			__import__(s)
+			module = eval(s)
+			i = 1
+		except:
+			module = None
+
+	# Treat the entire command line as if it were a python
+	# command module and keep popping arguments off the end
+	# until we get a match.	 If no match is found issue an
+	# error
+	if not module:
+		for i in range(len(args), 0, -1):
+			s = 'stack.commands.%s' % '.'.join(args[:i])
+			try:
+				__import__(s)
+				module = eval(s)
+				if module:
+					break
+			except ImportError:
+				continue
+
+	if not module:
+		sys.stderr.write('Error - Invalid stack command "%s"\n' % args[0])
+		return -1
+
+	name = ' '.join(s.split('.')[2:])
+
+	# If we can load the command object then fall through and invoke the run()
+	# method.  Otherwise the user did not give a complete command line and
+	# we call the help command based on the partial command given.
+
+	if not hasattr(module, 'Command'):
+		import stack.commands.list.help
+		help = stack.commands.list.help.Command(db)
+		fullmodpath = s.split('.')
+		submodpath = '/'.join(fullmodpath[2:])
+		try:
+			help.run({'subdir': submodpath}, [])
+		except CommandError as e:
+			sys.stderr.write('%s\n' % e)
+			return -1
+		print(help.getText())
+		return -1
+
+	try:
+		command = getattr(module, 'Command')(db, debug=debug)
+		command.stream = sys.stdout
+		rc = command.runWrapper(name, args[i:])
+	except CommandError as e:
+		sys.stderr.write('%s\n' % e)
+		syslog.syslog(syslog.LOG_ERR, '%s' % e)
+		return -1
+	except Exception as e:
+		# Sanitize Exceptions, and log them.
+		exc, msg, tb = sys.exc_info()
+		for line in traceback.format_tb(tb):
+			syslog.syslog(syslog.LOG_DEBUG, '%s' % line)
+			sys.stderr.write(line)
+		error = '%s: %s -- %s' % (module.__name__, exc.__name__, msg)
+		sys.stderr.write('%s\n' % error)
+		syslog.syslog(syslog.LOG_ERR, error)
+		return -1
+
+	text = command.getText()
+
+	# set the SIGPIPE to the system default (instead of python default)
+	# before trying to print; prevents a stacktrace when exiting a pipe'd stack command
+	signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+	if text and len(text) > 0:
+		print(text, end='')
+		if text[len(text) - 1] != '\n':
+			print()
+	syslog.closelog()
+	if rc is True:
+		return 0
+	return -1
+
+
+def main(argv, db=None):
+	"""
+	Runs the stack command line ARGV (without the program name) and
+	returns the exit code. If DB is None a new database connection is
+	opened, either way the connection is closed when done.
+	"""
+
+	from stack.commands import get_mysql_connection
+
+	if db is None:
+		db = get_mysql_connection()
+
+	try:
+		opts, args = getopt.getopt(argv, '', ['debug', 'help', 'version'])
+	except getopt.GetoptError as msg:
+		sys.stderr.write("error - %s\n" % msg)
+		if db is not None:
+			db.close()
+		return 1
+
+	debug = False
+	rc = None
+	for o, a in opts:
+		if o == '--debug':
+			debug = True
+		elif o == '--help':
+			rc = run_command(['help'], db)
+		elif o == '--version':
+			rc = run_command(['report.version'], db)
+
+	if rc is None:
+		if len(args) == 0:
+			rc = run_command(['help'], db)
+		else:
+			rc = run_command(args, db, debug)
+
+	if db is not None:
+		db.close()
+
+	return rc
+
+
+def send_fds(sock, data, fds):
+	sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+
+
+def recv_fds(sock, maxfds):
+	"""
+	Receives a newline terminated message along with up to MAXFDS file
+	descriptors. Returns the message and the list of descriptors.
+	"""
+
+	fds  = array.array('i')
+	data = b''
+
+	msg, ancdata, flags, addr = sock.recvmsg(4096, socket.CMSG_LEN(maxfds * fds.itemsize))
+	for level, kind, cmsg in ancdata:
+		if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+			fds.frombytes(cmsg[:len(cmsg) - (len(cmsg) % fds.itemsize)])
+
+	data = msg
+	while data and not data.endswith(b'\n'):
+		chunk = sock.recv(65536)
+		if not chunk:
+			break
+		data += chunk
+
+	return data, list(fds)
+
+
+def forward(argv, path=SOCKET):
+	"""
+	Run the command line ARGV in the stack-server daemon, if there is
+	one. Our stdin, stdout, and stderr are handed to the server process
+	running the command so output streams straight to the caller.
+
+	Returns the exit code of the command, or None if the command was
+	not run by a server and must be run locally.
+	"""
+
+	if os.environ.get('STACKSERVER') and not str2bool(os.environ.get('STACKSERVER')):
+		return None
+
+	if os.geteuid() != 0 or not os.path.exists(path):
+		return None
+
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(path)
+	except OSError:
+		sock.close()
+		return None
+
+	request = {
+		'argv': argv,
+		'cwd':	os.getcwd(),
+		'env':	dict(os.environ),
+	}
+
+	stream = sock.makefile('rb')
+	worker = None
+	rc     = None
+
+	def interrupt(signum, frame):
+		if worker:
+			os.kill(worker, signum)
+
+	try:
+		send_fds(sock, (json.dumps(request) + '\n').encode(), [0, 1, 2])
+
+		signal.signal(signal.SIGINT, interrupt)
+		signal.signal(signal.SIGTERM, interrupt)
+		for line in stream:
+			reply = json.loads(line)
+			if 'pid' in reply:
+				worker = reply['pid']
+			if 'rc' in reply:
+				rc = reply['rc']
+	except (OSError, ValueError):
+		rc = None
+	finally:
+		signal.signal(signal.SIGINT, signal.SIG_DFL)
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		stream.close()
+		sock.close()
+
+	# The server died before it started the command (no pid) so it is
+	# safe to run it ourselves.
+
+	if rc is None and worker is None:
+		return None
+
+	if rc is None:
+		return 1
+	return rc
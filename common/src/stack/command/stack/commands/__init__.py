@@ -31,13 +31,15 @@ from operator import itemgetter
 from itertools import groupby, cycle
 from collections import OrderedDict, namedtuple
 from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
 import threading
 
 import pymysql
 
 import stack.graph
 import stack
-from stack.cond import EvalCondExpr
+from stack.cond import EvalCondExpr, CondExprNames
+from stack.sql import SelectCache, sql_read_tables, sql_write_tables
 from stack.exception import (
 	CommandError, ParamRequired, ArgNotFound, ArgRequired, ArgUnique, ParamError
 )
@@ -448,15 +450,8 @@ class HostArgumentProcessor:
 		"""
 
 		adhoc	 = False
-		hostList = []
 		hostDict = {}
 
-		# List the frontend first
-		frontends = self.db.select("""
-			n.name from nodes n, appliances a
-			where a.name='frontend' and a.id=n.appliance order by rack, rank %s
-		""" % order)
-
 		# Performance improvement for `list host profile`
 		if (
 			names==["a:frontend"]
@@ -464,47 +459,33 @@ class HostArgumentProcessor:
 			and subnet == None
 			and host_filter == None
 		):
-			return flatten(frontends)
-
-		# Now get the backend appliances
-		rows = self.db.select("""
-			n.name, n.rack, n.rank from nodes n, appliances a
-			where a.name != "frontend" and a.id=n.appliance
-		""")
-
-		hosts = []
-		if frontends:
-			hosts.extend(frontends)
-
-		sortem = []
-		for host, rack, rank in rows:
-			sortem.append({ 'host' : host, 'rack' : rack, 'rank' : rank })
-
-		backends = self.sortHosts(sortem)
-
-		if backends:
-			hosts.extend(backends)
-
-		for host, in hosts:
-			# If we have a list of hostnames (or groups) then
-			# disable all the hosts first and selectively
-			# turn them on later.
-			# Otherwise just enable all the hosts.
-			#
-			# The hostList is used to preserve the SQL sort order
-			# in the output, and the hostDict use use to map
-			# the hosts on/off in the returned host list
-			#
-			# If the subnet names a network the hostname
-			# stored in the hostDict will be the name of that
-			# interface rather than the name in the nodes table
-
-			hostList.append(host)
+			return flatten(self.db.select("""
+				n.name from nodes n, appliances a
+				where a.name='frontend' and a.id=n.appliance order by rack, rank %s
+			""" % order))
+
+		# The index of all the hosts (frontends first) is shared by
+		# every command using this database until the nodes change.
+		index	 = self.getHostIndex(order)
+		hostList = index['hosts']
+
+		# If we have a list of hostnames (or groups) then
+		# disable all the hosts first and selectively
+		# turn them on later.
+		# Otherwise just enable all the hosts.
+		#
+		# The hostList is used to preserve the SQL sort order
+		# in the output, and the hostDict use use to map
+		# the hosts on/off in the returned host list
+		#
+		# If the subnet names a network the hostname
+		# stored in the hostDict will be the name of that
+		# interface rather than the name in the nodes table
 
-			if names:
-				hostDict[host] = None
-			else:
-				hostDict[host] = self.db.getNodeName(host, subnet)
+		if names:
+			hostDict = dict.fromkeys(hostList)
+		else:
+			hostDict = {host: self._subnetHostname(host, subnet) for host in hostList}
 
 		l = []
 		if names:
@@ -543,15 +524,9 @@ class HostArgumentProcessor:
 		# Also load the attributes if the managed_only argument is true
 		# since we need to looked the managed attribute.
 
-		hostAttrs  = {}
-		for host in hostList:
-			hostAttrs[host] = {}
+		hostAttrs = {}
 		if adhoc or managed_only:
-			for row in self.call('list.host.attr', hostList):
-				h = row['host']
-				a = row['attr']
-				v = row['value']
-				hostAttrs[h][a] = v
+			hostAttrs = self.getHostAttrColumns()
 
 		# Finally iterate over all the host/groups
 		list	 = []
@@ -559,19 +534,10 @@ class HostArgumentProcessor:
 		for name in names:
 			# Ad-hoc group
 			if name.find('where') == 0:
-				for host in hostList:
-					exp = name[5:]
-					try:
-						res = EvalCondExpr(exp, hostAttrs[host])
-					except SyntaxError:
-						raise CommandError(self, 'group syntax "%s"' % exp)
-					if res:
-						s = self.db.getHostname(host, subnet)
-						hostDict[host] = s
-						if host not in explicit:
-							explicit[host] = False
-					# Debug('group %s is %s for %s' %
-					# 	(exp, res, host))
+				for host in self._whereHosts(name[5:], hostList, hostAttrs):
+					hostDict[host] = self._subnetHostname(host, subnet)
+					if host not in explicit:
+						explicit[host] = False
 
 			# Glob regex hostname
 			#
@@ -579,17 +545,22 @@ class HostArgumentProcessor:
 			# people that use uppercase hostname (don't be that
 			# guy).
 			elif '*' in name or '?' in name or '[' in name:
-				for lower in fnmatch.filter([h.lower() for h in hostList], name):
-					host = self.db.getHostname(lower) # fix case
-					hostDict[host] = self.db.getHostname(host, subnet)
+				for lower in fnmatch.filter(index['lowered'], name):
+					host = index['lower'][lower] # fix case
+					hostDict[host] = self._subnetHostname(host, subnet)
 					if host not in explicit:
 						explicit[host] = False
 
 			# Simple hostname
 			else:
-				host = self.db.getHostname(name)
-				explicit[host] = True
-				hostDict[host] = self.db.getHostname(name, subnet)
+				host = self._indexedHostname(index, name)
+				if host is None:
+					host = self.db.getHostname(name)
+					explicit[host] = True
+					hostDict[host] = self.db.getHostname(name, subnet)
+				else:
+					explicit[host] = True
+					hostDict[host] = self._subnetHostname(host, subnet)
 
 		# Preserving the SQL ordering build the list of hostname
 		# selected.
@@ -607,7 +578,7 @@ class HostArgumentProcessor:
 				continue
 
 			if managed_only:
-				managed = str2bool(hostAttrs[host]['managed'])
+				managed = str2bool(hostAttrs.get(host, {}).get('managed'))
 				if not managed and not explicit.get(host):
 					continue
 
@@ -623,6 +594,153 @@ class HostArgumentProcessor:
 
 		return list
 
+	def getHostIndex(self, order='asc'):
+		"""
+		Returns a dictionary indexing all the hosts in the cluster:
+
+		hosts	- the host names in display order, frontends first
+		lower	- lowercase host name to host name
+		lowered	- the lowercase host names, for globbing
+		ip	- interface IP address to host name
+
+		The index is cached along with the database selects, so it is
+		built once and shared by all sub-commands until one of the
+		tables it comes from changes.
+		"""
+
+		def build():
+			frontends = flatten(self.db.select("""
+				n.name from nodes n, appliances a
+				where a.name='frontend' and a.id=n.appliance order by rack, rank %s
+			""" % order))
+
+			backends = self.sortHosts([
+				{ 'host' : host, 'rack' : rack, 'rank' : rank }
+				for host, rack, rank in self.db.select("""
+					n.name, n.rack, n.rank from nodes n, appliances a
+					where a.name != "frontend" and a.id=n.appliance
+				""")
+			])
+
+			hosts = frontends + [host for host, in backends]
+			index = {
+				'hosts':   hosts,
+				'lower':   {host.lower(): host for host in hosts},
+				'lowered': [host.lower() for host in hosts],
+				'ip':	   {},
+			}
+
+			for host, ip in self.db.select("""
+				n.name, net.ip from nodes n, networks net
+				where net.node=n.id and net.ip is not null
+			"""):
+				index['ip'].setdefault(ip, host)
+
+			return index
+
+		return self.db.memoize(
+			f'host index {order}', {'nodes', 'appliances', 'networks'}, build
+		)
+
+	def getHostAttrColumns(self):
+		"""
+		Returns the attributes of every host as a dictionary of host
+		name to a dictionary of attribute name to value.
+
+		Host attributes come from most of the database, so the result
+		is only shared until the next write.
+		"""
+
+		def build():
+			attrs = {}
+			for row in self.call('list.host.attr'):
+				attrs.setdefault(row['host'], {})[row['attr']] = row['value']
+			return attrs
+
+		return self.db.memoize('host attrs', None, build)
+
+	def _indexedHostname(self, index, name):
+		"""
+		Resolve a host name or IP address against the host index.
+		Returns None if the name needs a full lookup.
+		"""
+
+		if '%' in name or '_' in name:
+			return None
+
+		return index['lower'].get(name.lower()) or index['ip'].get(name)
+
+	def _subnetHostname(self, host, subnet):
+		"""
+		Returns the name of HOST on SUBNET, or the host name itself
+		if no subnet is given.
+		"""
+
+		if not subnet:
+			return host
+
+		def build():
+			names = {}
+			for name, netname, zone in self.db.select("""
+				n.name, net.name, s.zone from nodes n, networks net, subnets s
+				where s.name like %s and net.node = n.id and net.subnet = s.id
+			""", (subnet,)):
+				# If interface exists, but name is not set
+				# infer name from nodes table, and append
+				# dns zone
+				if not netname:
+					netname = name
+				if zone:
+					names[name.lower()] = '%s.%s' % (netname, zone)
+				else:
+					names[name.lower()] = netname
+			return names
+
+		names = self.db.memoize(
+			f'subnet hostnames {subnet}', {'nodes', 'networks', 'subnets'}, build
+		)
+		return names.get(host.lower())
+
+	def _whereHosts(self, exp, hosts, hostAttrs):
+		"""
+		Returns the HOSTS for which the ad-hoc group condition EXP is
+		true.
+
+		A condition only depends on the attributes it names, so it is
+		evaluated once per distinct combination of those attribute
+		values rather than once per host. For a condition like
+		'appliance == "backend"' that is a handful of evaluations for
+		the entire cluster.
+		"""
+
+		names = CondExprNames(exp)
+		if names is None:
+			# EvalCondExpr treats an invalid condition as false
+			return []
+
+		# Only the attributes the condition names matter, and that
+		# some host has (most often the first one looked at).
+
+		columns = sorted(
+			attr for attr in names
+			if any(attr in attrs for attrs in hostAttrs.values())
+		)
+
+		results = {}
+		selected = []
+		for host in hosts:
+			attrs  = hostAttrs.get(host, {})
+			values = [attrs.get(attr) for attr in columns]
+
+			# Some attributes are lists, so key on the repr
+			key = repr(values)
+			if key not in results:
+				results[key] = EvalCondExpr(exp, dict(zip(columns, values)))
+			if results[key]:
+				selected.append(host)
+
+		return selected
+
 	def getHosts(self, args):
 		"""
 		Return the host names for the hosts or patterns specified in args,
@@ -1104,6 +1222,7 @@ class DatabaseConnection:
 	"""
 
 	cache = {}
+	cache_size = 10000
 	_lookup_hostname_cache = {}
 
 	def _lookup_hostname(self, hostname):
@@ -1143,6 +1262,10 @@ class DatabaseConnection:
 	def __init__(self, database, *, caching=True):
 		# self.database : object returned from orginal connect call
 		# self.link	: database cursor used by everyone else
+		#
+		# A thread can swap in a connection of its own with
+		# attachThread(), see runPlugins().
+		self._thread = threading.local()
 		if database:
 			self.database = database
 			self.name     = database.db.decode() # name of the database
@@ -1163,14 +1286,72 @@ class DatabaseConnection:
 		# that may change (thought about it for the shadow database)
 		# hence the code.
 
+		#
+		# The cache is bounded (LRU) to DatabaseConnection.cache_size
+		# entries, which STACKCACHESIZE overrides.
+
 		if self.name not in DatabaseConnection.cache:
-			DatabaseConnection.cache[self.name] = {}
+			if os.environ.get('STACKCACHESIZE'):
+				DatabaseConnection.cache_size = int(os.environ.get('STACKCACHESIZE'))
+			DatabaseConnection.cache[self.name] = SelectCache(DatabaseConnection.cache_size)
 
 		if os.environ.get('STACKCACHE'):
 			self.caching = str2bool(os.environ.get('STACKCACHE'))
 		else:
 			self.caching = caching
 
+	@property
+	def database(self):
+		return getattr(self._thread, 'database', self._database)
+
+	@database.setter
+	def database(self, database):
+		if hasattr(self._thread, 'database'):
+			self._thread.database = database
+		else:
+			self._database = database
+
+	@property
+	def link(self):
+		return getattr(self._thread, 'link', self._link)
+
+	@link.setter
+	def link(self, link):
+		if hasattr(self._thread, 'link'):
+			self._thread.link = link
+		else:
+			self._link = link
+
+	def attachThread(self):
+		"""
+		Gives the calling thread a connection of its own to the same
+		database as the same user, used until detachThread(). Other
+		threads keep using the shared connection. The select cache is
+		still shared.
+		"""
+
+		shared = self._database
+		if not shared or hasattr(self._thread, 'database'):
+			return
+
+		database = pymysql.connect(
+			db=shared.db,
+			user=shared.user,
+			passwd=shared.password,
+			host=shared.host,
+			port=shared.port,
+			unix_socket=shared.unix_socket,
+			autocommit=True
+		)
+		self._thread.database = database
+		self._thread.link     = database.cursor()
+
+	def detachThread(self):
+		database = getattr(self._thread, 'database', None)
+		if database:
+			database.close()
+		self._thread.__dict__.clear()
+
 	def enableCache(self):
 		self.caching = True
 
@@ -1178,10 +1359,49 @@ class DatabaseConnection:
 		self.caching = False
 		self.clearCache()
 
-	def clearCache(self):
-		Debug('clearing cache of %d selects' % len(DatabaseConnection.cache[self.name]))
-		DatabaseConnection.cache[self.name] = {}
-		DatabaseConnection._lookup_hostname_cache = {}
+	def clearCache(self, tables=None):
+		"""
+		Evict the cached selects that read from any of TABLES, or
+		the entire cache if TABLES is None.
+		"""
+
+		cache = DatabaseConnection.cache[self.name]
+		count = cache.invalidate(tables)
+
+		if tables is None:
+			Debug('clearing cache of %d selects' % count)
+		elif count:
+			Debug('clearing %d selects reading %s' % (count, ', '.join(sorted(tables))))
+
+		if tables is None or 'nodes' in tables:
+			DatabaseConnection._lookup_hostname_cache = {}
+
+	def cacheStats(self):
+		"""
+		Returns a dictionary of the select cache entry count and the
+		hit, miss, and eviction counters.
+		"""
+
+		return DatabaseConnection.cache[self.name].stats()
+
+	def memoize(self, key, tables, build):
+		"""
+		Returns a value derived from the database, calling BUILD to
+		create it on a miss. The value is kept in the select cache
+		and evicted whenever any of TABLES is written (any write at
+		all if TABLES is None).
+		"""
+
+		if not self.caching:
+			return build()
+
+		cache = DatabaseConnection.cache[self.name]
+		value = cache.get(key)
+		if value is None:
+			value = build()
+			cache.put(key, value, tables)
+
+		return value
 
 	def count(self, command, args=None ):
 		"""
@@ -1216,9 +1436,10 @@ class DatabaseConnection:
 			m.update(' '.join(str(arg) for arg in args).encode('utf-8'))
 		k = m.hexdigest()
 
-		if k in DatabaseConnection.cache[self.name]:
+		cache = DatabaseConnection.cache[self.name]
+		rows = cache.get(k) if self.caching else None
+		if rows is not None:
 			Debug('select %s' % k)
-			rows = DatabaseConnection.cache[self.name][k]
 		else:
 			if prepend_select:
 				command = f'select {command}'
@@ -1233,7 +1454,7 @@ class DatabaseConnection:
 				rows = []
 
 			if self.caching:
-				DatabaseConnection.cache[self.name][k] = rows
+				cache.put(k, rows, sql_read_tables(command, self.name))
 		return rows
 
 	def execute(self, command, args=None, many=False):
@@ -1243,8 +1464,11 @@ class DatabaseConnection:
 		"""
 		command = command.strip()
 
-		if not command.lower().startswith('select'):
-			self.clearCache()
+		# Only evict the cached selects that read a table this
+		# statement can change.
+		tables = sql_write_tables(command, self.name)
+		if tables is None or tables:
+			self.clearCache(tables)
 
 		if self.link:
 			# pick the executor to use
@@ -1570,6 +1794,14 @@ class Command:
 
 		self.output = []
 
+		# Set by Command.call() so binary output is kept as rows
+		self.keepRows = False
+		self.rows     = None
+
+		# Set by the command line to the file the output goes to, for
+		# commands that stream their output with streamText()
+		self.stream = None
+
 		self.arch = os.uname()[4]
 		if self.arch in ['i386', 'i486', 'i586', 'i686']:
 			self.arch = 'i386'
@@ -1689,11 +1921,22 @@ class Command:
 		"""
 		Similar to the command method but uses the output-format=binary
 		to run a command and return a list of dictionary rows.
+
+		The sub-command runs in this process so its rows are handed
+		back directly, the marshalled form is only decoded for output
+		added as text (e.g. by a command that bypasses endOutput).
 		"""
 		# Do a copy of the args list
 		a = args[:]
 		a.append('output-format=binary')
-		s = self.command(command, a, verbose_errors)
+		o = self.runCommand(command, a, verbose_errors, rows=True)
+		if o is None:
+			return []
+
+		if o.rows is not None:
+			return o.rows
+
+		s = o.getText()
 		if s:
 			return marshal.loads(s)
 
@@ -1707,6 +1950,22 @@ class Command:
 		Import and run a Stack command. Returns and output string.
 		"""
 
+		o = self.runCommand(command, args, verbose_errors)
+		if o is None:
+			return ''
+
+		return o.getText()
+
+	def runCommand(self, command, args=[], verbose_errors = True, rows = False):
+		"""
+		Import and run a Stack command. Returns the command object, or
+		None if there is no such command.
+
+		If ROWS is True the binary output of the command is left as
+		a list of dictionaries in its rows attribute rather than being
+		marshalled into its text.
+		"""
+
 		modpath = 'stack.commands.%s' % command
 		__import__(modpath)
 		mod = eval(modpath)
@@ -1715,7 +1974,9 @@ class Command:
 			o = getattr(mod, 'Command')(self.db.database)
 			name = ' '.join(command.split('.'))
 		except AttributeError:
-			return ''
+			return None
+
+		o.keepRows = rows
 
 		# Call the command and store the return code in the
 		# class member self.rc so the caller can check
@@ -1744,7 +2005,7 @@ class Command:
 				f"Failed to run {name} {' '.join(args)}"
 			) from exception
 
-		return o.getText()
+		return o
 
 	def loadPlugins(self):
 		dict	= {}
@@ -1812,19 +2073,109 @@ class Command:
 
 		return list
 
-	def runPlugins(self, args='', plugins=None):
+	def runPlugins(self, args='', plugins=None, threads=1):
+		"""
+		Runs the PLUGINS (by default all the plugins of the command)
+		with ARGS. Returns the (provides, result) of every plugin that
+		returned a result, in the order the plugins were loaded.
+
+		With THREADS greater than one the plugins are run on a pool of
+		that many threads, each plugin as soon as the plugins it
+		requires (and the plugins that precede it) have finished.
+		Only plugins whose threadSafe() is True run at the same time,
+		any other plugin runs alone. Every plugin thread has a
+		database connection of its own. Plugins run this way must not
+		depend on anything but their requires() and precedes() for
+		ordering. If a plugin raises, no more plugins are started and
+		the exception is raised once the running plugins have finished.
+
+		The time each plugin takes is reported in debug mode.
+		"""
+
 		if not plugins:
 			plugins = self.loadPlugins()
 
-		results = []
+		if threads > 1 and len(plugins) > 1:
+			results = self._runPluginsParallel(args, plugins, threads)
+		else:
+			results = [ self._runPlugin(plugin, args) for plugin in plugins ]
+
+		return [ (plugin.provides(), retval)
+			 for plugin, retval in zip(plugins, results)
+			 if retval is not None ]
+
+	def _runPlugin(self, plugin, args):
+		Log('run %s' % plugin)
+		t0 = time.time()
+		try:
+			return plugin.run(args)
+		finally:
+			Debug('plugin %s ran in %.3fs' % (plugin.provides(), time.time() - t0))
+
+	def _runPluginThread(self, plugin, args):
+		self.db.attachThread()
+		try:
+			return self._runPlugin(plugin, args)
+		finally:
+			self.db.detachThread()
+
+	def _runPluginsParallel(self, args, plugins, threads):
+		# A plugin waits for the plugins it requires and the
+		# plugins that precede it.
+
+		provides = { plugin.provides(): plugin for plugin in plugins }
+		waiting  = OrderedDict((plugin, { provides[name] for name in plugin.requires()
+						  if name in provides }) for plugin in plugins)
 		for plugin in plugins:
-			Log('run %s' % plugin)
-			retval = plugin.run(args)
+			for name in plugin.precedes():
+				if name in provides:
+					waiting[provides[name]].add(plugin)
+
+		# A plugin that is not thread safe waits for the running
+		# plugins to finish, and nothing else starts until it has.
+
+		results = {}
+		error   = None
+		running = {}
+		alone   = None
+		with ThreadPoolExecutor(max_workers=threads) as pool:
+			while waiting or running:
+				if not error and not alone:
+					for plugin in [ p for p, deps in waiting.items() if not deps ]:
+						if not plugin.threadSafe():
+							if running:
+								continue
+							alone = plugin
+						del waiting[plugin]
+						future = pool.submit(self._runPluginThread, plugin, args)
+						running[future] = plugin
+						if alone:
+							break
 
-			if retval is not None:
-				results.append((plugin.provides(), retval))
+				if not running:
+					if waiting and not error:
+						raise CommandError(self, 'plugin dependency loop in %s' %
+								   ', '.join(p.provides() for p in waiting))
+					break
+
+				done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+				for future in done:
+					plugin = running.pop(future)
+					if plugin is alone:
+						alone = None
+					try:
+						results[plugin] = future.result()
+					except BaseException as e:
+						if not error:
+							error = e
+						continue
+					for deps in waiting.values():
+						deps.discard(plugin)
+
+		if error:
+			raise error
 
-		return results
+		return [ results.get(plugin) for plugin in plugins ]
 
 	def loadImplementation(self, name=None):
 		dir = eval('%s.__path__[0]' % self.__module__)
@@ -2013,6 +2364,18 @@ class Command:
 			else:
 				self.bytes.append(s)
 
+	def streamText(self, s):
+		"""
+		Writes a string to the output stream, or appends it to the
+		output text buffer if the command has no stream (it was not run
+		from the command line).
+		"""
+
+		if self.stream:
+			self.stream.write(s)
+		else:
+			self.addText(s)
+
 	def getText(self):
 		"""
 		Returns the output text buffer.
@@ -2069,6 +2432,36 @@ class Command:
 
 		self.output.append(out)
 
+	def outputRows(self, header):
+		"""
+		Returns the output list buffer as a list of dictionaries keyed
+		by the HEADER names. Columns with an empty header are dropped
+		and the values of repeated header names are collected into a
+		list.
+		"""
+
+		keys = [key for key in header if key]
+		if len(keys) == len(header) and len(dict.fromkeys(keys)) == len(keys):
+			return [dict(zip(header, line)) for line in self.output]
+
+		rows = []
+		for line in self.output:
+			row = {}
+			for i in range(0, len(header)):
+				if header[i]:
+					key = header[i]
+					val = line[i]
+
+					if key in row:
+						if type(row[key]) != type([]):
+							row[key] = [row[key]]
+						row[key].append(val)
+					else:
+						row[key] = val
+			rows.append(row)
+
+		return rows
+
 	def endOutput(self, header=[], padChar='-', trimOwner=False, trimHeader=False):
 		"""
 		Pretty prints the output list buffer.
@@ -2112,21 +2505,7 @@ class Command:
 				for i in range(0, rows):
 					header.append('col-%d' % i)
 
-			list = []
-			for line in self.output:
-				dict = {}
-				for i in range(0, len(header)):
-					if header[i]:
-						key = header[i]
-						val = line[i]
-
-						if key in dict:
-							if not isinstance(dict[key], list):
-								dict[key] = [dict[key]]
-							dict[key].append(val)
-						else:
-							dict[key] = val
-				list.append(dict)
+			list = self.outputRows(header)
 
 			if format == 'col':
 				for row in list:
@@ -2149,7 +2528,10 @@ class Command:
 			elif format == 'python':
 				self.addText('%s' % list)
 			elif format == 'binary':
-				self.addText(marshal.dumps(list))
+				if self.keepRows:
+					self.rows = list
+				else:
+					self.addText(marshal.dumps(list))
 			else:
 				self.addText(json.dumps(list, indent=8))
 			return
@@ -2463,6 +2845,11 @@ class Command:
 
 				rc = self.run(self._params, self._args)
 
+				if self.level == 0 and self.db.link:
+					Debug('select cache %s' % ', '.join(
+						'%s=%d' % item for item in self.db.cacheStats().items()
+					))
+
 				# if a command does not explicitly return
 				# assume it succeeded, otherwise use the
 				# actual return code.
@@ -2565,6 +2952,17 @@ class Plugin(Module):
 
 		return []
 
+	def threadSafe(self):
+		"""
+		Returns True if the Plugin can run at the same time as other
+		plug-ins of the command (see runPlugins). Plug-ins that
+		change state shared with the other plug-ins, such as the
+		owner command or sys.stdout, must not. By default a Plugin
+		is run alone.
+		"""
+
+		return False
+
 
 class PluginOrderIterator(stack.graph.GraphIterator):
 	"""
@@ -5,12 +5,16 @@
 # @copyright@
 
 from collections import OrderedDict
+from collections import defaultdict
 from stack.exception import ArgNotAllowed
 import stack.commands
+import signal
 import json
 
 
-class command(stack.commands.Command):
+class command(stack.commands.Command,
+	      stack.commands.OSArgumentProcessor,
+	      stack.commands.EnvironmentArgumentProcessor):
 
 
 	def get_scope(self):
@@ -22,6 +26,40 @@ class command(stack.commands.Command):
 		
 	def set_scope(self, scope):
 		self.__dump_scope = scope
+		self.end_scope()
+
+
+	def end_scope(self):
+		"""
+		Drops the rows get_rows() kept for the objects of the scope,
+		once they are all dumped.
+		"""
+
+		self.__dump_rows = {}
+
+
+	def get_rows(self, section, name, fetch):
+		"""
+		Returns the SECTION rows of the object NAME of the current
+		scope. The first time, FETCH() lists the rows of every object
+		in the scope with one command, and they are kept by object
+		name for the others. The rows of an object are only handed
+		out once, and are not kept after that.
+		"""
+
+		scope = self.get_scope()
+		try:
+			rows = self.__dump_rows
+		except AttributeError:
+			rows = self.__dump_rows = {}
+
+		key = (section, scope)
+		if key not in rows:
+			rows[key] = {}
+			for row in fetch():
+				rows[key].setdefault(row[scope], []).append(row)
+
+		return rows[key].pop(name, [])
 
 
 	def dump_access(self):
@@ -36,15 +74,16 @@ class command(stack.commands.Command):
 		dump  = []
 		scope = self.get_scope()
 
+		fetch = lambda: self.call('list.attr', [f'scope={scope}',
+							 'shadow=false',
+							 'resolve=false',
+							 'const=false'])
 		if scope == 'global':
-			arg = []
+			data = fetch()
 		else:
-			arg = [name]
-			
-		for row in self.call('list.attr', [f'scope={scope}',
-						   'shadow=false',
-						   'resolve=false',
-						   'const=false'] + arg):
+			data = self.get_rows('attr', name, fetch)
+
+		for row in data:
 			if row['type'] == 'var':
 				dump.append(OrderedDict(name  = row['attr'],
 							value = row['value']))
@@ -59,9 +98,7 @@ class command(stack.commands.Command):
 		dump  = []
 		scope = self.get_scope()
 
-		arg = [name]
 		if scope == 'global':
-			arg    = []
 			source = 'G'
 		elif scope == 'environment':
 			source = 'E'
@@ -74,7 +111,13 @@ class command(stack.commands.Command):
 		else:
 			assert(False) # barf
 			
-		for row in self.call('list.firewall', [f'scope={scope}'] + arg):
+		fetch = lambda: self.call('list.firewall', [f'scope={scope}'])
+		if scope == 'global':
+			data = fetch()
+		else:
+			data = self.get_rows('firewall', name, fetch)
+
+		for row in data:
 			if row['type'] != 'var' or row['source'] != source:
 				continue
 			dump.append(OrderedDict(
@@ -97,7 +140,8 @@ class command(stack.commands.Command):
 		if scope == 'global':
 			data = self.call('list.route')
 		else:
-			data = self.call(f'list.{scope}.route', [name])
+			data = self.get_rows('route', name,
+					     lambda: self.call(f'list.{scope}.route'))
 
 		if scope == 'host':
 			check_source = lambda row: row['source'] == 'H'
@@ -123,7 +167,8 @@ class command(stack.commands.Command):
 		if scope == 'global':
 			data = self.call('list.storage.controller')
 		else:
-			data = self.call(f'list.{scope}.storage.controller', [name])
+			data = self.get_rows('controller', name,
+					     lambda: self.call(f'list.{scope}.storage.controller'))
 
 		for row in data:
 			dump.append(OrderedDict(
@@ -143,7 +188,8 @@ class command(stack.commands.Command):
 		if scope == 'global':
 			data = self.call('list.storage.partition')
 		else:
-			data = self.call(f'list.{scope}.storage.partition', [name])
+			data = self.get_rows('partition', name,
+					     lambda: self.call(f'list.{scope}.storage.partition'))
 
 		for row in data:
 			dump.append(OrderedDict(
@@ -156,6 +202,156 @@ class command(stack.commands.Command):
 		return dump
 
 
+	def dump_host(self, args=[]):
+		"""
+		Yields the host section of the dump, a host at a time.
+		"""
+
+		groups = defaultdict(list)
+		for row in self.call('list.host.group'):
+			if row['groups'] is not None:
+				groups[row['host']] = row['groups'].split()
+
+		aliases = defaultdict(lambda: defaultdict(list))
+		for row in self.call('list.host.interface.alias'):
+			aliases[row['host']][row['interface']].append(row['alias'])
+
+		interfaces = defaultdict(list)
+		for row in self.call('list.host.interface'):
+			host      = row['host']
+			interface = row['interface']
+			interfaces[host].append(OrderedDict(
+				interface = interface,
+				default   = row['default'],
+				network   = row['network'],
+				mac       = row['mac'],
+				ip        = row['ip'],
+				name      = row['name'],
+				module    = row['module'],
+				vlan      = row['vlan'],
+				options   = row['options'],
+				channel   = row['channel'],
+				alias     = aliases[host][interface]))
+
+		metadata = self.getHostAttrDict(args, 'metadata')
+
+		self.set_scope('host')
+
+		for row in self.call('list.host', args):
+			name = row['host']
+
+			yield OrderedDict(
+				name          = name,
+				rack          = row['rack'],
+				rank          = row['rank'],
+				appliance     = row['appliance'],
+				box           = row['box'],
+				environment   = row['environment'],
+				osaction      = row['osaction'],
+				installaction = row['installaction'],
+				comment       = row['comment'],
+				metadata      = metadata.get(name, {}).get('metadata'),
+				group         = groups[name],
+				interface     = interfaces[name],
+				attr          = self.dump_attr(name),
+				controller    = self.dump_controller(name),
+				partition     = self.dump_partition(name),
+				firewall      = self.dump_firewall(name),
+				route         = self.dump_route(name))
+
+		self.end_scope()
+
+
+	def dump_appliance(self, args=[]):
+		"""
+		Yields the appliance section of the dump, an appliance at a
+		time.
+		"""
+
+		self.set_scope('appliance')
+
+		for row in self.call('list.appliance', args):
+			name = row['appliance']
+
+			yield OrderedDict(
+				name       = name,
+				public     = self.str2bool(row['public']),
+				attr       = self.dump_attr(name),
+				controller = self.dump_controller(name),
+				partition  = self.dump_partition(name),
+				firewall   = self.dump_firewall(name),
+				route      = self.dump_route(name))
+
+		self.end_scope()
+
+
+	def dump_os(self):
+		"""
+		Yields the os section of the dump, an OS at a time.
+		"""
+
+		self.set_scope('os')
+
+		for name in self.getOSNames():
+			yield OrderedDict(
+				name          = name,
+				attr          = self.dump_attr(name),
+				controller    = self.dump_controller(name),
+				partition     = self.dump_partition(name),
+				firewall      = self.dump_firewall(name),
+				route         = self.dump_route(name))
+
+		self.end_scope()
+
+
+	def dump_environment(self):
+		"""
+		Yields the environment section of the dump, an environment at
+		a time.
+		"""
+
+		self.set_scope('environment')
+
+		for name in self.getEnvironmentNames():
+			yield OrderedDict(
+				name          = name,
+				attr          = self.dump_attr(name),
+				controller    = self.dump_controller(name),
+				partition     = self.dump_partition(name),
+				firewall      = self.dump_firewall(name),
+				route         = self.dump_route(name))
+
+		self.end_scope()
+
+
+	def write_json(self, sections):
+		"""
+		Writes the (name, value) SECTIONS as a JSON object, formatted
+		the same as json.dumps(indent=8). A value that is an iterator
+		is written as a list, an item at a time, so it never has to be
+		held in memory.
+		"""
+
+		indent = ' ' * 8
+		sep    = '{\n'
+		for name, value in sections:
+			self.streamText(f'{sep}{indent}{json.dumps(name)}: ')
+			sep = ',\n'
+
+			if not hasattr(value, '__next__'):
+				text = json.dumps(value, indent=8)
+				self.streamText(text.replace('\n', '\n' + indent))
+				continue
+
+			prefix = '[\n'
+			for item in value:
+				text = indent * 2 + json.dumps(item, indent=8)
+				self.streamText(prefix + text.replace('\n', '\n' + indent * 2))
+				prefix = ',\n'
+			self.streamText('[]' if prefix == '[\n' else f'\n{indent}]')
+
+		self.streamText('{}\n' if sep == '{\n' else '\n}\n')
+
 
 
 
@@ -171,25 +367,51 @@ class Command(command):
 
 	<related>load</related>
 	"""
+	def sections(self):
+		"""
+		Yields the (name, value) sections of the dump in order,
+		reading each as the previous one is written.
+		"""
+
+		self.set_scope('global')
+
+		yield 'version',    stack.version
+		yield 'access',     self.dump_access()
+		yield 'attr',       self.dump_attr()
+		yield 'controller', self.dump_controller()
+		yield 'partition',  self.dump_partition()
+		yield 'firewall',   self.dump_firewall()
+		yield 'route',      self.dump_route()
+
+		# Plugins return their sections, or the JSON document of
+		# a dump sub-command.
+
+		seen = { 'version' }
+		for plugin in self.loadPlugins():
+			result = plugin.run(None)
+			if isinstance(result, str):
+				result = json.loads(result, object_pairs_hook=OrderedDict)
+			for name, value in result.items():
+				if name not in seen:
+					seen.add(name)
+					yield name, value
+
+
 	def run(self, params, args):
 
 		if len(args):
 			raise ArgNotAllowed(self, args[0])
 
-		dump = {}
-		
-		self.set_scope('global')
-
-		dump = OrderedDict(version    = stack.version,
-				   access     = self.dump_access(),
-				   attr       = self.dump_attr(),
-				   controller = self.dump_controller(),
-				   partition  = self.dump_partition(),
-				   firewall   = self.dump_firewall(),
-				   route      = self.dump_route())
+		if self.stream:
+			# Same as the command line does before it prints
+			signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
+		# Everything is read in one transaction so the dump is of a
+		# single point in time, even if the database is changed
+		# while it is being written.
 
-		for (_, doc) in self.runPlugins():
-			dump.update(json.loads(doc))
-		
-		self.addText(json.dumps(dump, indent=8))
+		self.db.execute('start transaction with consistent snapshot, read only')
+		try:
+			self.write_json(self.sections())
+		finally:
+			self.db.execute('commit')
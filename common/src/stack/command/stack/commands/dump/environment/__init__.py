@@ -29,17 +29,5 @@ class Command(stack.commands.dump.command,
 
 	def run(self, params, args):
 
-		self.set_scope('environment')
-
-		dump = []
-		for name in self.getEnvironmentNames():
-			dump.append(OrderedDict(
-				name          = name,
-				attr          = self.dump_attr(name),
-				controller    = self.dump_controller(name),
-				partition     = self.dump_partition(name),
-				firewall      = self.dump_firewall(name),
-				route         = self.dump_route(name)))
-
 		self.addText(json.dumps(OrderedDict(version     = stack.version,
-						    environment = dump), indent=8))
+						    environment = [ *self.dump_environment() ]), indent=8))
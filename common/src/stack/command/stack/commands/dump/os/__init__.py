@@ -29,17 +29,5 @@ class Command(stack.commands.dump.command,
 
 	def run(self, params, args):
 
-		self.set_scope('os')
-
-		dump = []
-		for name in self.getOSNames():
-			dump.append(OrderedDict(
-				name          = name,
-				attr          = self.dump_attr(name),
-				controller    = self.dump_controller(name),
-				partition     = self.dump_partition(name),
-				firewall      = self.dump_firewall(name),
-				route         = self.dump_route(name)))
-
-		self.addText(json.dumps(OrderedDict(version  = stack.version,
-						    os       = dump), indent=8))
+		self.addText(json.dumps(OrderedDict(version = stack.version,
+						    os      = [ *self.dump_os() ]), indent=8))
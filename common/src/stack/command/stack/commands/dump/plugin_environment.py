@@ -13,4 +13,4 @@ class Plugin(stack.commands.Plugin):
 		return 'environment'
 
 	def run(self, args):
-		return self.owner.command('dump.environment')
+		return { 'environment': self.owner.dump_environment() }
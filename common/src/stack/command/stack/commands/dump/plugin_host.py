@@ -12,5 +12,5 @@ class Plugin(stack.commands.Plugin):
 		return 'host'
 
 	def run(self, args):
-		return self.owner.command('dump.host')
+		return { 'host': self.owner.dump_host() }
 
@@ -6,10 +6,17 @@
 # @copyright@
 #
 
+import io
 import os
+import sys
+import json
 import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import stack.commands
 from stack.argument_processors.box import BoxArgumentProcessor
+from stack.commands.list.host.profile import profile_hash
+from stack.exception import CommandError
 
 class Command(stack.commands.list.host.command,
 	BoxArgumentProcessor):
@@ -34,7 +41,69 @@ class Command(stack.commands.list.host.command,
 	</example>
 	"""
 
+	# Directory hashes kept between runs, see directoryhash()
+	CACHE = '/var/cache/stack/hash/directories.json'
+
+	# Number of profiles hashed at once
+	ProfileThreads = 8
+
+	def directoryfingerprint(self, path):
+		"""
+		Returns a hash of the modification times of the directories under
+		PATH. The pallets and carts are replaced rather than edited,
+		so a changed file changes the mtime of a directory.
+		"""
+
+		m = hashlib.md5()
+		for dirpath, dirnames, filenames in os.walk(path):
+			try:
+				m.update(('%s %d\n' % (dirpath, os.stat(dirpath).st_mtime_ns)).encode())
+			except OSError:
+				pass
+		return m.hexdigest()
+
+	def readCache(self):
+		try:
+			with open(self.CACHE) as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return {}
+
+	def writeCache(self, cache):
+		try:
+			os.makedirs(os.path.dirname(self.CACHE), exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.CACHE))
+			with os.fdopen(fd, 'w') as f:
+				json.dump(cache, f)
+			os.rename(tmp, self.CACHE)
+		except OSError:
+			# Not root, the hashes are not kept
+			pass
+
 	def directoryhash(self, path):
+		"""
+		Returns the hash of the names, sizes and modification times
+		of the files under PATH. Each directory is hashed once per
+		run, and the hash is kept until the modification time of a
+		directory under PATH changes.
+		"""
+
+		if path in self.dirhashes:
+			return self.dirhashes[path]
+
+		fingerprint = self.directoryfingerprint(path)
+		cached = self.dircache.get(path)
+		if cached and cached[0] == fingerprint:
+			dirhash = cached[1]
+		else:
+			dirhash = self.walkhash(path)
+			self.dircache[path] = (fingerprint, dirhash)
+			self.dircache_changed = True
+
+		self.dirhashes[path] = dirhash
+		return dirhash
+
+	def walkhash(self, path):
 		m = hashlib.md5()
 
 		for dirpath, dirnames, filenames in os.walk(path):
@@ -51,56 +120,93 @@ class Command(stack.commands.list.host.command,
 		return m.hexdigest()
 
 
+	def boxhashes(self, box):
+		"""
+		Returns the hash lines of the pallets and carts of BOX.
+		"""
+
+		hashes = []
+
+		#
+		# calculate MD5s for the pallets associated with the box
+		#
+		for pallet in self.get_box_pallets(box):
+			path = '/export/stack/pallets/%s/%s/%s/%s/%s' % \
+				(pallet.name, pallet.version, pallet.rel, pallet.os, pallet.arch)
+
+			dirhash = self.directoryhash(path)
+			hashes.append('%s  %s' % (dirhash, pallet.name))
+
+		#
+		# calculate MD5s for the carts associated with the box
+		#
+		contents = self.call('list.box', [ box ])
+		if len(contents) > 0:
+			for name in contents[0]['carts'].split():
+				path = '/export/stack/carts/%s' % name
+				dirhash = self.directoryhash(path)
+				hashes.append('%s  %s' % (dirhash, name))
+
+		return hashes
+
+	def profilehash(self, host):
+		"""
+		Returns the hash line of the profile of HOST, generated in
+		this process with a database connection of the thread's own.
+		"""
+
+		self.db.attachThread()
+		try:
+			text = self.command('list.host.profile', [ host ])
+		except CommandError as e:
+			return '%s' % e
+		finally:
+			self.db.detachThread()
+
+		return '%s  profile' % profile_hash(text)
+
 	def run(self, params, args):
 
 		(profile, ) = self.fillParams([
 			('profile', 'n') ])
 
-		self.beginOutput()
+		self.dirhashes = {}
+		self.dircache = self.readCache()
+		self.dircache_changed = False
 
 		hosts = self.getHostnames(args)
-		for host in hosts:
-			#
-			# calculate MD5s for the pallets associated with the host
-			#
-			box = self.getHostAttr(host, 'box')
-			for pallet in self.get_box_pallets(box):
-				path = '/export/stack/pallets/%s/%s/%s/%s/%s' % \
-					(pallet.name, pallet.version, pallet.rel, pallet.os, pallet.arch)
 
-				dirhash = self.directoryhash(path)
-				self.addOutput(host, '%s  %s' % (dirhash, pallet.name))
-
-			#
-			# calculate MD5s for the carts associated with the host
-			#
-			contents = self.call('list.box', [ box ])
-			if len(contents) > 0:
-				for name in contents[0]['carts'].split():
-					path = '/export/stack/carts/%s' % name
-					dirhash = self.directoryhash(path)
-					self.addOutput(host, '%s  %s' % (dirhash, name))
-
-			if self.str2bool(profile):
-				import subprocess
-
-				p = subprocess.Popen(
-					'/opt/stack/bin/stack list host profile hash=y %s' % host,
-					stdin=subprocess.PIPE,
-					stdout=subprocess.PIPE,
-					stderr=subprocess.PIPE, shell=True)
-
-				(o, e) = p.communicate()
-				line = e.decode()
-
-				#
-				# strip off the last carriage return
-				#
-				if line[-1] == '\n':
-					hashline = line[:-1]
-				else:
-					hashline = line
-
-				self.addOutput(host, '%s' % hashline)
+		boxes = {}
+		for row in self.call('list.host', hosts):
+			boxes[row['host']] = row['box']
+
+		#
+		# Hosts in the same box have the same pallets and carts
+		#
+		boxhashes = {}
+		for box in set(boxes.values()):
+			boxhashes[box] = self.boxhashes(box)
+
+		if self.dircache_changed:
+			self.writeCache(self.dircache)
+
+		profiles = {}
+		if self.str2bool(profile):
+			# The profile command reads XML from stdin when it is
+			# not a TTY, give it nothing to read, like a
+			# subprocess would have.
+			stdin = sys.stdin
+			sys.stdin = io.StringIO()
+			try:
+				with ThreadPoolExecutor(self.ProfileThreads) as pool:
+					profiles = dict(zip(hosts, pool.map(self.profilehash, hosts)))
+			finally:
+				sys.stdin = stdin
 
+		self.beginOutput()
+		for host in hosts:
+			for hashline in boxhashes[boxes[host]]:
+				self.addOutput(host, hashline)
+			if host in profiles:
+				self.addOutput(host, profiles[host])
 		self.endOutput(padChar='', trimOwner=True)
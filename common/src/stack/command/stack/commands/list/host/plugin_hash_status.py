@@ -31,29 +31,42 @@ class Plugin(stack.commands.Plugin):
 		for name, id in self.db.select('name, id from nodes'):
 			ids[name] = id
 
-		for host in hosts:
-			try:
-				r = redis.StrictRedis(host=Redis.server)
-				status = r.get('host:%d:installhash' % ids[host])
-			except:
-				status = None
-
+		#
+		# fetch all the install hashes in one round trip
+		#
+		try:
+			r = redis.StrictRedis(host=Redis.server)
+			p = r.pipeline(transaction=False)
+			p.mget([ 'host:%d:installhash' % ids[host] for host in hosts ])
+			(installhashes, ) = p.execute()
+		except:
+			installhashes = [ None ] * len(hosts)
+
+		onhost = {}
+		for host, status in zip(hosts, installhashes):
 			if status:
 				hashinfo = status.decode()
-				onhost = json.loads(hashinfo.replace("'", '"'))
-
-				computed = []
+				onhost[host] = json.loads(hashinfo.replace("'", '"'))
+
+		#
+		# compute the hashes of all those hosts in one call, so the
+		# pallets and carts shared by the hosts are hashed once
+		#
+		computed = {}
+		if onhost:
+			hashed = [ host for host in hosts if host in onhost ]
+			for row in self.owner.call('list.host.hash', hashed + [ 'profile=y' ]):
+				line = row['col-1'].split()
+				if len(line) == 2:
+					hashline = {}
+					hashline['name'] = line[1]
+					hashline['hash'] = line[0]
+					computed.setdefault(row['col-0'], []).append(hashline)
 
-				output = self.owner.command('list.host.hash', [ host, 'profile=y' ])
-				for o in output.split('\n'):
-					line = o.split()
-					if len(line) == 2:
-						hashline = {}
-						hashline['name'] = line[1]
-						hashline['hash'] = line[0]
-						computed.append(hashline)
-
-				if computed == onhost:
+		for host in hosts:
+			status = None
+			if host in onhost:
+				if computed.get(host, []) == onhost[host]:
 					status = 'synced'
 				else:
 					status = 'notsynced'
@@ -11,6 +11,7 @@
 # @rocks@
 
 import sys
+import hashlib
 from xml.etree import ElementTree
 
 import stack.commands
@@ -18,6 +19,25 @@ import stack.gen
 from stack.exception import CommandError, ArgUnique
 
 
+def profile_hash(text):
+	"""
+	Returns the MD5 of the profile TEXT, less the lines with attributes
+	we know will change after the host installs.
+	"""
+
+	m = hashlib.md5()
+
+	skip = [ 'nukedisks', 'nukecontroller' ]
+	for line in text.split('\n'):
+		if any(s in line for s in skip):
+			continue
+
+		l = line + '\n'
+		m.update(l.encode())
+
+	return m.hexdigest()
+
+
 class implementation(stack.commands.Implementation):
 	def generator(self):
 		raise NotImplementedError
@@ -142,20 +162,4 @@ class Command(stack.commands.list.host.command):
 		self.endOutput(padChar='')
 
 		if self.str2bool(hashit):
-			import hashlib
-
-			#
-			# remove lines that contain attributes which we know will change after
-			# the host installs
-			#
-			m = hashlib.md5()
-
-			skip = [ 'nukedisks', 'nukecontroller' ]
-			for line in self.getText().split('\n'):
-				if any(s in line for s in skip):
-					continue
-
-				l = line + '\n'
-				m.update(l.encode())
-
-			sys.stderr.write('%s  profile\n' % m.hexdigest())
+			sys.stderr.write('%s  profile\n' % profile_hash(self.getText()))
@@ -0,0 +1,59 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import time
+import stack.commands
+import stack.profile
+
+
+class Command(stack.commands.list.host.command):
+	"""
+	List the cached host profiles, with the number of times each was
+	reused (hits) or had to be generated (misses).
+
+	The profile of a host is cached by 'list host xml' and reused
+	until the host's attributes, the database tables read by the
+	profile, or the graph and node files of its box change.
+
+	<arg optional='1' type='string' name='host' repeat='1'>
+	Zero, one or more host names. If no host names are supplied,
+	the profiles of all hosts are listed.
+	</arg>
+
+	<example cmd='list host profile cache'>
+	List the cached profiles of all hosts.
+	</example>
+
+	<related>sync host profile cache</related>
+	<related>remove host profile cache</related>
+	"""
+
+	def run(self, params, args):
+		cache	= stack.profile.ProfileCache()
+		stats	= cache.getStats()
+		entries = { entry['host']: entry for entry in cache.getEntries() }
+
+		self.beginOutput()
+		for host in self.getHostnames(args):
+			hits, misses = stats.get(host, [ 0, 0 ])
+			entry = entries.get(host)
+			if entry:
+				cached = time.strftime('%Y-%m-%d %H:%M:%S',
+						       time.localtime(entry['time']))
+				size   = len(entry['profile'])
+			else:
+				cached = None
+				size   = None
+
+			if hits + misses:
+				rate = '%d%%' % (100 * hits / (hits + misses))
+			else:
+				rate = None
+
+			self.addOutput(host, (cached, size, hits, misses, rate))
+
+		self.endOutput(header=['host', 'cached', 'size', 'hits', 'misses', 'hit-rate'],
+			       trimOwner=False)
@@ -22,6 +22,10 @@ class Command(command):
 	all the known hosts is listed.
 	</arg>
 	"""
+
+	# Number of keys read by each MGET
+	MGetSize = 1000
+
 	def run(self, params, args):
 
 		import redis # not part of the installer but command line is
@@ -38,15 +42,32 @@ class Command(command):
 		for (_, names) in self.runPlugins():
 			components.extend(names)
 
+		hosts = self.getHostnames(args)
+
+		#
+		# Read the status of every host in a few MGETs rather than
+		# one GET per host per component.
+		#
+		keys = []
+		for host in hosts:
+			for component in components:
+				keys.append('host:%d:status:%s' % (ids[host], component))
+
+		values = []
+		try:
+			p = r.pipeline(transaction=False)
+			for i in range(0, len(keys), self.MGetSize):
+				p.mget(keys[i:i + self.MGetSize])
+			for chunk in p.execute():
+				values.extend(chunk)
+		except redis.exceptions.ConnectionError:
+			values = [ None ] * len(keys)
+
 		self.beginOutput()
 
-		for host in self.getHostnames(args):
+		for i, host in enumerate(hosts):
 			status = []
-			for component in components:
-				try:
-					v = r.get('host:%d:status:%s' % (ids[host], component))
-				except redis.exceptions.ConnectionError:
-					v = None
+			for v in values[i * len(components):(i + 1) * len(components)]:
 				if v is not None:
 					v = v.decode()
 				status.append(v)
@@ -55,4 +76,3 @@ class Command(command):
 		header = [ 'host' ]
 		header.extend(components)
 		self.endOutput(header=header, trimOwner=False)
-
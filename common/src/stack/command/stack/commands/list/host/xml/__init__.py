@@ -10,30 +10,67 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE-ROCKS.txt
 # @rocks@
 
+import os
+import stack
+import stack.profile
+import stack.evaluate
 import stack.commands
 from stack.exception import ArgUnique
+from stack.argument_processors.box import BoxArgumentProcessor
 
 
-class Command(stack.commands.list.host.command):
+class Command(stack.commands.list.host.command,
+	      BoxArgumentProcessor):
 	"""
 	Lists the monolithic XML configuration file for a host.
 	Tis is the same XML configuration file that is sent back to a 
 	host when a host begins its installation procedure.
 
+	The XML is cached, and reused until anything it was generated
+	from changes, see 'list host profile cache'.
+
 	<arg optional='1' type='string' name='host'>
 	Hostname for requested XML document.
 	</arg>
 
+	<param type='bool' name='cache'>
+	If set to 'no', then always generate the XML and leave the cache
+	alone. Default is 'yes'.
+	</param>
+
 	<example cmd='list host xml backend-0-0'>
 	List the XML configuration file for backend-0-0.
 	</example>
 	"""
 
+	def getFingerprint(self, profiles, host, attrs):
+		"""
+		Returns the fingerprint of what the profile of HOST is
+		generated from, or None if it cannot be known.
+		"""
+
+		try:
+			directories = self.get_box_directories(attrs['box'])
+		except Exception:
+			return None
+
+		self.db.execute('checksum table %s' % ', '.join(profiles.TABLES))
+		tables = self.db.fetchall()
+		if not tables:
+			return None
+
+		salt = os.path.join(os.sep, 'export', 'stack', 'salt', 'compiled',
+				    host, 'kickstart.xml')
+
+		return profiles.fingerprint(dict(attrs, version=stack.version, release=stack.release),
+					    tables, directories, [ salt ])
+
 	def run(self, params, args):
 
-		(pallet, debug ) = self.fillParams([
+		(pallet, debug, cache) = self.fillParams([
 			('pallet', ),
-			('debug', 'false')
+			('debug', 'false'),
+			('cache', 'true')
 		])
 
 		debug = self.str2bool(debug)
@@ -53,11 +90,30 @@ class Command(stack.commands.list.host.command):
 		for row in self.call('list.host.attr', [ host ]):
 			attrs[row['attr']] = row['value']
 
-		args = [ attrs['node'] ]
-		args.append('attrs=%s' % attrs)
-		if pallet:
-			args.append('pallet=%s' % pallet)
-		xml = self.command('list.node.xml', args)
+		profiles    = None
+		fingerprint = None
+		xml	    = None
+		if self.str2bool(cache) and not pallet and not debug:
+			profiles    = stack.profile.ProfileCache()
+			fingerprint = self.getFingerprint(profiles, host, attrs)
+			if fingerprint:
+				xml = profiles.get(host, fingerprint)
+
+		if xml is None:
+			args = [ attrs['node'] ]
+			args.append('attrs=%s' % attrs)
+			if pallet:
+				args.append('pallet=%s' % pallet)
+
+			uncached = stack.evaluate.executor.uncached
+			xml = self.command('list.node.xml', args)
+
+			# Profiles with sections that must always be run
+			# are not cached.
+
+			if fingerprint and stack.evaluate.executor.uncached == uncached:
+				profiles.put(host, fingerprint, xml)
+
 		if not debug:
 			for line in xml.split('\n'):
 				self.addOutput(host, line)
@@ -0,0 +1,43 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+import stack.profile
+
+
+class Command(stack.commands.list.command):
+	"""
+	List the compiled graphs used by 'list node xml'.
+
+	The graph directory of each pallet and cart is compiled the first
+	time it is used and reused until any of its graph files change.
+	Graph files that use attributes are parsed for every host and are
+	listed as dynamic.
+
+	<example cmd='list node graph'>
+	List all the compiled graphs.
+	</example>
+
+	<related>remove node graph</related>
+	"""
+
+	def run(self, params, args):
+		cache = stack.profile.GraphCache()
+
+		self.beginOutput()
+		for compiled in cache.getCompiled():
+			files   = compiled['files']
+			dynamic = [ file for file, records in files if records is None ]
+			edges   = sum(len(records) for file, records in files if records)
+
+			self.addOutput(compiled['directory'], (
+				len(files),
+				' '.join(dynamic),
+				edges,
+				cache.isCurrent(compiled),
+			))
+		self.endOutput(header=['directory', 'files', 'dynamic', 'edges', 'current'],
+			       trimOwner=False)
@@ -13,12 +13,13 @@
 
 import ast
 import os
+import sys
 import subprocess
 import stack
 import stack.profile
+import stack.evaluate
 import stack.commands
 from stack.exception import ArgRequired, CommandError
-from xml.sax import make_parser
 from xml.sax import saxutils
 from stack.argument_processors.box import BoxArgumentProcessor
 
@@ -57,13 +58,23 @@ class Command(stack.commands.list.command,
 	2nd pass generator. If not supplied, then use 'kgen'.
 	</param>
 
+	<param type='bool' name='compiled'>
+	If set to 'no', then parse the graph files instead of using the
+	compiled graph. If not supplied, then use the compiled graph.
+	</param>
+
+	<param type='bool' name='timing'>
+	If set, print the time spent in each eval and report section
+	to stderr, slowest first. Default is 'no'.
+	</param>
+
 	<example cmd='list node xml backend'>
 	Generate the XML graph starting at the XML node named 'backend.xml'.
 	</example>
 	"""
 
 	def run(self, params, args):
-		(attributes, pallets, evalp, missing, generator, basedir) = \
+		(attributes, pallets, evalp, missing, generator, basedir, compiled, timing) = \
 			self.fillParams([
 				('attrs', ),
 				('pallet', ),
@@ -71,6 +82,8 @@ class Command(stack.commands.list.command,
 				('missing-check', 'no'),
 				('gen', 'kgen'),
 				('basedir', None),
+				('compiled', 'yes'),
+				('timing', 'no'),
 				])
 
 		if pallets:
@@ -140,6 +153,10 @@ class Command(stack.commands.list.command,
 		doEval = self.str2bool(evalp)
 		allowMissing = self.str2bool(missing)
 
+		# Eval and report output is only reused within one profile,
+		# the database may have changed since the last one.
+		stack.evaluate.executor.clear()
+
 		# yes, this was already imported above.  Take it out and it crashes looking up .version.
 		# First added in commit 38623be.  No one knows why it's needed.
 		import stack
@@ -214,29 +231,18 @@ class Command(stack.commands.list.command,
 
 		handler = stack.profile.GraphHandler(attrs, directories=items)
 
+		# The graph files are compiled once and replayed for every
+		# host until they change, see 'stack list node graph'.
+
+		cache = None
+		if self.str2bool(compiled):
+			cache = stack.profile.GraphCache()
+
 		for item in items:
 			graph = os.path.join(item, 'graph')
 			if not os.path.exists(graph):
 				continue
-
-			for file in os.listdir(graph):
-				base, ext = os.path.splitext(file)
-				if ext == '.xml':
-					parser = make_parser(["stack.expatreader"])
-					parser.setContentHandler(handler)
-					parser.feed(handler.getXMLHeader())
-					linenumber = 0
-
-					with open(os.path.join(graph, file), 'r') as xml:
-						for line in xml.readlines():
-							linenumber = linenumber + 1
-							if line.find('<?xml') != -1:
-								continue
-							try:
-								parser.feed(line)
-							except Exception as e:
-								print('XML parse error in graph file - %s in file %s on line %d\n' % (e.args[-1], xml.name, linenumber))
-								raise
+			handler.parseGraph(graph, cache)
 
 
 		graph = handler.getMainGraph()
@@ -348,5 +354,12 @@ class Command(stack.commands.list.command,
 
 		self.addText('</stack:profile>\n')
 
+		if self.str2bool(timing):
+			sys.stderr.write('   total      max runs hits  file  section\n')
+			for filename, label, t in stack.evaluate.executor.getTimings():
+				sys.stderr.write('%8.3fs %8.3fs %4d %4d  %s  %s\n' % (
+					t['total'], t['max'], t['count'], t['cached'],
+					filename, label))
+
 
 
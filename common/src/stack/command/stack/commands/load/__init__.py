@@ -17,12 +17,15 @@ import stack.commands
 from stack.bool import str2bool
 import re
 import shlex
-from contextlib import suppress
+import time
+from contextlib import suppress, contextmanager
 
 
 class command(stack.commands.Command):
 	MustBeRoot = 0
 
+	bulk = False
+
 	def _load(self, text):
 		parser = JsonComment(json) # standard JSON is stupid
 		try:
@@ -141,7 +144,171 @@ class command(stack.commands.Command):
 				'shadow': attr.get('shadow'),
 			}
 
-			self.stack(cmd, target, **params)
+			# Globs (removing attrs) are left to set attr.
+			name = str(params['attr'])
+			if self.bulk and re.match('^[a-zA-Z_][a-zA-Z0-9_.]*$', name):
+				self.attr_queue.append((scope, target, params))
+			else:
+				if self.bulk:
+					self.flush_attrs()
+				self.stack(cmd, target, **params)
+
+
+	def get_scope_ids(self, scope):
+		"""
+		Returns a dictionary of the names of the SCOPE targets
+		(hosts, appliances, ...) to their ids, and the scope_map column
+		holding the id.
+		"""
+
+		if scope == 'global':
+			return { None: None }, None
+
+		table, column = {
+			'appliance':   ('appliances', 'appliance_id'),
+			'os':          ('oses', 'os_id'),
+			'environment': ('environments', 'environment_id'),
+			'host':        ('nodes', 'node_id'),
+		}[scope]
+
+		self.db.execute(f'select name, id from {table}')
+		ids = {}
+		for name, id in self.db.fetchall():
+			ids[name] = id
+			ids.setdefault(name.lower(), id)
+		return ids, column
+
+
+	def flush_attrs(self):
+		"""
+		Sets the attrs queued by load_attr() in bulk mode: the attrs
+		being replaced are deleted with a few queries, then the
+		scope_map and attribute rows are inserted in batches.
+
+		Attrs that 'set attr' would reject (unknown targets, invalid
+		names, missing values) are skipped, just as their errors are
+		ignored when the commands are run one at a time.
+		"""
+
+		queue = self.attr_queue
+		self.attr_queue = []
+
+		scopes = {}
+		for scope, target, params in queue:
+			scopes.setdefault(scope, []).append((target, params))
+
+		for scope, entries in scopes.items():
+			ids, column = self.get_scope_ids(scope)
+
+			# (target id, attr) -> (attr, value, shadow), the last
+			# one wins. Attr names are matched without case, as
+			# MySQL does.
+			attrs = {}
+			for target, params in entries:
+				name  = params['attr']
+				value = params['value']
+				if name is None or value is None:
+					continue
+				name  = str(name)
+				value = str(value)
+
+				target_id = ids.get(target, ids.get(str(target).lower()))
+				if target_id is None and scope != 'global':
+					continue
+
+				attrs.pop((target_id, name.lower()), None)
+				attrs[(target_id, name.lower())] = (name, value, str2bool(str(params['shadow'])))
+
+			if not attrs:
+				continue
+
+			# Remove the attrs being replaced, in either table.
+
+			names   = list({ name for name, value, shadow in attrs.values() })
+			targets = list({ target_id for target_id, key in attrs })
+			remove  = []
+			for table in ('attributes', 'shadow.attributes'):
+				query = f"""
+					select a.name, s.id, {column or 'NULL'}
+					from {table} a, scope_map s
+					where a.scope_map_id = s.id and s.scope = %s
+					and a.name in %s
+				"""
+				values = [ scope, names ]
+				if column:
+					query += f' and s.{column} in %s'
+					values.append(targets)
+				self.db.execute(query, values)
+				for name, scope_map_id, target_id in self.db.fetchall():
+					if (target_id, name.lower()) in attrs:
+						remove.append(scope_map_id)
+
+			for i in range(0, len(remove), 1000):
+				self.db.execute('delete from scope_map where id in %s', (remove[i:i + 1000],))
+
+			rows = [ (target_id, name, value, shadow)
+				 for (target_id, key), (name, value, shadow) in attrs.items() if value ]
+
+			for i in range(0, len(rows), 1000):
+				self.insert_attrs(scope, column, rows[i:i + 1000])
+
+
+	def insert_attrs(self, scope, column, rows):
+		"""
+		Inserts the attr ROWS (target id, attr, value, shadow) of
+		SCOPE: a scope_map row for each attr, just like set attr, then
+		the attribute rows pointing at them.
+
+		The scope_map rows go in with a single insert, and are read back
+		as the rows from LAST_INSERT_ID() on. Inside the consistent
+		snapshot of the bulk load, those are only the rows just inserted,
+		as ids given to other connections since are not visible.
+		"""
+
+		columns = ('appliance_id', 'os_id', 'environment_id', 'node_id')
+		values  = []
+		for target_id, name, value, shadow in rows:
+			values.append(scope)
+			values.extend(target_id if c == column else None for c in columns)
+
+		self.db.execute(f"""
+			insert into scope_map(scope, {', '.join(columns)})
+			values {', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))}
+		""", values)
+		self.db.execute(f"""
+			select id, {column or 'NULL'} from scope_map
+			where id >= LAST_INSERT_ID() and scope = %s
+		""", (scope,))
+
+		scope_map_ids = {}
+		for scope_map_id, target_id in self.db.fetchall():
+			scope_map_ids.setdefault(target_id, []).append(scope_map_id)
+
+		tables = { False: [], True: [] }
+		for target_id, name, value, shadow in rows:
+			tables[shadow].append((scope_map_ids[target_id].pop(), name, value))
+
+		for shadow, table in tables.items():
+			if table:
+				self.db.execute(f"""
+					insert into {'shadow.attributes' if shadow else 'attributes'}(scope_map_id, name, value)
+					values (%s, %s, %s)
+				""", table, many=True)
+
+
+	@contextmanager
+	def section(self, name, entries):
+		"""
+		Times loading the section NAME of ENTRIES entries. In bulk mode
+		the queued attrs are set at the end of the section.
+		"""
+
+		t0 = time.time()
+		yield
+		if self.bulk:
+			self.flush_attrs()
+			if entries:
+				self.section_stats.append((name, entries, time.time() - t0))
 
 
 	def load_controller(self, controllers, target=None):
@@ -359,13 +526,17 @@ class command(stack.commands.Command):
 
 	def run(self, params, args):
 
-		document, self.exec_commands, self.force = self.fillParams([
+		document, self.exec_commands, self.force, self.bulk = self.fillParams([
 			('document', None),
 			('exec', False),
 			('force', False),
+			('bulk', False),
 		])
 		self.exec_commands = str2bool(self.exec_commands)
 		self.force = str2bool(self.force)
+		self.bulk = str2bool(self.bulk)
+		if self.bulk:
+			self.exec_commands = True
 
 		if not document:
 			if not args:
@@ -377,7 +548,118 @@ class command(stack.commands.Command):
 
 		document = self.load_file(document)
 
-		self.main(document)
+		if self.bulk:
+			self.bulk_main(document)
+		else:
+			self.main(document)
+
+
+	def validate(self, document):
+		"""
+		Checks the whole DOCUMENT up front, so a bulk load fails before
+		it has written anything: the partitions of every section, and
+		that the oses, appliances, environments and boxes the document
+		refers to exist, or are added by the document itself. Call it
+		inside the load's transaction so the checks see the same
+		database the load does.
+		"""
+
+		if self.force:
+			return
+
+		def names(section):
+			return { entry.get('name') for entry in section or [] }
+
+		targets = [ document ]
+		for section in ('appliance', 'environment', 'os', 'host'):
+			for entry in document.get(section) or []:
+				if not entry.get('name'):
+					raise CommandError(self, f'{section} section missing "name"')
+				targets.append(entry)
+
+		for target in targets:
+			if target.get('partition'):
+				self.validate_partition(partitions = target['partition'])
+
+		known = {}
+		for scope in ('os', 'appliance', 'environment'):
+			ids, column = self.get_scope_ids(scope)
+			known[scope] = set(ids)
+		known['appliance'] |= names(document.get('appliance'))
+		known['environment'] |= names(document.get('environment'))
+
+		self.db.execute('select name from boxes')
+		known['box'] = { box for box, in self.db.fetchall() }
+		known['box'] |= names((document.get('software') or {}).get('box'))
+
+		for name in names(document.get('os')):
+			if name not in known['os']:
+				raise CommandError(self, f'os "{name}" does not exist')
+
+		for host in document.get('host') or []:
+			for key in ('appliance', 'environment', 'box'):
+				value = host.get(key)
+				if value and not known[key] & { value, str(value).lower() }:
+					raise CommandError(self,
+						f'host "{host["name"]}" {key} "{value}" does not exist')
+
+
+	def bulk_main(self, document):
+		"""
+		Loads the DOCUMENT in a single transaction, reading the
+		database as it was when the load started (plus the load's own
+		writes). Nothing is written if the load fails. The attrs are
+		set in batches, and the time spent on each section is reported.
+		"""
+
+		self.attr_queue    = []
+		self.section_stats = []
+
+		self.db.execute('start transaction with consistent snapshot')
+		try:
+			self.validate(document)
+			self.main(document)
+			self.flush_attrs()
+			self.db.execute('commit')
+		except BaseException:
+			self.db.execute('rollback')
+			raise
+		finally:
+			# The cache saw the writes of the transaction, either
+			# they are committed or they never happened.
+			self.db.clearCache()
+
+		# Commands that regenerate files on the frontend from a
+		# subprocess could not see the uncommitted data, do it now.
+
+		if document.get('software'):
+			self._exec("""
+				/opt/stack/bin/stack report host repo localhost |
+				/opt/stack/bin/stack report script |
+				/bin/sh
+				""", shell=True)
+		if self.has_routes(document):
+			self._exec("""
+				/opt/stack/bin/stack report host route localhost |
+				/opt/stack/bin/stack report script |
+				bash > /dev/null 2>&1
+				""", shell=True)
+
+		self.beginOutput()
+		for name, entries, seconds in self.section_stats:
+			self.addOutput(name, (entries, '%.3f' % seconds,
+					      '%.1f' % (entries / seconds) if seconds else ''))
+		self.endOutput(header=['section', 'entries', 'seconds', 'rate'], trimOwner=False)
+
+
+	def has_routes(self, document):
+		if document.get('route'):
+			return True
+		for section in ('appliance', 'environment', 'os', 'host'):
+			for target in document.get(section) or []:
+				if target.get('route'):
+					return True
+		return False
 
 
 
@@ -404,6 +686,13 @@ class Command(command):
 	This is much faster than piping through bash.  Defaults to False.
 	</param>
 
+	<param type='boolean' name='bulk'>
+	If set to True, the document is validated up front and loaded in a
+	single transaction, with the attributes written in batches, and the
+	time taken by each section is listed. Nothing is loaded if the load
+	fails. Implies exec. Defaults to False.
+	</param>
+
 	<param type='boolean' name='force'>
 	If set to True, will disregard any non-syntax validation done on the json data.
 	This is useful to, for example, load incomplete partitioning data, which the admin
@@ -418,13 +707,17 @@ class Command(command):
 
 		self.set_scope('global')
 
-		self.load_access(document.get('access'))
-		self.load_attr(document.get('attr'))
-		self.load_controller(document.get('controller'))
-		self.load_partition(document.get('partition'))
-		self.load_firewall(document.get('firewall'))
+		for name, load in (('access',     self.load_access),
+				   ('attr',       self.load_attr),
+				   ('controller', self.load_controller),
+				   ('partition',  self.load_partition),
+				   ('firewall',   self.load_firewall)):
+			section = document.get(name)
+			with self.section(name, len(section or [])):
+				load(section)
 
 		for plugin in self.loadPlugins():
 			section = document.get(plugin.provides())
 			if section:
-				plugin.run(section)
+				with self.section(plugin.provides(), len(section)):
+					plugin.run(section)
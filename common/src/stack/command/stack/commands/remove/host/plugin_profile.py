@@ -0,0 +1,17 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+import stack.profile
+
+
+class Plugin(stack.commands.Plugin):
+
+	def provides(self):
+		return 'profile'
+
+	def run(self, hosts):
+		stack.profile.ProfileCache().invalidate(hosts)
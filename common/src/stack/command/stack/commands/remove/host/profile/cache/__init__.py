@@ -0,0 +1,34 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+import stack.profile
+
+
+class Command(stack.commands.remove.host.command):
+	"""
+	Remove cached host profiles, forcing the next 'list host xml' to
+	generate them again.
+
+	<arg optional='1' type='string' name='host' repeat='1'>
+	Zero, one or more host names. If no host names are supplied,
+	the cached profiles of all hosts are removed.
+	</arg>
+
+	<example cmd='remove host profile cache backend-0-0'>
+	Remove the cached profile of backend-0-0.
+	</example>
+
+	<related>list host profile cache</related>
+	<related>sync host profile cache</related>
+	"""
+
+	def run(self, params, args):
+		if args:
+			hosts = self.getHostnames(args)
+		else:
+			hosts = None
+		stack.profile.ProfileCache().invalidate(hosts)
@@ -0,0 +1,30 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import stack.commands
+import stack.profile
+
+
+class Command(stack.commands.remove.command):
+	"""
+	Remove compiled graphs, forcing the next 'list node xml' to parse
+	the graph files again.
+
+	<arg optional='1' type='string' name='directory' repeat='1'>
+	The graph directories to remove the compiled graphs of, e.g.
+	/export/stack/carts/site/graph. If no directories are given all
+	compiled graphs are removed.
+	</arg>
+
+	<example cmd='remove node graph'>
+	Remove all the compiled graphs.
+	</example>
+
+	<related>list node graph</related>
+	"""
+
+	def run(self, params, args):
+		stack.profile.GraphCache().invalidate(args or None)
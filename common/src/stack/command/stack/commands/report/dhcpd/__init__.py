@@ -138,8 +138,32 @@ class Command(stack.commands.HostArgumentProcessor,
 		for host in self.call('list.host'):
 			data[host['host']] = []
 
-		host_devices = {}
+		# Everything needed for the host entries is fetched up front
+		# and joined here, so the report stays linear in the number
+		# of interfaces rather than running commands and selects for
+		# every host and interface.
+
 		interfaces = self.call('list.host.interface')
+
+		host_interfaces = {}	# host -> { interface }
+		addresses = {}		# (host, interface) -> (ip, channel)
+		for interface in interfaces:
+			key = (interface['host'], interface['interface'])
+			host_interfaces.setdefault(key[0], set()).add(key[1])
+			addresses.setdefault(key, (interface['ip'], interface['channel']))
+
+		pxe_networks = {}	# (host, ip) -> network name
+		for host, ip, netname in self.db.select("""
+			n.name, nt.ip, s.name from subnets s, networks nt, nodes n
+			where nt.node=n.id and nt.subnet=s.id and s.pxe=TRUE
+			and nt.ip is not NULL
+		"""):
+			pxe_networks.setdefault((host, ip), netname)
+
+		kickstartable = self.getHostAttrDict([], 'kickstartable')
+		aws = self.getHostAttrDict([], 'aws')
+
+		host_devices = {}
 		for interface in interfaces:
 			host = interface['host']
 			mac = interface['mac']
@@ -147,14 +171,12 @@ class Command(stack.commands.HostArgumentProcessor,
 			device = interface['interface']
 			channel = interface['channel']
 
-			other_interfaces = [iface['interface'] for iface in interfaces
-					    if iface['host'] == host and iface['interface'] != device]
-
 			if channel:
 				if device == 'ipmi' and not ip:
 					Warn(f'WARNING: skipping IPMI interface on host "{host}" - interface has a channel but no IP')
 					continue
-				elif device != 'ipmi' and channel not in other_interfaces:
+				elif device != 'ipmi' and (channel == device or
+							   channel not in host_interfaces.get(host, ())):
 					Warn(f'WARNING: skipping interface "{device}" on host "{host}" - '
 					     f'interface has channel "{channel}" that does not match any other interface on the host')
 					continue
@@ -163,16 +185,16 @@ class Command(stack.commands.HostArgumentProcessor,
 					Warn(f'WARNING: skipping interface "{device}" on host "{host}" - duplicate interface detected')
 					continue
 				else:
-					host_devices[host].append(device)
+					host_devices[host].add(device)
 			elif host:
-				host_devices[host] = [device]
+				host_devices[host] = {device}
 
 			if host and mac:
 				data[host].append((mac, ip, device))
 
 		for name in data.keys():
-			kickstartable = self.str2bool(self.getHostAttr(name, 'kickstartable'))
-			aws = self.str2bool(self.getHostAttr(name, 'aws'))
+			is_kickstartable = self.str2bool(kickstartable.get(name, {}).get('kickstartable'))
+			is_aws = self.str2bool(aws.get(name, {}).get('aws'))
 			mac = None
 			ip  = None
 			dev = None
@@ -184,21 +206,14 @@ class Command(stack.commands.HostArgumentProcessor,
 			for (mac, ip, dev) in data[name]:
 				if not ip:
 					try:
-						ip = self.resolve_ip(name, dev)
-					except IndexError:
-						Warn(f'WARNING: skipping interface "{device}" on host "{host}" - duplicate interface detected')
+						ip = self.resolve_ip(addresses, name, dev)
+					except KeyError:
+						Warn(f'WARNING: skipping interface "{dev}" on host "{name}" - duplicate interface detected')
 						continue
 				netname = None
 				if ip:
-					r = self.db.select("""
-						s.name from subnets s, networks nt, nodes n
-						where nt.node=n.id and n.name=%s
-						and nt.subnet=s.id and s.pxe=TRUE and nt.ip=%s
-					""", (name, ip))
-
-					if r:
-						(netname, ) = r[0]
-				if ip and mac and dev and netname and not aws:
+					netname = pxe_networks.get((name, ip))
+				if ip and mac and dev and netname and not is_aws:
 					self.addOutput('', '\nhost %s.%s.%s {' %
 						(name, netname, dev))
 					self.addOutput('', '\toption host-name\t"%s";' % name)
@@ -206,7 +221,7 @@ class Command(stack.commands.HostArgumentProcessor,
 					self.addOutput('', '\thardware ethernet\t%s;' % mac)
 					self.addOutput('', '\tfixed-address\t\t%s;' % ip)
 
-					if kickstartable:
+					if is_kickstartable:
 
 						self.addOutput('', filename)
 						server = servers.get(netname)
@@ -222,20 +237,21 @@ class Command(stack.commands.HostArgumentProcessor,
 
 		self.addOutput('', '</stack:file>')
 
-	def resolve_ip(self, host, device):
+	def resolve_ip(self, addresses, host, device):
 		"""
 		Attempts to resolve the IP address of a host interface that lacks an address
-		(for example, if the interface is part of a bond).
+		(for example, if the interface is part of a bond). ADDRESSES maps each
+		(host, interface) to its (ip, channel).
 		"""
 
-		(ip, channel) = self.db.select("""
-			nt.ip, nt.channel from networks nt, nodes n
-			where n.name=%s and nt.device=%s and nt.node=n.id
-		""", (host, device))[0]
-
-		if channel:
-			return self.resolve_ip(host, channel)
-		return ip
+		seen = set()
+		while device not in seen:
+			seen.add(device)
+			(ip, channel) = addresses[(host, device)]
+			if not channel:
+				return ip
+			device = channel
+		return None
 
 	def writeDhcpSysconfig(self):
 		self.addOutput('', '<stack:file stack:name="/etc/sysconfig/dhcpd">')
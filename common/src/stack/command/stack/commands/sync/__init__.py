@@ -13,6 +13,7 @@
 
 import subprocess
 import stack.commands
+import stack.materialize
 
 
 class command(stack.commands.Command):
@@ -20,17 +21,25 @@ class command(stack.commands.Command):
 		"""
 		For report commands that output XML, this method runs the command
 		and processes the XML to create system files.
+
+		The files are written in-process, and only when they change.
+		Returns the names of the files that changed, or None if the
+		output had to be run through 'stack report script' and the
+		shell, in which case any of them may have.
 		"""
 
+		text = ''.join('%s\n' % row['col-1'] for row in self.call(cmd, args))
+
+		try:
+			return stack.materialize.Materializer().run(text)
+		except stack.materialize.Unsupported:
+			pass
+
 		p = subprocess.Popen(['/opt/stack/bin/stack', 'report', 'script'],
 				     stdin=subprocess.PIPE,
 				     stdout=subprocess.PIPE,
 				     stderr=subprocess.PIPE)
-
-		for row in self.call(cmd, args):
-			line = '%s\n' % row['col-1']
-			p.stdin.write(line.encode())
-		o, e = p.communicate('')
+		o, e = p.communicate(text.encode())
 
 		psh = subprocess.Popen(['/bin/sh'],
 				       stdin=subprocess.PIPE,
@@ -38,5 +47,4 @@ class command(stack.commands.Command):
 				       stderr=subprocess.PIPE)
 		out, err = psh.communicate(o)
 
-
-
+		return None
@@ -10,7 +10,60 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE-ROCKS.txt
 # @rocks@
 
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import subprocess
+import stack
 import stack.commands
+from stack.exception import ParamType
+
+
+# The tables the attributes of every host are resolved from.
+
+ATTR_TABLES = [
+	'attributes', 'scope_map', 'nodes', 'appliances', 'environments',
+	'oses', 'boxes', 'networks', 'subnets'
+]
+
+# The tables the host interfaces (and their names) are built from.
+
+HOST_TABLES = [ 'nodes', 'networks', 'subnets', 'aliases' ]
+
+# Parts of tables, checksummed by the rows of their selects. Every host
+# added changes the nodes, networks, and attributes tables, but not the
+# frontend's own rows, nor the attrs not set on a single host.
+
+QUERIES = {
+	'frontend': [
+		"""
+		select n.*, i.* from nodes n
+		join appliances a on a.id = n.appliance
+		left join networks i on i.node = n.id
+		where a.name = 'frontend'
+		order by n.id, i.id
+		""",
+		"""
+		select s.scope, s.appliance_id, s.os_id, s.environment_id,
+		s.node_id, a.name, a.value
+		from attributes a join scope_map s on s.id = a.scope_map_id
+		where s.node_id is null or s.node_id in (
+			select n.id from nodes n
+			join appliances ap on ap.id = n.appliance
+			where ap.name = 'frontend'
+		)
+		order by a.scope_map_id, a.name
+		""",
+	],
+}
+
+# What the frontend's own attrs are resolved from.
+
+FRONTEND_TABLES = [
+	'frontend', 'appliances', 'environments', 'oses', 'boxes', 'subnets'
+]
 
 
 class Command(stack.commands.sync.command):
@@ -19,13 +72,189 @@ class Command(stack.commands.sync.command):
 	rebuild the configuration file by extracting data from the
 	database, then restart the relevant services.
 
+	Plugins that list the database tables they are built from (with
+	a tables() method, which may also name the QUERIES) are skipped when none of those tables changed
+	since the plugin last ran successfully, and none of the files
+	they write (listed by a files() method) were removed or changed
+	since. The services of a skipped plugin (listed by a services()
+	method) are still started, in case they were stopped.
+
+	<param type='boolean' name='force'>
+	Run every plugin, whether its tables changed or not.
+	Default is false.
+	</param>
+
+	<param type='boolean' name='dryrun'>
+	List the plugins that would be run and why, without running them.
+	Default is false.
+	</param>
+
+	<param type='int' name='threads'>
+	Run up to this many plugins at a time, each once the plugins it
+	requires are done. Plugins that are not thread safe still run
+	alone. Default is 1, one plugin after the other.
+	</param>
+
 	<example cmd='sync config'>
 	Rebuild all configuration files and restart relevant services.
 	</example>
+
+	<example cmd='sync config dryrun=true'>
+	List which configuration files would be rebuilt.
+	</example>
 	"""
 
+	STATE = '/var/cache/stack/sync/config.json'
+
+	def readState(self):
+		try:
+			with open(self.STATE) as fin:
+				return json.load(fin)
+		except (OSError, ValueError):
+			return {}
+
+	def writeState(self, state):
+		try:
+			os.makedirs(os.path.dirname(self.STATE), exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.STATE))
+			with os.fdopen(fd, 'w') as fout:
+				json.dump(state, fout, indent=1, sort_keys=True)
+			os.replace(tmp, self.STATE)
+		except OSError:
+			# Not being able to remember only costs a full
+			# sync next time.
+			pass
+
+	def getChecksums(self, tables):
+		"""
+		Returns a dictionary of the checksums of TABLES, which
+		may also name the QUERIES.
+		"""
+
+		checksums = {}
+		for name in sorted({ *tables } & { *QUERIES }):
+			m = hashlib.md5()
+			for query in QUERIES[name]:
+				self.db.execute(query)
+				m.update(repr(self.db.fetchall()).encode())
+			checksums[name] = m.hexdigest()
+
+		tables = { *tables } - { *QUERIES }
+		if tables:
+			self.db.execute('checksum table %s' % ', '.join(sorted(tables)))
+			checksums.update({ table.split('.')[-1]: checksum
+					   for table, checksum in self.db.fetchall() or [] })
+		return checksums
+
+	def getFingerprint(self, plugin, checksums):
+		m = hashlib.md5()
+		m.update(repr((stack.version, stack.release, plugin.provides())).encode())
+		for table in sorted(plugin.tables()):
+			m.update(repr((table, checksums.get(table))).encode())
+		return m.hexdigest()
+
+	def getFiles(self, plugin):
+		"""
+		Returns a dictionary of the files PLUGIN writes (shell
+		patterns allowed) to their inode, size, and modification
+		time, or None for a file that is missing.
+		"""
+
+		files = {}
+		for pattern in getattr(plugin, 'files', lambda: [])():
+			for path in glob.glob(pattern) or [ pattern ]:
+				try:
+					st = os.stat(path)
+					files[path] = [ st.st_ino, st.st_size, st.st_mtime_ns ]
+				except OSError:
+					files[path] = None
+		return files
+
 	def run(self, params, args):
 
+		force, dryrun, threads = self.fillParams([
+			('force', False),
+			('dryrun', False),
+			('threads', 1)
+		])
+		force  = self.str2bool(force)
+		dryrun = self.str2bool(dryrun)
+		try:
+			threads = int(threads)
+		except ValueError:
+			raise ParamType(self, 'threads', 'integer')
+
+		plugins = self.loadPlugins()
+
+		tables = []
+		for plugin in plugins:
+			if hasattr(plugin, 'tables'):
+				tables.extend(plugin.tables())
+		checksums = self.getChecksums({ *tables })
+
+		state = self.readState()
+		todo  = []
+		for plugin in plugins:
+			name = plugin.provides()
+			if not hasattr(plugin, 'tables'):
+				fingerprint = None
+				reason = 'no tables listed'
+			else:
+				fingerprint = self.getFingerprint(plugin, checksums)
+				last = state.get(name)
+				if force:
+					reason = 'forced'
+				elif not last:
+					reason = 'never synced'
+				elif last['fingerprint'] != fingerprint:
+					changed = [ table for table in sorted(plugin.tables())
+						    if checksums.get(table) != last['checksums'].get(table) ]
+					reason = 'changed: %s' % (' '.join(changed) or 'version')
+				else:
+					files   = self.getFiles(plugin)
+					changed = [ path for path in sorted({ *files, *last.get('files', {}) })
+						    if files.get(path) != last.get('files', {}).get(path) ]
+					reason  = 'changed: %s' % ' '.join(changed) if changed else None
+
+			todo.append((plugin, fingerprint, reason))
+
+		if dryrun:
+			self.beginOutput()
+			for plugin, fingerprint, reason in todo:
+				self.addOutput(plugin.provides(), ('run' if reason else 'skip', reason or 'unchanged'))
+			self.endOutput(header=['plugin', 'action', 'reason'], trimOwner=False)
+			return
+
 		self.notify('Sync Config')
 
-		self.runPlugins()
+		def synced(plugin, fingerprint):
+			if fingerprint:
+				state[plugin.provides()] = {
+					'fingerprint': fingerprint,
+					'checksums': { table: checksums.get(table) for table in plugin.tables() },
+					'files': self.getFiles(plugin)
+				}
+
+		# Starting a service that is running does nothing.
+
+		for plugin, fingerprint, reason in todo:
+			if not reason:
+				for service in getattr(plugin, 'services', lambda: [])():
+					subprocess.call([ '/sbin/service', service, 'start' ],
+							stdout=subprocess.DEVNULL,
+							stderr=subprocess.DEVNULL)
+
+		todo = [ (plugin, fingerprint) for plugin, fingerprint, reason in todo if reason ]
+		if threads > 1:
+			# Recorded only if all of them ran.
+			if todo:
+				self.runPlugins(plugins=[ plugin for plugin, fingerprint in todo ],
+						threads=threads)
+			for plugin, fingerprint in todo:
+				synced(plugin, fingerprint)
+			self.writeState(state)
+		else:
+			for plugin, fingerprint in todo:
+				self.runPlugins(plugins=[ plugin ])
+				synced(plugin, fingerprint)
+				self.writeState(state)
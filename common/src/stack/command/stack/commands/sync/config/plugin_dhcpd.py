@@ -18,5 +18,17 @@ class Plugin(stack.commands.Plugin):
 	def requires(self):
 		return ['hostfile']
 
+	def threadSafe(self):
+		return True
+
+	def tables(self):
+		return stack.commands.sync.config.ATTR_TABLES
+
+	def files(self):
+		return [ '/etc/dhcp/dhcpd.conf', '/etc/sysconfig/dhcpd' ]
+
+	def services(self):
+		return [ 'dhcpd' ]
+
 	def run(self, args):
 		self.owner.command('sync.dhcpd')
@@ -15,6 +15,19 @@ class Plugin(stack.commands.Plugin):
 	def provides(self):
 		return 'dns'
 
+	def threadSafe(self):
+		return True
+
+	def tables(self):
+		return stack.commands.sync.config.HOST_TABLES + [ 'frontend' ]
+
+	def files(self):
+		return [ '/etc/named.conf', '/etc/resolv.conf',
+			 '/var/named/*.domain', '/var/named/*.domain.local' ]
+
+	def services(self):
+		return [ 'named' ]
+
 	def run(self, args):
 		self.owner.command('sync.dns', [])
 
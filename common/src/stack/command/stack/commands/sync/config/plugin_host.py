@@ -16,6 +16,15 @@ class Plugin(stack.commands.Plugin):
 	def requires(self):
 		return []
 
+	def threadSafe(self):
+		return True
+
+	def tables(self):
+		return stack.commands.sync.config.HOST_TABLES + [ 'frontend' ]
+
+	def files(self):
+		return [ '/etc/hosts' ]
+
 	def run(self, args):
 		if self.owner.getAttr('platform') not in [ 'docker', 'aws' ]:
 			self.owner.command('sync.host')
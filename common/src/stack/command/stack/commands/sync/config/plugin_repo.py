@@ -12,6 +12,12 @@ class Plugin(stack.commands.Plugin):
 	def provides(self):
 		return 'repo'
 		
+	def tables(self):
+		return stack.commands.sync.config.FRONTEND_TABLES + [ 'rolls', 'stacks', 'carts', 'cart_stacks' ]
+
+	def files(self):
+		return [ '/etc/yum.repos.d/stacki.repo', '/etc/zypp/repos.d/stacki.repo' ]
+
 	def run(self, args):
 		self.owner.command('sync.host.repo', [ 'localhost' ])
 
@@ -18,5 +18,11 @@ class Plugin(stack.commands.Plugin):
 	def requires(self):
 		return ['dhcpd']
 
+	def tables(self):
+		return stack.commands.sync.config.ATTR_TABLES
+
+	def files(self):
+		return [ '/etc/chrony.conf', '/etc/ntp.conf', '/etc/sysconfig/clock' ]
+
 	def run(self, args):
 		self.owner.command('sync.host.time', ['localhost'])
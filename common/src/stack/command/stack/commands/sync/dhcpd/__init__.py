@@ -27,7 +27,14 @@ t the
 
 		self.notify('Sync DHCP')
 
-		self.report('report.dhcpd')
+		changed = self.report('report.dhcpd')
 
-		subprocess.call(['/sbin/service', 'dhcpd', 'restart'],
+		# Only restart DHCPD when its configuration changed, starting
+		# it is a no-op when it is already running.
+
+		if changed is None or changed:
+			action = 'restart'
+		else:
+			action = 'start'
+		subprocess.call(['/sbin/service', 'dhcpd', action],
 				stdout=open('/dev/null'), stderr=open('/dev/null'))
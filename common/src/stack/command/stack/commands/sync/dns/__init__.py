@@ -24,15 +24,20 @@ class Command(stack.commands.sync.command):
 	def run(self, params, args):
 
 		self.notify('Sync DNS')
-		# named's files are re-written as a side-effect of runPlugins()
-		self.runPlugins()
+		# named's files are re-written as a side-effect of runPlugins(),
+		# the plugins return the files they changed (None if unknown)
+		results = dict(self.runPlugins())
+		changed = any(results.get(plugin) != [] for plugin in [ 'dns', 'named' ])
 
 		# only start named if we have networks with dns=True and those nets have zones defined.
 		nets = [net for net in self.call('list.network', ['dns=true']) if net['zone']]
 
 		if nets:
 			self._exec('systemctl enable named'.split())
-			self._exec('systemctl restart named'.split())
+			if changed:
+				self._exec('systemctl restart named'.split())
+			else:
+				self._exec('systemctl start named'.split())
 		else:
 			self._exec('systemctl disable named'.split())
 			self._exec('systemctl stop named'.split())
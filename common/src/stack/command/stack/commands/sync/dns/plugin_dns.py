@@ -20,4 +20,4 @@ class Plugin(stack.commands.Plugin):
 		return 'dns'
 
 	def run(self, args):
-		self.owner.report('report.zones')
+		return self.owner.report('report.zones')
@@ -5,6 +5,9 @@
 # @copyright@
 
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from collections import namedtuple
 from dataclasses import make_dataclass
@@ -12,6 +15,7 @@ import itertools
 import stack.commands
 import stack.firmware
 from stack.argument_processors.firmware import FirmwareArgumentProcessor
+from stack.exception import ParamType, ParamValue
 
 class Command(stack.commands.sync.host.command, FirmwareArgumentProcessor):
 	"""
@@ -25,6 +29,10 @@ class Command(stack.commands.sync.host.command, FirmwareArgumentProcessor):
 	Force the firmware update process to run for hosts that are already in sync.
 	</param>
 
+	<param type='int' name='concurrency'>
+	The maximum number of hosts to sync at the same time for each kind of host. Defaults to 32.
+	</param>
+
 	<example cmd='sync host firmware switch-18-11'>
 	If a compatible firmware version is tracked by stacki, the firmware will be synced to switch-18-11.
 	</example>
@@ -124,7 +132,7 @@ class Command(stack.commands.sync.host.command, FirmwareArgumentProcessor):
 				"url",
 			)
 		)
-		for row in self.db.select(
+		rows = self.db.select(
 				"""
 				nodes.Name, firmware_make.name, firmware_model.name, firmware.version, firmware.file, firmware_imp.name
 				FROM firmware_mapping
@@ -141,7 +149,10 @@ class Command(stack.commands.sync.host.command, FirmwareArgumentProcessor):
 				WHERE nodes.Name IN %s
 				""",
 				(hosts,)
-		):
+		)
+		# Look up the frontend IP of every mapped host at once rather than once per host.
+		frontend_ips = self.get_common_frontend_ips(hostnames = list(dict.fromkeys(row[0] for row in rows)))
+		for row in rows:
 			host_make_model = common_key(*row[:3])
 			version, firmware_file, imp = row[3:]
 			path = Path(firmware_file).resolve()
@@ -161,7 +172,7 @@ class Command(stack.commands.sync.host.command, FirmwareArgumentProcessor):
 					imp = imp,
 					host_attrs = host_attrs[host_make_model.host],
 					force = force,
-					frontend_ip = self.get_common_frontend_ip(hostname = host_make_model.host),
+					frontend_ip = frontend_ips[host_make_model.host],
 					firmware_files = [
 						FirmwareFile(
 							file = path,
@@ -203,18 +214,59 @@ class Command(stack.commands.sync.host.command, FirmwareArgumentProcessor):
 				firmware_file.url = self.get_firmware_url(
 					hostname = host_make_model.host,
 					firmware_file = firmware_file.file,
+					frontend_ip = firmware_info.frontend_ip,
 				)
 
 		return results
 
+	def run_hosts_parallel(self, function, kwargs_by_host, thread_name_prefix):
+		"""Calls function(host, **kwargs) for each host and kwargs in kwargs_by_host, in up to self.concurrency threads.
+
+		The start of each host, and the time it took to finish or fail, is reported with notify.
+
+		The exceptions raised are returned as a list in the same order as the hosts, with None for the hosts
+		that succeeded.
+		"""
+		lock = threading.Lock()
+		done = []
+
+		def sync_host(host, kwargs):
+			self.notify(f"Started firmware sync on {host}.")
+			start = time.time()
+			status = "failed"
+			try:
+				function(host, **kwargs)
+				status = "finished"
+			finally:
+				with lock:
+					done.append(host)
+					count = len(done)
+				self.notify(
+					f"{status.capitalize()} firmware sync on {host} in {time.time() - start:.1f} seconds"
+					f" ({count} of {len(kwargs_by_host)} hosts done)."
+				)
+
+		with ThreadPoolExecutor(max_workers = self.concurrency, thread_name_prefix = thread_name_prefix) as executor:
+			futures = [
+				executor.submit(sync_host, host, kwargs)
+				for host, kwargs in kwargs_by_host.items()
+			]
+			return [future.exception() for future in futures]
+
 	def run(self, params, args):
 		self.notify('Sync Host Firmware')
 		hosts = self.getHostnames(names = args)
-		force, = self.fillParams(
-			names = [('force', False)],
+		force, concurrency = self.fillParams(
+			names = [('force', False), ('concurrency', 32)],
 			params = params
 		)
 		force = self.str2bool(force)
+		try:
+			self.concurrency = int(concurrency)
+		except ValueError:
+			raise ParamType(cmd = self, param = 'concurrency', type = 'integer')
+		if self.concurrency < 1:
+			raise ParamValue(cmd = self, param = 'concurrency', value = 'greater than 0')
 
 		host_attrs = self.getHostAttrDict(host = hosts)
 		# grab all the current firmware versions
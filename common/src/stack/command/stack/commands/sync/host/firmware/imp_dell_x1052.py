@@ -10,7 +10,6 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE-ROCKS.txt
 # @rocks@
 
-from concurrent.futures import ThreadPoolExecutor
 import syslog
 import stack.commands
 from stack.exception import CommandError
@@ -92,16 +91,13 @@ class Implementation(stack.commands.Implementation):
 				{update_key: firmware_file.file, "tftp_ip": firmware_info.frontend_ip, **kwargs}
 			)
 
-		errors = []
-		# now run each switch upgrade in parallel
-		with ThreadPoolExecutor(thread_name_prefix = "dell_firmware_update") as executor:
-			futures = [
-				executor.submit(self.update_firmware, switch_name = switch_name, **switch_args)
-				for switch_name, switch_args in x1052_firmware_args_per_host.items()
-			]
-			# Collect any errors, we don't expect there to be any return values.
-			for future in futures:
-				errors.append(future.exception())
+		# now run each switch upgrade in parallel, up to the concurrency limit of the command.
+		# Collect any errors, we don't expect there to be any return values.
+		errors = self.owner.run_hosts_parallel(
+			function = self.update_firmware,
+			kwargs_by_host = x1052_firmware_args_per_host,
+			thread_name_prefix = "dell_firmware_update",
+		)
 
 		# drop any Nones returned because of no exceptions and aggregate all remaining errors into one
 		error_messages = []
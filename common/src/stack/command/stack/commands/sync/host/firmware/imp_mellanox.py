@@ -12,7 +12,6 @@
 
 from threading import Timer
 from contextlib import suppress
-from concurrent.futures import ThreadPoolExecutor
 import syslog
 import stack.commands
 from stack.exception import CommandError
@@ -119,16 +118,13 @@ class Implementation(stack.commands.Implementation):
 				**kwargs,
 			}
 
-		errors = []
-		# now run each switch upgrade in parallel
-		with ThreadPoolExecutor(thread_name_prefix = 'mellanox_firmware_update') as executor:
-			futures = [
-				executor.submit(self.update_firmware, switch_name = switch_name, **switch_args)
-				for switch_name, switch_args in switch_upgrade_args.items()
-			]
-			# Collect any errors, we don't expect there to be any return values.
-			for future in futures:
-				errors.append(future.exception())
+		# now run each switch upgrade in parallel, up to the concurrency limit of the command.
+		# Collect any errors, we don't expect there to be any return values.
+		errors = self.owner.run_hosts_parallel(
+			function = self.update_firmware,
+			kwargs_by_host = switch_upgrade_args,
+			thread_name_prefix = 'mellanox_firmware_update',
+		)
 
 		# drop any Nones returned because of no exceptions and aggregate all remaining errors into one
 		error_messages = []
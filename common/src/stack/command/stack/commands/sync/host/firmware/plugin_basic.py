@@ -33,10 +33,11 @@ class Plugin(stack.commands.Plugin):
 				mapped_by_imp_name[firmware_info.imp] = {host_make_model: firmware_info}
 
 
-		# we don't expect return values, but the implementations might raise exceptions, so gather them here
+		# we don't expect return values, but the implementations might raise exceptions, so gather them here.
+		# No spinner, the implementations report the progress of each host.
 		results = self.owner.run_implementations_parallel(
 			implementation_mapping = mapped_by_imp_name,
-			display_progress = True,
+			display_progress = False,
 		)
 		# drop any results that didn't have any errors and aggregate the rest into one exception
 		error_messages = []
@@ -0,0 +1,79 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import stack.commands
+import stack.profile
+from stack.exception import ParamType
+
+
+class Command(stack.commands.sync.host.command):
+	"""
+	Brings the cached profiles of hosts up to date, ahead of
+	reinstalling them. Profiles are generated in parallel, and only
+	for the hosts whose cached profile is missing or out of date.
+
+	<arg optional='1' type='string' name='host' repeat='1'>
+	Zero, one or more host names. If no host names are supplied,
+	the profiles of all hosts are synced.
+	</arg>
+
+	<param type='int' name='threads'>
+	The number of profiles to generate at once. Default is the
+	number of CPUs.
+	</param>
+
+	<example cmd='sync host profile cache a:backend'>
+	Generate the profiles of all backends before reinstalling them.
+	</example>
+
+	<related>list host profile cache</related>
+	<related>remove host profile cache</related>
+	"""
+
+	def generate(self, cache, host):
+		before = cache.read(cache.getFilename(host))
+
+		t0 = time.time()
+		p = subprocess.run([ '/opt/stack/bin/stack', 'list', 'host', 'xml', host ],
+				   stdout=subprocess.DEVNULL,
+				   stderr=subprocess.PIPE)
+		seconds = time.time() - t0
+
+		after = cache.read(cache.getFilename(host))
+		if p.returncode:
+			status = 'failed'
+		elif not after:
+			status = 'uncached'
+		elif before and before['time'] == after['time']:
+			status = 'current'
+		else:
+			status = 'generated'
+
+		return host, status, seconds, p.stderr.decode().strip()
+
+	def run(self, params, args):
+		threads, = self.fillParams([ ('threads', os.cpu_count() or 4) ])
+
+		try:
+			threads = int(threads)
+		except ValueError:
+			raise ParamType(self, 'threads', 'integer')
+
+		cache = stack.profile.ProfileCache()
+		hosts = self.getHostnames(args)
+
+		with ThreadPoolExecutor(max_workers=max(threads, 1),
+					thread_name_prefix='sync_host_profile') as executor:
+			results = list(executor.map(lambda host: self.generate(cache, host), hosts))
+
+		self.beginOutput()
+		for host, status, seconds, error in results:
+			self.addOutput(host, (status, '%.3f' % seconds, error))
+		self.endOutput(header=['host', 'status', 'seconds', 'error'], trimOwner=False)
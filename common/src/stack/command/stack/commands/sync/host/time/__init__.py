@@ -47,16 +47,21 @@ class Command(stack.commands.sync.host.command):
 				break
 
 		threads = []
+		local = False
 
 		for h in run_hosts:
 			host = h['host']
 			hostname = h['name']
 
+			# The frontend's own files are written in-process
+			# once the other hosts are on their way.
+			if me == host:
+				local = True
+				continue
+
 			cmd = '/opt/stack/bin/stack report host time %s | ' % host
 			cmd += '/opt/stack/bin/stack report script | '
-
-			if me != host:
-				cmd += 'ssh -T -x %s ' % hostname
+			cmd += 'ssh -T -x %s ' % hostname
 			cmd += 'bash > /dev/null 2>&1 '
 
 			try:
@@ -66,6 +71,9 @@ class Command(stack.commands.sync.host.command):
 			except:
 				pass
 
+		if local:
+			self.report('report.host.time', [ me ])
+
 		#
 		# collect the threads
 		#
@@ -16,6 +16,7 @@ import signal
 import socket
 import subprocess
 import sys
+import time
 
 from stack.exception import CommandError
 import stack.mq
@@ -30,8 +31,18 @@ class Discovery:
 	_PIDFILE = "/var/run/stack-discovery.pid"
 	_LOGFILE = "/var/log/stack-discovery.log"
 
+	# Known MAC addresses are trusted this many seconds before the
+	# interfaces are loaded again
+	_INTERFACES_TTL = 60
+
+	# The config is synced once no node has been added for this many
+	# seconds, or this many seconds after the first node waiting
+	_SYNC_DELAY = 5
+	_SYNC_MAX_DELAY = 30
+
 	_get_next_ip_address_cache = {}
 	_get_ipv4_network_for_interface_cache = {}
+	_get_network_for_interface_cache = {}
 
 	@property
 	def hostname(self):
@@ -116,14 +127,8 @@ class Discovery:
 			self._logger.debug("trying IP address: %s", ip_address)
 
 			# Make sure this IP isn't already taken
-			self._command.db.clearCache()
-			for row in self._command.call("list.host.interface"):
-				if (
-					row['ip'] == str(ip_address) and
-					not row['interface'].startswith("vlan")
-				):
-					self._logger.debug("IP address already taken: %s", ip_address)
-					break
+			if self._is_taken_ip_address(str(ip_address)):
+				self._logger.debug("IP address already taken: %s", ip_address)
 			else:
 				# Looks like it is free
 				self._logger.debug("IP address is free: %s", ip_address)
@@ -132,109 +137,216 @@ class Discovery:
 		# No IP addresses left
 		return None
 
+	def _load_interfaces(self):
+		"""
+		Load the MAC addresses and the taken IP addresses of all the host interfaces. After
+		this only single interfaces are looked up again.
+		"""
+
+		self._known_macs = {}
+		self._taken_ips = set()
+
+		# Straight from the database, the select cache could be stale
+		self._command.db.execute("select mac, ip, device from networks")
+		self._add_interfaces(self._command.db.fetchall())
+
+		self._interfaces_loaded = time.time()
+
+	def _add_interfaces(self, rows):
+		now = time.time()
+		for mac, ip, device in rows:
+			if mac:
+				self._known_macs[mac] = now
+			if ip and not (device or "").startswith("vlan"):
+				self._taken_ips.add(ip)
+
+	def _is_known_mac_address(self, mac_address):
+		"""
+		Check if a MAC address belongs to a host interface. A MAC address not already known,
+		or not checked for a while, is looked up in the database.
+		"""
+
+		if not self._interfaces_loaded:
+			self._load_interfaces()
+
+		checked = self._known_macs.get(mac_address)
+		if checked is not None and time.time() - checked < self._INTERFACES_TTL:
+			return True
+
+		self._known_macs.pop(mac_address, None)
+		self._command.db.execute(
+			"select mac, ip, device from networks where mac=%s", (mac_address,)
+		)
+		self._add_interfaces(self._command.db.fetchall())
+		return mac_address in self._known_macs
+
+	def _is_taken_ip_address(self, ip_address):
+		"""
+		Check if an IP address is taken by a host interface other than a vlan. An IP address
+		not already known to be taken is looked up in the database.
+		"""
+
+		if not self._interfaces_loaded:
+			self._load_interfaces()
+
+		if ip_address in self._taken_ips:
+			return True
+
+		self._command.db.execute(
+			"select mac, ip, device from networks where ip=%s", (ip_address,)
+		)
+		self._add_interfaces(self._command.db.fetchall())
+		return ip_address in self._taken_ips
+
+	def _get_network_for_interface(self, interface):
+		"""
+		Return the name of the network for a given interface, caching the results in the process.
+		"""
+
+		network = self._get_network_for_interface_cache.get(interface)
+
+		if network is None:
+			ipv4_network = self._get_ipv4_network_for_interface(interface)
+			if ipv4_network is not None:
+				self._command.db.clearCache()
+				for row in self._command.call("list.network"):
+					if (
+						row['address'] == str(ipv4_network.network_address) and
+						row['mask'] == str(ipv4_network.netmask)
+					):
+						network = row['network']
+						self._get_network_for_interface_cache[interface] = network
+						break
+
+		return network
+
 	def _add_node(self, interface, mac_address, ip_address):
-		# Figure out the network for this interface
-		network = None
-		ipv4_network = self._get_ipv4_network_for_interface(interface)
-		if ipv4_network is not None:
-			self._command.db.clearCache()
-			for row in self._command.call("list.network"):
-				if (
-					row['address'] == str(ipv4_network.network_address) and
-					row['mask'] == str(ipv4_network.netmask)
-				):
-					network = row['network']
-					break
+		# Figure out the network for this interface. The network should alway be able to be
+		# found, unless something deleted it since the discovery daemon started running
+		network = self._get_network_for_interface(interface)
+		if network is None:
+			self._logger.error("no network exists for interface %s", interface)
+			return
+
+		hostname = self.hostname
 
-		# The network should alway be able to be found, unless something deleted it since the
-		# discovery daemon started running
-		if network is not None:
+		# Add the node with commands run in this process, syncing the config is left to
+		# _sync_config so a burst of new nodes is synced once
+		self._command.db.clearCache()
+		for description, command, args in (
 			# Add our new node
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "add", "host", self.hostname,
-				f"rack={self._rack}", f"rank={self._rank}",
+			("add host", "add.host", [
+				hostname, f"rack={self._rack}", f"rank={self._rank}",
 				f"appliance={self._appliance_name}", f"box={self._box}"
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
-
-			if result.returncode != 0:
-				self._logger.error("failed to add host %s:\n%s", self.hostname, result.stderr)
-				return
+			]),
 
 			# Add the node's interface (guess eth0 but will be updated pre-install)
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "add", "host", "interface", self.hostname,
-				"interface=eth0", "default=true", f"mac={mac_address}",
-				f"name={self.hostname}", f"ip={ip_address}", f"network={network}"
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
-
-			if result.returncode != 0:
-				self._logger.error("failed to add interface for host %s:\n%s", self.hostname, result.stderr)
-				return
+			("add interface for host", "add.host.interface", [
+				hostname, "interface=eth0", "default=true", f"mac={mac_address}",
+				f"name={hostname}", f"ip={ip_address}", f"network={network}"
+			]),
 
 			# Set the new node's install action
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "set", "host", "bootaction", self.hostname,
-				"type=install", "sync=false", f"action={self._install_action}"
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
-
-			if result.returncode != 0:
-				self._logger.error("failed to set install action for host %s:\n%s", self.hostname, result.stderr)
-				return
+			("set install action for host", "set.host.bootaction", [
+				hostname, "type=install", "sync=false", f"action={self._install_action}"
+			]),
 
 			# Set an attribute to let profile.cgi know if we are installing
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "set", "host", "attr", self.hostname,
-				"attr=discovery.install", f"value={self._install}"
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+			("set 'discovery.install' attribute for host", "set.host.attr", [
+				hostname, "attr=discovery.install", f"value={self._install}"
+			]),
 
-			if result.returncode != 0:
-				self._logger.error("failed to set 'discovery.install' attribute for host %s:\n%s", self.hostname, result.stderr)
+			# Set the new node to install on boot
+			("set boot action for host", "set.host.boot", [
+				hostname, "action=install"
+			]),
+		):
+			try:
+				self._command.command(command, args)
+			except CommandError as e:
+				self._logger.error("failed to %s %s:\n%s", description, hostname, e)
 				return
 
-			# Set the new node to install on boot
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "set", "host", "boot", self.hostname, "action=install"
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+		self._known_macs[mac_address] = time.time()
+		self._taken_ips.add(str(ip_address))
+
+		now = time.time()
+		if not self._pending:
+			self._first_added = now
+		self._last_added = now
+		self._pending.append({
+			'type': "add",
+			'interface': interface,
+			'mac_address': mac_address,
+			'ip_address': str(ip_address),
+			'hostname': hostname
+		})
+
+	def _sync_pending(self):
+		"""
+		Sync the global config and the config of the nodes added since the last sync, then
+		post their host added messages.
+		"""
 
-			if result.returncode != 0:
-				self._logger.error("failed to set boot action for host %s:\n%s", self.hostname, result.stderr)
-				return
+		pending = self._pending
+		self._pending = []
 
-			# Sync the global config
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "sync", "config"
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+		# Sync the global config
+		result = subprocess.run([
+			"/opt/stack/bin/stack", "sync", "config"
+		], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
 
-			if result.returncode != 0:
-				self._logger.error("unable to sync global config:\n%s", result.stderr)
-				return
+		if result.returncode != 0:
+			self._logger.error("unable to sync global config:\n%s", result.stderr)
+			self._retry_pending(pending)
+			return
 
-			# Sync the host config
-			result = subprocess.run([
-				"/opt/stack/bin/stack", "sync", "host", "config", self.hostname
-			], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+		# Sync the host config
+		hostnames = [payload['hostname'] for payload in pending]
+		result = subprocess.run([
+			"/opt/stack/bin/stack", "sync", "host", "config", *hostnames
+		], stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
 
-			if result.returncode != 0:
-				self._logger.error("unable to sync host config:\n%s", result.stderr)
-				return
+		if result.returncode != 0:
+			self._logger.error("unable to sync host config:\n%s", result.stderr)
+			self._retry_pending(pending)
+			return
 
-			self._logger.info("successfully added host %s", self.hostname)
+		for payload in pending:
+			self._logger.info("successfully added host %s", payload['hostname'])
 
 			# Post the host added message
 			message = json.dumps({
 				'channel': "discovery",
-				'payload': {
-					'type': "add",
-					'interface': interface,
-					'mac_address': mac_address,
-					'ip_address': str(ip_address),
-					'hostname': self.hostname
-				}
+				'payload': payload
 			})
 
 			self._socket.sendto(message.encode(), ("localhost", stack.mq.ports.publish))
-		else:
-			self._logger.error("no network exists for interface %s", interface)
+
+	def _retry_pending(self, pending):
+		"""
+		Put the nodes of a failed sync back in front of the ones added since, to be synced
+		again after the sync delay.
+		"""
+
+		self._pending = pending + self._pending
+		self._first_added = self._last_added = time.time()
+
+	async def _sync_config(self):
+		# Wait for a pause in the nodes being added, then sync them all at once
+		while not self._done:
+			await asyncio.sleep(1)
+
+			now = time.time()
+			if self._pending and (
+				now - self._last_added >= self._SYNC_DELAY or
+				now - self._first_added >= self._SYNC_MAX_DELAY
+			):
+				self._sync_pending()
+
+		# Don't leave any nodes unsynced when stopping
+		if self._pending:
+			self._sync_pending()
 
 	def _process_dhcp_line(self, line):
 		# See if we are a DHCPDISCOVER message
@@ -246,11 +358,8 @@ class Discovery:
 			self._logger.info("detected a dhcp request: %s %s", mac_address, interface)
 
 			# Is this a new MAC address?
-			self._command.db.clearCache()
-			for row in self._command.call("list.host.interface"):
-				if row['mac'] == mac_address:
-					self._logger.debug("node is already known: %s %s", mac_address, interface)
-					break
+			if self._is_known_mac_address(mac_address):
+				self._logger.debug("node is already known: %s %s", mac_address, interface)
 			else:
 				self._logger.info("found a new node: %s %s", mac_address, interface)
 
@@ -341,6 +450,16 @@ class Discovery:
 		self._logger.setLevel(logging_level)
 		self._logger.addHandler(handler)
 
+		# The host interfaces, see _load_interfaces
+		self._known_macs = {}
+		self._taken_ips = set()
+		self._interfaces_loaded = 0
+
+		# The nodes added but not synced yet, see _sync_config
+		self._pending = []
+		self._first_added = 0
+		self._last_added = 0
+
 	def is_running(self):
 		"Check if the daemon is running."
 
@@ -484,7 +603,8 @@ class Discovery:
 			try:
 				loop.run_until_complete(asyncio.gather(
 					self._monitor_log("/var/log/messages", self._process_dhcp_line),
-					self._monitor_log(kickstart_log, self._process_kickstart_line)
+					self._monitor_log(kickstart_log, self._process_kickstart_line),
+					self._sync_config()
 				))
 			except:
 				self._logger.exception("event loop threw an exception")
@@ -8,6 +8,13 @@
 
 
 class ProfileBase:
+        """
+        Base class of the profile-os modules. The pre and post methods
+        run in the profile service as the request arrives and leaves,
+        the main method runs in one of the service's workers. Any of
+        them can answer the request with client.reply or client.error,
+        pre answering ends the request before it is queued.
+        """
 
         def pre(self, client):
                 pass
@@ -7,9 +7,6 @@
 # @copyright@
 
 
-import sys
-import stack.api
-import subprocess
 import profile
 
 
@@ -21,10 +18,7 @@ class Profile(profile.ProfileBase):
 		# This means only a root user can request a kickstart file
 
 		if client.port > 1023:
-			print("Content-type: text/html")
-			print("Status: 401 Unauthorized\n")
-			print("<h1>Unauthorized</h1>")
-			sys.exit(1)
+			client.error('401 Unauthorized', 'Unauthorized')
 
 
 	def main(self, client):
@@ -33,7 +27,7 @@ class Profile(profile.ProfileBase):
 		# get the avalanche attributes
 		#
 
-		result = stack.api.Call('list host attr', [ client.addr ])
+		result = client.call('list host attr', [ client.addr ])
 		attrs  = {}
 		for dict in result:
 			if dict['attr'] in [
@@ -48,25 +42,16 @@ class Profile(profile.ProfileBase):
 			attrs['pkgservers'] = attrs['Kickstart_PrivateKickstartHost']
 
 
-		p = subprocess.run(['/opt/stack/bin/stack', 'list', 'host', 'xml', client.addr ],
-				   stdout=subprocess.PIPE,
-				   stderr=subprocess.PIPE)
-		rc  = p.returncode
-		doc = [ ]
+		try:
+			xml = client.command('list host xml', [ client.addr ])
+		except Exception as e:
+			client.reply('500 Server Error', str(e), [
+				('Content-type', 'text/html'),
+				('Retry-After', '60') ])
+			return
 
-		if rc == 0:
-			doc.append('Content-type: application/octet-stream')
-			doc.append('Content-length: %d' % len(p.stdout))
-			doc.append('X-Avalanche-Trackers: %s' % (attrs['trackers']))
-			doc.append('X-Avalanche-Pkg-Servers: %s' % (attrs['pkgservers']))
-			doc.append('')
-			doc.append(p.stdout.decode())
-		else:
-			doc.append('Content-type: text/html')
-			doc.append('Status: 500 Server Error')
-			doc.append('Retry-After: 60')
-			doc.append('')
-			doc.append(p.stderr.decode())
-		
-		print('\n'.join(doc))
+		client.reply('200 OK', xml, [
+			('Content-type', 'application/octet-stream'),
+			('X-Avalanche-Trackers', attrs['trackers']),
+			('X-Avalanche-Pkg-Servers', attrs['pkgservers']) ])
 		
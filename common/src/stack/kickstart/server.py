@@ -0,0 +1,415 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# @rocks@
+# Copyright (c) 2000 - 2010 The Regents of the University of California
+# All rights reserved. Rocks(r) v5.4 www.rocksclusters.org
+# https://github.com/Teradata/stacki/blob/master/LICENSE-ROCKS.txt
+# @rocks@
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import syslog
+import threading
+import multiprocessing
+import concurrent.futures
+from urllib.parse import parse_qs
+import stack.mq
+import stack.bool
+
+
+class Client:
+	"""
+	Metadata for the calling client, this is always passed to
+	the profile-os module to generate the installer script.
+
+	The client is created by the service from the WSGI environment
+	of the request and is sent to a worker to generate the profile,
+	so it must stay picklable. In the worker it runs stack commands
+	in-process with call() and command().
+	"""
+
+	def __init__(self, environ):
+		form = parse_qs(environ.get('QUERY_STRING', ''))
+
+		self.addr = environ.get('REMOTE_ADDR')
+		self.port = int(environ.get('REMOTE_PORT', 0))
+		self.arch = form.get('arch', [ None ])[0]
+		self.np	  = form.get('np', [ None ])[0]
+		self.os	  = form.get('os', [ None ])[0]
+
+		# The interfaces reported by the installer as
+		# (interface, mac, module, flag) tuples.
+
+		self.interfaces = []
+		for key in sorted(environ):
+			if re.match('HTTP_X_RHN_PROVISIONING_MAC_[0-9]+$', key):
+				devinfo = environ[key].split()
+				if len(devinfo) < 2:
+					continue
+				self.interfaces.append((
+					devinfo[0],
+					devinfo[1].lower(),
+					devinfo[2] if len(devinfo) > 2 else '',
+					'ks' if len(devinfo) > 3 else ''))
+
+		self.interactive = 0
+		self.response	 = None
+		self.caller	 = None
+
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		state['caller'] = None
+		return state
+
+	def getProfile(self):
+		"""
+		Returns the profile-os object for the client's OS, or None
+		if the OS is not supported.
+		"""
+
+		try:
+			osModule = __import__('profile.%s' % self.os)
+			osClass	 = getattr(osModule, self.os).Profile
+		except (ImportError, AttributeError):
+			return None
+		return osClass()
+
+	def reply(self, status, body='', headers=[]):
+		"""
+		Answers the request with the STATUS line, BODY, and list of
+		(header, value) HEADERS. The first reply wins.
+		"""
+
+		if self.response is None:
+			if isinstance(body, str):
+				body = body.encode()
+			self.response = (status, list(headers), body)
+
+	def error(self, status, message, retry=None):
+		headers = [ ('Content-type', 'text/html') ]
+		if retry:
+			headers.append(('Retry-After', '%d' % retry))
+		self.reply(status, '<h1>%s</h1>\n' % message, headers)
+
+	def call(self, command, args=[]):
+		"""
+		Runs a stack command in the worker and returns its output
+		as a list of dictionaries, or [] if the command failed.
+		"""
+
+		try:
+			return self.caller.call(command.replace(' ', '.'), args)
+		except Exception as e:
+			syslog.syslog(syslog.LOG_ERR, '%s %s: %s' % (command, ' '.join(args), e))
+			return []
+
+	def command(self, command, args=[]):
+		"""
+		Runs a stack command in the worker and returns its text
+		output. Errors are raised to the caller.
+		"""
+
+		return self.caller.command(command.replace(' ', '.'), args)
+
+	def status(self, message):
+		if self.interactive == 1:
+			return
+
+		msg = { 'source' : self.addr,
+			'channel': 'health',
+			'payload': '{"state": "%s"}' % message }
+
+		tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		tx.sendto(json.dumps(msg).encode(),
+			  ('127.0.0.1', stack.mq.ports.publish))
+		tx.close()
+
+
+##
+## Worker
+##
+
+_caller = None
+
+
+def startWorker():
+	"""
+	Prepares a worker process: the stack commands are imported and a
+	database connection is opened once, then reused for every profile
+	the worker generates.
+	"""
+
+	global _caller
+
+	import stack.commands
+	import stack.commands.list.host.xml
+
+	syslog.openlog('profile', syslog.LOG_PID, syslog.LOG_LOCAL0)
+	_caller = stack.commands.Command(stack.commands.get_mysql_connection())
+
+
+def generate(client):
+	"""
+	Updates the database with what the installer told us about the
+	host, then runs the profile-os main method. Returns the response
+	and the time spent.
+	"""
+
+	t0 = time.time()
+
+	# The connection may have sat idle since the last profile, and
+	# other processes have written the database since, so nothing
+	# the select cache holds can be trusted.
+
+	if _caller.db.database:
+		_caller.db.database.ping(reconnect=True)
+	_caller.db.clearCache()
+	client.caller = _caller
+
+	try:
+		generateProfile(client)
+	except Exception as e:
+		syslog.syslog(syslog.LOG_ERR, 'profile %s failed: %s' % (client.addr, e))
+		client.error('500 Server Error', 'Profile Error', retry=60)
+
+	if client.response is None:
+		client.error('500 Server Error', 'No Profile', retry=60)
+
+	client.caller = None
+	return client.response, time.time() - t0
+
+
+def generateProfile(client):
+
+	#
+	# set some values in the database based on the web request
+	#
+	client.call('set host attr', [ client.addr, 'attr=arch', 'value=%s' % client.arch ])
+	client.call('set host attr', [ client.addr, 'attr=cpus', 'value=%s' % client.np ])
+
+	#
+	# update the MAC info in the database
+	#
+	# but there are certain cases in which you don't want the MACs updated -- in
+	# that case, set the attribute 'profile.update_macs' to 'false'.
+	#
+	output = client.call('list host attr', [ client.addr, 'attr=profile.update_macs' ])
+	if (not output or stack.bool.str2bool(output[0]['value'])) and client.interfaces:
+		#
+		# add all the detected network interfaces to the database
+		#
+		ifaces, macs, modules, flags = zip(*client.interfaces)
+		client.call('config host interface', [
+			client.addr,
+			'interface=%s' % ','.join(ifaces),
+			'mac=%s' % ','.join(macs),
+			'module=%s' % ','.join(modules),
+			'flag=%s' % ','.join(flags),
+			'sync=False' ])
+
+	# See if we are actually installing
+	output = client.call('list host attr', [ client.addr, 'attr=discovery.install' ])
+	if output and not stack.bool.str2bool(output[0]['value']):
+		# Signal to the node to shutdown
+		client.reply('204 No Content')
+
+		# Set the boot action back to os
+		client.call('set host boot', [ client.addr, 'action=os' ])
+
+		# Remove the discovery.install attribute
+		client.call('remove host attr', [ client.addr, 'attr=discovery.install' ])
+		return
+
+	# Generate the system profile
+	client.getProfile().main(client)
+
+
+##
+## Service
+##
+
+def serverThreads():
+	"""
+	Returns the number of threads of the mod_wsgi daemon process
+	running the service, or None outside of mod_wsgi.
+	"""
+
+	try:
+		import mod_wsgi
+		return mod_wsgi.threads_per_process
+	except (ImportError, AttributeError):
+		return None
+
+
+class ProfileService:
+	"""
+	WSGI application serving the installation profiles.
+
+	Profiles are generated by a pool of WORKERS processes (one per CPU
+	by default) that stay up between requests. Requests beyond what
+	the workers can take wait in an in-memory queue of up to BACKLOG
+	requests, and requests beyond that wait their turn to be queued
+	for up to TIMEOUT seconds before being told to retry. A mass
+	reinstall is served as fast as the workers go rather than in
+	waves of retries.
+
+	Every request holds a server thread, so the BACKLOG must be less
+	than the number of threads for requests to ever wait for it. By
+	default it leaves ReserveThreads of the threads to the requests
+	waiting for the backlog.
+	"""
+
+	ReserveThreads = 32
+
+	def __init__(self, workers=None, backlog=None, timeout=600,
+		     executable='/opt/stack/bin/python3'):
+		if backlog is None:
+			threads = serverThreads() or 256
+			backlog = max(threads - self.ReserveThreads, threads // 2, 1)
+
+		self.workers	= workers or os.cpu_count() or 8
+		self.backlog	= threading.BoundedSemaphore(backlog)
+		self.timeout	= timeout
+		self.executable = executable
+		self.pool	= None
+		self.pending	= 0
+		self.lock	= threading.Lock()
+
+		syslog.openlog('profile', syslog.LOG_PID, syslog.LOG_LOCAL0)
+
+	def getPool(self):
+		with self.lock:
+			if self.pool is None:
+				# Spawn, the service may be running inside
+				# a threaded server (e.g. mod_wsgi) that
+				# must not be forked.
+
+				context = multiprocessing.get_context('spawn')
+				if self.executable and os.path.exists(self.executable):
+					context.set_executable(self.executable)
+				self.pool = concurrent.futures.ProcessPoolExecutor(
+					max_workers=self.workers,
+					mp_context=context,
+					initializer=startWorker)
+			return self.pool
+
+	def resetPool(self, pool):
+		with self.lock:
+			if self.pool is pool:
+				self.pool = None
+		pool.shutdown(wait=False)
+
+	def submit(self, client):
+		"""
+		Runs generate(CLIENT) in a worker. Returns the response
+		and the time it spent in the worker.
+		"""
+
+		pool = self.getPool()
+		try:
+			return pool.submit(generate, client).result()
+		except concurrent.futures.process.BrokenProcessPool:
+			# A worker died, start over with a new pool for
+			# the requests that follow.
+			self.resetPool(pool)
+			syslog.syslog(syslog.LOG_ERR, 'profile worker died serving %s' % client.addr)
+			client.error('500 Server Error', 'Profile Error', retry=60)
+			return client.response, 0.0
+
+	def serve(self, client):
+		"""
+		Returns the response to CLIENT and the time spent queued
+		and generating the profile.
+		"""
+
+		for field, pattern in (('arch', '[^a-zA-Z0-9_]+'), ('np', '[^0-9]+'), ('os', None)):
+			value = getattr(client, field)
+			if not value or (pattern and re.search(pattern, value)):
+				client.error('500 Internal Error', 'Invalid %s field' % field)
+				client.status('install profile error (Invalid %s field)' % field)
+				return client.response, 0.0, 0.0
+
+		profile = client.getProfile()
+		if not profile:
+			client.error('500 Internal Error', 'Unsupported OS')
+			return client.response, 0.0, 0.0
+
+		client.status('install profile request')
+		profile.pre(client)
+		if client.response:
+			return client.response, 0.0, 0.0
+
+		t0 = time.time()
+		if not self.backlog.acquire(timeout=self.timeout):
+			client.error('503 Service Busy', 'Service is Busy', retry=15)
+			client.status('install profile retry')
+			return client.response, time.time() - t0, 0.0
+
+		with self.lock:
+			self.pending += 1
+		try:
+			response, generating = self.submit(client)
+		finally:
+			with self.lock:
+				self.pending -= 1
+			self.backlog.release()
+
+		client.response = response
+		profile.post(client)
+		client.status('install profile sent')
+
+		return client.response, time.time() - t0 - generating, generating
+
+	def __call__(self, environ, start_response):
+		t0	= time.time()
+		client	= Client(environ)
+
+		response, queued, generating = self.serve(client)
+		status, headers, body = response
+
+		headers = headers + [ ('Content-length', '%d' % len(body)) ]
+		start_response(status, headers)
+
+		syslog.syslog(syslog.LOG_INFO,
+			      'request %s:%s %s queued %.3fs generated %.3fs total %.3fs pending %d' %
+			      (client.addr, client.port, status.split()[0],
+			       queued, generating, time.time() - t0, self.pending))
+
+		return [ body ]
+
+
+application = ProfileService()
+
+
+if __name__ == '__main__':
+
+	# Generate a profile for the frontend on the command line,
+	# for debugging.
+
+	environ = {
+		'REMOTE_ADDR'  : '127.0.0.1',
+		'REMOTE_PORT'  : '0',
+		'QUERY_STRING' : 'os=%s&arch=x86_64&np=1' % (sys.argv[1] if len(sys.argv) == 2 else 'redhat')
+	}
+
+	client = Client(environ)
+	client.interactive = 1
+	response, queued, generating = ProfileService(workers=1).serve(client)
+	status, headers, body = response
+
+	print('Status: %s' % status)
+	for header, value in headers:
+		print('%s: %s' % (header, value))
+	print()
+	sys.stdout.flush()
+	sys.stdout.buffer.write(body)
@@ -6,18 +6,15 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE.txt
 # @copyright@
 
-import subprocess
 import profile
-import os
-import re
-import stack.api
+import stack.bool
 
 class Profile(profile.ProfileBase):
-	def set_mac_interface(self, host, mac, interface):
-		stack.api.Call('set.host.interface.interface', [ host,
+	def set_mac_interface(self, client, host, mac, interface):
+		client.call('set.host.interface.interface', [ host,
 			'mac=%s' % mac, 'interface=%s' % interface ])
 
-	def process_next_mac(self, host, macs, lastmac, deviceid):
+	def process_next_mac(self, client, host, macs, lastmac, deviceid):
 		#
 		# convert the lastmac string into an integer. we'll use this to find the 'next' mac
 		#
@@ -36,30 +33,25 @@ class Profile(profile.ProfileBase):
 		if not foundmac:
 			foundmac = macs[0]
 
-		self.set_mac_interface(host, foundmac, 'eth%d' % deviceid)
+		self.set_mac_interface(client, host, foundmac, 'eth%d' % deviceid)
 
 		macs.remove(foundmac)
 		return macs, foundmac
 
-	def force_eth0(self, host):
+	def force_eth0(self, client, host):
 		#
 		# collect only the ethernet devices
 		#
 		macs = []
-		for i in os.environ:
-			if re.match('HTTP_X_RHN_PROVISIONING_MAC_[0-9]+', i):
-				devinfo = os.environ[i].split()
-				iface	= devinfo[0]
-				macaddr = devinfo[1].lower()
-
-				if len(macaddr.split(':')) == 6 and iface != 'ipmi':
-					macs.append(macaddr)
+		for iface, macaddr, module, flag in client.interfaces:
+			if len(macaddr.split(':')) == 6 and iface != 'ipmi':
+				macs.append(macaddr)
 
 		#
 		# in the database, find the interface that is mapped to the 'primary' network
 		#
 		lastmac = None
-		for o in stack.api.Call('list.host.interface', [ host ]):
+		for o in client.call('list.host.interface', [ host ]):
 			if o['network'] == 'primary':
 				if o['interface'] == 'eth0':
 					#
@@ -67,7 +59,7 @@ class Profile(profile.ProfileBase):
 					#
 					return
 				else:
-					self.set_mac_interface(host, o['mac'], 'eth0')
+					self.set_mac_interface(client, host, o['mac'], 'eth0')
 					lastmac = o['mac']
 					macs.remove(lastmac)
 					break
@@ -78,11 +70,11 @@ class Profile(profile.ProfileBase):
 		deviceid = 1
 
 		while (macs):
-			macs, lastmac = self.process_next_mac(host, macs, lastmac, deviceid)
+			macs, lastmac = self.process_next_mac(client, host, macs, lastmac, deviceid)
 			deviceid += 1
 
 	def main(self, client):
-		output = stack.api.Call('list host attr',
+		output = client.call('list host attr',
 			[ client.addr, 'attr=profile.force_eth0' ])
 
 		if output:
@@ -90,27 +82,17 @@ class Profile(profile.ProfileBase):
 
 			if 'value' in row and stack.bool.str2bool(row['value']):
 				try:
-					self.force_eth0(client.addr)
+					self.force_eth0(client, client.addr)
 				except:
 					pass
 
-		p = subprocess.run(['/opt/stack/bin/stack', 'list', 'host', 'xml', client.addr ],
-				   stdout=subprocess.PIPE,
-				   stderr=subprocess.PIPE)
-		rc  = p.returncode
-		doc = [ ]
-
-		if rc == 0:
-			doc.append('Content-type: application/octet-stream')
-			doc.append('Content-length: %d' % len(p.stdout))
-			doc.append('')
-			doc.append(p.stdout.decode())
-		else:
-			doc.append('Content-type: text/html')
-			doc.append('Status: 500 Server Error')
-			doc.append('Retry-After: 60')
-			doc.append('')
-			doc.append(p.stderr.decode())
-		
-		print('\n'.join(doc))
-		
+		try:
+			xml = client.command('list host xml', [ client.addr ])
+		except Exception as e:
+			client.reply('500 Server Error', str(e), [
+				('Content-type', 'text/html'),
+				('Retry-After', '60') ])
+			return
+
+		client.reply('200 OK', xml, [
+			('Content-type', 'application/octet-stream') ])
@@ -1,11 +1,16 @@
 #!/opt/stack/bin/python3
 
 from flask import Flask, request, jsonify, send_from_directory, render_template, redirect
+from werkzeug.utils import safe_join
 from urllib.request import unquote
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 import os
+import json
 import requests
 import hashlib
-import subprocess
+import tempfile
+import threading
 import click
 import logging
 from logging import FileHandler
@@ -24,11 +29,23 @@ client_settings = {
 	'PORT' : 80,
 	'LOCAL_SAVE_LOCATION' : '',
 	'ENVIRONMENT' : 'regular',
-	'SAVE_FILES' : True
+	'SAVE_FILES' : True,
+	'PIECE_WORKERS' : 4
 }
 
 timed_out_hosts = []
 
+# Times the missing pieces of a file are requested before the whole
+# file is requested instead
+PIECE_ATTEMPTS = 3
+
+# Largest piece served to a peer, the piece size of the tracker
+PIECE_SIZE = 4 * 1024 * 1024
+
+# One download of a file at a time
+file_locks = defaultdict(threading.Lock)
+file_locks_lock = threading.Lock()
+
 
 @app.errorhandler(404)
 def four_o_four(error=None):
@@ -49,12 +66,21 @@ def hashit(filename):
 	hashcode.update(filename.encode('utf-8'))
 	return hashcode.hexdigest()
 
-# Save the file locally
-def save_file(content, location, filename):
+# Save the file locally, streaming the body of the response to a
+# temporary file that is renamed into place once complete
+def save_file(response, location, filename):
 	try:
-		subprocess.call(['mkdir', '-p', location])
-		with open(location + filename, 'wb') as f:
-			f.write(content)
+		os.makedirs(location, exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=location, prefix='.%s.' % filename)
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				for chunk in response.iter_content(chunk_size=1024 * 1024):
+					f.write(chunk)
+			os.chmod(tmp, 0o644)
+			os.rename(tmp, location + filename)
+		except:
+			os.unlink(tmp)
+			raise
 	except:
 		app.logger.info("save_file: Error saving file")
 		raise
@@ -71,21 +97,37 @@ def tracker():
 # Lookup a file to see if any hosts have it
 # Input is the md5 of the filename
 # returns a list of hosts
-def lookup_file(hashcode):
+# If partial is True hosts that are still downloading the file are
+# included, in the partial list
+def lookup_file(hashcode, partial=False):
 	try:
 		# timeout=(connect timeout, read timeout).
-		res = requests.get('http://%s/ludicrous/lookup/%s' % (tracker(), hashcode), timeout=(0.1, 5))
+		res = requests.get('http://%s/ludicrous/lookup/%s' % (tracker(), hashcode),
+				   params={'partial': 1} if partial else None, timeout=(0.1, 5))
 		return res
 	except:
 		raise
 
+# Lookup the pieces of a file on the tracking server
+# returns the size of the file, the size of the pieces and the sha256
+# of each piece, or None if the file can't be split
+def lookup_pieces(remote_file):
+	try:
+		res = requests.get('http://%s/ludicrous/pieces%s' % (tracker(), remote_file), timeout=(0.1, 30))
+		payload = res.json()
+		if res.status_code == 200 and payload['success']:
+			return payload
+	except:
+		app.logger.debug('lookup_pieces: No pieces for %s.' % remote_file)
+	return None
+
 # Get a file from a host
 def get_file(peer, remote_file):
 	_counter = 0
 	while _counter < 3:
 		try:
 			# timeout=(connect timeout, read timeout).
-			res = requests.get('http://%s%s' % (peer, remote_file), timeout=(0.1, 5))
+			res = requests.get('http://%s%s' % (peer, remote_file), timeout=(0.1, 5), stream=True)
 			return res
 		except requests.ConnectTimeout:
 			app.logger.debug('get_file: Connect Timeout. Retrying.')
@@ -97,8 +139,9 @@ def get_file(peer, remote_file):
 		_counter += 1
 
 
-# Register a file for a host on the frontend
-def register_file(port, hashcode):
+# Register a file for a host on the frontend, if partial is True the
+# host only has some pieces of the file
+def register_file(port, hashcode, partial=False):
 	_counter = 0
 	while _counter < 3:
 		try:
@@ -106,6 +149,7 @@ def register_file(port, hashcode):
 									tracker(),
 									port,
 									hashcode)
+									, params={'partial': 1} if partial else None
 									, timeout=(0.1, 5))
 			break
 		except requests.ConnectTimeout:
@@ -153,6 +197,163 @@ def unregister_host(host):
 
 		_counter += 1
 
+# The pieces of local_file downloaded so far, from the .pieces file
+# kept next to the .part file. Nothing is kept if the pieces of the
+# file have changed since.
+def read_pieces(local_file, manifest=None):
+	try:
+		with open('%s.pieces' % local_file) as f:
+			state = json.load(f)
+		if manifest is None or all(state[key] == manifest[key] for key in ('size', 'piece_size', 'pieces')):
+			return state
+	except:
+		pass
+	return None
+
+# Remove what is left of a download in pieces once the whole file is
+# in place
+def remove_pieces(local_file):
+	for leftover in ('%s.part' % local_file, '%s.pieces' % local_file):
+		try:
+			os.unlink(leftover)
+		except OSError:
+			pass
+
+def write_pieces(local_file, manifest, done):
+	state = {key: manifest[key] for key in ('size', 'piece_size', 'pieces')}
+	state['done'] = sorted(done)
+	tmp = '%s.pieces.tmp' % local_file
+	with open(tmp, 'w') as f:
+		json.dump(state, f)
+	os.rename(tmp, '%s.pieces' % local_file)
+
+# Get one piece of a file, trying the peers in turn and then the
+# frontend. Returns the content of the piece once its hash matches.
+def get_piece(manifest, index, peers, remote_file):
+	piece_size = manifest['piece_size']
+	start = index * piece_size
+	end = min(start + piece_size, manifest['size']) - 1
+
+	# Spread the pieces over the peers
+	if peers:
+		peers = peers[index % len(peers):] + peers[:index % len(peers)]
+
+	for peer in peers + [None]:
+		try:
+			if peer:
+				res = requests.get('http://%s/piece/%d%s' % (peer, index, remote_file),
+						   params={'piece_size': piece_size}, timeout=(0.1, 5))
+			else:
+				res = requests.get('http://%s%s' % (tracker_settings['TRACKER'], remote_file),
+						   headers={'Range': 'bytes=%d-%d' % (start, end)}, timeout=(0.1, 5))
+				if res.status_code == 200 and len(res.content) == manifest['size']:
+					# The server ignored the range
+					res._content = res.content[start:end + 1]
+					res.status_code = 206
+
+			if res.status_code in (200, 206) and \
+			   hashlib.sha256(res.content).hexdigest() == manifest['pieces'][index]:
+				return res.content
+
+			app.logger.debug('get_piece: piece %d from %s was unsuccessful', index, peer or 'frontend')
+		except requests.ConnectTimeout:
+			app.logger.debug('get_piece: Connect Timeout for %s.', peer or 'frontend')
+		except requests.ConnectionError:
+			app.logger.debug('get_piece: Connection Error for %s.', peer or 'frontend')
+		except:
+			app.logger.info('get_piece: Error getting piece %d from %s.', index, peer or 'frontend')
+
+	return None
+
+# Download a file in pieces, from several peers at once. The pieces are
+# written to a .part file as they arrive and recorded in a .pieces
+# file, so an interrupted download starts over where it left off and
+# other hosts can fetch the completed pieces from this one. Returns
+# True once the whole file is in place.
+def get_file_in_pieces(manifest, remote_file, local_file, hashcode):
+	port = client_settings['PORT']
+	part_file = '%s.part' % local_file
+	count = len(manifest['pieces'])
+
+	state = read_pieces(local_file, manifest)
+	done = set(state['done']) if state and os.path.exists(part_file) else set()
+
+	os.makedirs(os.path.dirname(local_file), exist_ok=True)
+	fd = os.open(part_file, os.O_RDWR | os.O_CREAT, 0o644)
+	try:
+		os.ftruncate(fd, manifest['size'])
+		write_pieces(local_file, manifest, done)
+		register_file(port, hashcode, partial=True)
+
+		peers = []
+		try:
+			res = lookup_file(hashcode, partial=True)
+			payload = res.json()
+			if res.status_code == 200 and payload['success']:
+				peers = payload['peers'] + payload.get('partial', [])
+		except:
+			pass
+		peers = [peer for peer in peers if peer not in timed_out_hosts]
+
+		lock = threading.Lock()
+		def fetch(index):
+			content = get_piece(manifest, index, peers, remote_file)
+			if content is None:
+				return
+			os.pwrite(fd, content, index * manifest['piece_size'])
+			with lock:
+				done.add(index)
+				write_pieces(local_file, manifest, done)
+
+		todo = [index for index in range(count) if index not in done]
+		app.logger.info("requesting %d of %d pieces of %s from %d peers", len(todo), count, remote_file, len(peers))
+		with ThreadPoolExecutor(client_settings['PIECE_WORKERS']) as pool:
+			list(pool.map(fetch, todo))
+
+		if len(done) < count:
+			return False
+
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+	os.rename(part_file, local_file)
+	remove_pieces(local_file)
+	register_file(port, hashcode)
+	return True
+
+
+# Serve a piece of a file to a peer, from the file or from the pieces
+# downloaded so far
+@app.route('/piece/<int:index>/install/<path:path>/<filename>')
+def get_piece_locally(index, path, filename):
+	save_location = client_settings['LOCAL_SAVE_LOCATION']
+	local_file = safe_join(save_location, 'install', path, filename)
+	piece_size = request.args.get('piece_size', type=int)
+
+	if not local_file or not piece_size or not 0 < piece_size <= PIECE_SIZE:
+		return four_o_four()
+
+	if file_exists(local_file):
+		source = local_file
+	else:
+		state = read_pieces(local_file)
+		if not state or state['piece_size'] != piece_size or index not in state['done']:
+			return four_o_four()
+		source = '%s.part' % local_file
+
+	try:
+		with open(source, 'rb') as f:
+			f.seek(index * piece_size)
+			content = f.read(piece_size)
+	except OSError:
+		return four_o_four()
+
+	if not content:
+		return four_o_four()
+	return content, 200, {'Content-Type': 'application/octet-stream'}
+
+
 @app.route('/install/<path:path>/<filename>')
 def get_file_locally(path, filename):
 	save_location = client_settings['LOCAL_SAVE_LOCATION']
@@ -161,12 +362,42 @@ def get_file_locally(path, filename):
 	remote_file = '/install/%s/%s' % (path, filename)
 	hashcode = hashit(remote_file)
 	im_the_requester = request.remote_addr == "127.0.0.1"
-	environment = client_settings['ENVIRONMENT']
-	port = client_settings['PORT']
 
 	if not client_settings['SAVE_FILES']:
 		return redirect('http://%s%s' % (tracker_settings['TRACKER'], remote_file))
 
+	with file_locks_lock:
+		file_lock = file_locks[local_file]
+
+	with file_lock:
+		download_file(remote_file, file_location, filename, hashcode, im_the_requester)
+
+	if file_exists(local_file):
+		app.logger.info("%s is saved locally", (filename))
+		return send_from_directory(unquote(file_location), unquote(filename))
+	else:
+		app.logger.info("%s 404", (filename))
+		return redirect('http://%s%s' % (tracker_settings['TRACKER'], remote_file), code=307)
+
+
+# Get a file that isn't local, from the peers or else the frontend
+def download_file(remote_file, file_location, filename, hashcode, im_the_requester):
+	local_file = '%s/%s' % (file_location, filename)
+	port = client_settings['PORT']
+
+	# Large files are downloaded in pieces, from several peers at once
+	if client_settings['SAVE_FILES'] and im_the_requester and not file_exists(local_file):
+		for attempt in range(PIECE_ATTEMPTS):
+			# The pieces are looked up again on a retry, the file
+			# may have changed on the frontend
+			manifest = lookup_pieces(remote_file)
+			if not manifest or len(manifest['pieces']) <= 1:
+				break
+			if get_file_in_pieces(manifest, remote_file, local_file, hashcode):
+				break
+			app.logger.info("retrying the missing pieces of %s", filename)
+			sleep(1)
+
 	# check if file is local
 	if client_settings['SAVE_FILES'] and im_the_requester and not file_exists(local_file):
 
@@ -188,7 +419,8 @@ def get_file_locally(path, filename):
 				try:
 					peer_res = get_file(peer, remote_file)
 					if peer_res.status_code == 200:
-						save_file(peer_res.content, '%s/' % (file_location), filename)
+						save_file(peer_res, '%s/' % (file_location), filename)
+						remove_pieces(local_file)
 						app.logger.info("  %s from %s was successful", filename, peer)
 						register_file(port, hashcode)
 						break
@@ -211,9 +443,10 @@ def get_file_locally(path, filename):
 			app.logger.info("requesting %s from frontend", filename)
 			try:
 				# timeout=(connect timeout, read timeout).
-				tracker_res = requests.get('http://%s%s' % (tracker_settings['TRACKER'], remote_file), timeout=(0.1, 5))
+				tracker_res = requests.get('http://%s%s' % (tracker_settings['TRACKER'], remote_file), timeout=(0.1, 5), stream=True)
 				if tracker_res.status_code == 200:
-					save_file(tracker_res.content, '%s/' % (file_location), filename)
+					save_file(tracker_res, '%s/' % (file_location), filename)
+					remove_pieces(local_file)
 					if client_settings['SAVE_FILES']:
 						register_file(port, hashcode)
 				break
@@ -227,13 +460,6 @@ def get_file_locally(path, filename):
 				app.logger.info("Frontend Request: Error requesting %s from frontend" % filename)
 				sleep(1)
 
-	if file_exists(local_file):
-		app.logger.info("%s is saved locally", (filename))
-		return send_from_directory(unquote(file_location), unquote(filename))
-	else:
-		app.logger.info("%s 404", (filename))
-		return redirect('http://%s%s' % (tracker_settings['TRACKER'], remote_file), code=307)
-
 
 # catch all for returning static files
 # if the request is a directory, the the request will be redirected
@@ -2,8 +2,12 @@
 
 from flask import Flask, request, jsonify, send_from_directory, render_template, redirect
 from urllib.request import unquote
-from random import shuffle, randint
+from random import random, randint
 import os
+import json
+import time
+import threading
+import hashlib
 import logging
 from logging import FileHandler
 import redis
@@ -14,11 +18,33 @@ ludicredis = redis.StrictRedis(host=Redis.server)
 
 app = Flask(__name__)
 
-PEERS = set()
-
 MAX_PEERS = 3
 ROOT_DIR = "/var/www/html"
 
+# Peers are picked from this many random holders of a file, those on
+# the same switch first, then the same rack, then the least busy
+CANDIDATE_PEERS = 32
+
+# A peer is handed out for at most this many downloads a minute, unless
+# there is no other peer
+MAX_PEER_LOAD = 20
+
+# Seconds the rack and switch of the hosts are kept
+LOCALITY_TTL = 300
+
+# Redis keys, besides the ludicrous:<hashcode> set of the hosts with a
+# file (and ludicrous:<hashcode>:partial of those downloading it)
+PORTS_KEY = "ludicrous:ports"		# host -> port
+HOST_KEY = "ludicrous:host:%s"		# set of the file keys of a host
+LOAD_KEY = "ludicrous:load:%d"		# host -> downloads in a minute
+
+locality = {'time': 0, 'hosts': {}}
+locality_lock = threading.Lock()
+
+# Files are split into pieces of this size for the clients to
+# download from several peers at once
+PIECE_SIZE = 4 * 1024 * 1024
+
 
 @app.errorhandler(404)
 def four_o_four(error=None):
@@ -50,21 +76,115 @@ def lookup(hashcode):
 						     'source=%s' % ipaddr ])
 
 	# return list of peers with the request hash
-	res['peers'] = []
-	peers = list(ludicredis.smembers("ludicrous:%s" % hashcode))
-	shuffle(peers)
-	for peer in peers:
-		# only append a peer if it is not the requester
-		if ipaddr not in peer.decode():
-                        peer_port = ludicredis.smembers('%s:PORT' % ipaddr)
-                        if peer_port:
-                                res['peers'].append("%s:%s" % (peer.decode(), peer_port.pop().decode()))
-                        else:
-                                res['peers'].append("%s:%s" % (peer.decode(), '80'))		
-
-		# if array of peers is max_peers, break
-		if len(res['peers']) == MAX_PEERS:
-			break
+	res['peers'] = find_peers("ludicrous:%s" % hashcode, ipaddr)
+
+	# and the peers still downloading it, if asked for
+	if request.args.get('partial'):
+		res['partial'] = find_peers("ludicrous:%s:partial" % hashcode, ipaddr)
+
+	return jsonify(res)
+
+
+def get_locality():
+	"""
+	Returns a dictionary of the IP addresses of the hosts to their
+	rack and switch, as of at most LOCALITY_TTL seconds ago.
+	"""
+
+	with locality_lock:
+		if time.time() - locality['time'] > LOCALITY_TTL:
+			racks = {}
+			for row in stack.api.Call('list.host'):
+				racks[row['host']] = row['rack']
+
+			switches = {}
+			for row in stack.api.Call('list.switch.host'):
+				switches[row['host']] = row['switch']
+
+			hosts = {}
+			for row in stack.api.Call('list.host.interface'):
+				if row['ip']:
+					hosts[row['ip']] = (racks.get(row['host']), switches.get(row['host']))
+
+			locality['hosts'] = hosts
+			locality['time'] = time.time()
+
+		return locality['hosts']
+
+
+def find_peers(key, ipaddr):
+	"""
+	Returns up to MAX_PEERS "ip:port" of the hosts in the set KEY for
+	the host IPADDR to download from.
+	"""
+
+	candidates = [ peer.decode() for peer in ludicredis.srandmember(key, CANDIDATE_PEERS) ]
+	candidates = [ peer for peer in candidates if peer != ipaddr ]
+	if not candidates:
+		return []
+
+	load_key = LOAD_KEY % (time.time() // 60)
+	pipe = ludicredis.pipeline()
+	pipe.hmget(PORTS_KEY, candidates)
+	pipe.hmget(load_key, candidates)
+	ports, loads = pipe.execute()
+
+	hosts = get_locality()
+	rack, switch = hosts.get(ipaddr, (None, None))
+
+	def score(i):
+		peer_rack, peer_switch = hosts.get(candidates[i], (None, None))
+		load = int(loads[i] or 0)
+		if switch is not None and peer_switch == switch:
+			distance = 0
+		elif rack is not None and peer_rack == rack:
+			distance = 1
+		else:
+			distance = 2
+		return (load >= MAX_PEER_LOAD, distance, load, random())
+
+	chosen = sorted(range(len(candidates)), key=score)[:MAX_PEERS]
+
+	pipe = ludicredis.pipeline()
+	for i in chosen:
+		pipe.hincrby(load_key, candidates[i], 1)
+	pipe.expire(load_key, 120)
+	pipe.execute()
+
+	return [ "%s:%s" % (candidates[i], (ports[i] or b'80').decode()) for i in chosen ]
+
+
+@app.route('/pieces/<path:path>', methods=['GET'])
+def pieces(path):
+	"""
+	Returns the size of the file, the size of its pieces and the
+	sha256 of each piece. The hashes are kept until the file changes.
+	"""
+
+	filename = os.path.normpath(os.path.join(ROOT_DIR, path))
+	if not filename.startswith(ROOT_DIR + '/') or not os.path.isfile(filename):
+		return four_o_four()
+
+	st = os.stat(filename)
+	key = "ludicrous:pieces:%s" % filename
+
+	cached = ludicredis.get(key)
+	if cached:
+		res = json.loads(cached.decode())
+		if res['size'] == st.st_size and res['mtime'] == st.st_mtime:
+			return jsonify(res)
+
+	res = {}
+	res['success'] = True
+	res['size'] = st.st_size
+	res['mtime'] = st.st_mtime
+	res['piece_size'] = PIECE_SIZE
+	res['pieces'] = []
+	with open(filename, 'rb') as f:
+		for piece in iter(lambda: f.read(PIECE_SIZE), b''):
+			res['pieces'].append(hashlib.sha256(piece).hexdigest())
+
+	ludicredis.set(key, json.dumps(res))
 
 	return jsonify(res)
 
@@ -78,14 +198,20 @@ def register(port=80, hashcode=None):
 	if not hashcode:
 		return four_o_four()
 
-	# check if 
-	if ipaddr not in PEERS:
-		if not ludicredis.smembers("%s:PORT" % ipaddr):
-			ludicredis.sadd("%s:PORT" % ipaddr, "%s" % port)
-			PEERS.add(ipaddr)
+	pipe = ludicredis.pipeline()
+	pipe.hset(PORTS_KEY, ipaddr, port)
 
-	# Register Package
-	ludicredis.sadd("ludicrous:%s" % hashcode, "%s" % ipaddr)
+	# Register Package, a peer that only has some of the pieces
+	# is kept apart. The keys of the host are kept to unregister it.
+	if request.args.get('partial'):
+		pipe.sadd("ludicrous:%s:partial" % hashcode, ipaddr)
+		pipe.sadd(HOST_KEY % ipaddr, "ludicrous:%s:partial" % hashcode)
+	else:
+		pipe.sadd("ludicrous:%s" % hashcode, ipaddr)
+		pipe.srem("ludicrous:%s:partial" % hashcode, ipaddr)
+		pipe.sadd(HOST_KEY % ipaddr, "ludicrous:%s" % hashcode)
+		pipe.srem(HOST_KEY % ipaddr, "ludicrous:%s:partial" % hashcode)
+	pipe.execute()
 
 	return jsonify(res)
 
@@ -96,7 +222,11 @@ def unregister(hashcode):
 	res = {}
 	res['success'] = True
 
-	result = ludicredis.srem("ludicrous:%s" % hashcode, ipaddr)
+	pipe = ludicredis.pipeline()
+	pipe.srem("ludicrous:%s" % hashcode, ipaddr)
+	pipe.srem("ludicrous:%s:partial" % hashcode, ipaddr)
+	pipe.srem(HOST_KEY % ipaddr, "ludicrous:%s" % hashcode, "ludicrous:%s:partial" % hashcode)
+	result = pipe.execute()[0]
 	if result:
 		res['message'] = "'%s' was unregistered for hash: %s" % (ipaddr, hashcode)
 	else:
@@ -110,12 +240,13 @@ def peerdone():
 	res = {}
 	res['success'] = True
 
-	for package in ludicredis.scan_iter():
-		try:
-			ludicredis.srem(package, ipaddr)
-		except:
-			pass	
-		
+	# Only the files the host registered
+	pipe = ludicredis.pipeline()
+	for package in ludicredis.smembers(HOST_KEY % ipaddr):
+		pipe.srem(package, ipaddr)
+	pipe.delete(HOST_KEY % ipaddr)
+	pipe.execute()
+
 	return jsonify(res)
 
 @app.route('/status', methods=['GET'])
@@ -130,12 +261,10 @@ def purge_packages():
 	res['sucess'] = True
 	is_from_frontend = request.remote_addr == "127.0.0.1"
 	if is_from_frontend:
-		for package in ludicredis.scan_iter():
-			try:
-				if 'ludicrous' in package.decode():
-					result = ludicredis.delete(package)
-			except:
-				pass
+		pipe = ludicredis.pipeline()
+		for package in ludicredis.scan_iter(match='*ludicrous*', count=1000):
+			pipe.delete(package)
+		pipe.execute()
 	else:
 		res['success'] = False
 	
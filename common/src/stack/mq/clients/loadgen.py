@@ -0,0 +1,109 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Sends messages to a message queue publisher as fast as it can (or at
+# a given rate) while subscribed to the same channel, and reports the
+# rate the messages were sent and came back at every second, and how
+# many were lost.
+
+import sys
+import time
+import json
+import socket
+import getopt
+import threading
+import zmq
+import stack.mq
+
+
+class Counter(stack.mq.Subscriber):
+
+	def __init__(self, context, host, channel):
+		stack.mq.Subscriber.__init__(self, context, host)
+		self.channel  = channel
+		self.received = 0
+		self.subscribe(channel)
+
+	def callback(self, message):
+		if message.getChannel() == self.channel:
+			self.received += 1
+
+
+try:
+	opt, args = getopt.getopt(sys.argv[1:], 'c:h:r:s:t:')
+except getopt.GetoptError as err:
+	print('usage: [-c channel] [-h host] [-r rate] [-s size] [-t seconds]')
+	sys.exit(-1)
+
+channel = 'loadgen'
+host    = 'localhost'
+rate    = 0		# messages per second, 0 is as fast as possible
+size    = 100		# bytes of payload
+seconds = 10
+for o, a in opt:
+	if o == '-c':
+		channel = a
+	if o == '-h':
+		host = a
+	if o == '-r':
+		rate = int(a)
+	if o == '-s':
+		size = int(a)
+	if o == '-t':
+		seconds = int(a)
+
+context = zmq.Context()
+counter = Counter(context, host, channel)
+counter.setDaemon(True)
+counter.start()
+
+# Give the subscription time to reach the publisher
+time.sleep(1)
+
+tx  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+dst = (socket.gethostbyname(host), stack.mq.ports.publish)
+pkt = json.dumps({ 'channel': channel, 'payload': 'x' * size }).encode()
+
+print('%8s %12s %12s' % ('second', 'sent/s', 'received/s'))
+
+sent     = 0
+start    = time.time()
+second   = start
+samples  = []
+last     = (0, 0)
+while True:
+	now = time.time()
+	if now - second >= 1:
+		sample = (sent - last[0], counter.received - last[1])
+		print('%8d %12d %12d' % (len(samples) + 1, sample[0], sample[1]))
+		samples.append(sample)
+		last    = (sent, counter.received)
+		second += 1
+		if len(samples) == seconds:
+			break
+
+	if rate and sent >= (now - start) * rate:
+		time.sleep(min(1.0 / rate, 0.01))
+		continue
+
+	try:
+		tx.sendto(pkt, dst)
+		sent += 1
+	except OSError:
+		pass
+
+# Wait for the messages still in flight
+time.sleep(1)
+
+received = counter.received
+print()
+print('sent      %d (%d/s)' % (sent, sent / seconds))
+print('received  %d (%d/s sustained, %d/s slowest second)' % (
+	received, received / seconds, min(s[1] for s in samples)))
+print('lost      %d (%.2f%%)' % (sent - received,
+				 100.0 * (sent - received) / sent if sent else 0))
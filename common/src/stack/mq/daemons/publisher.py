@@ -8,6 +8,7 @@
 
 import os
 import sys
+import getopt
 import daemon
 import lockfile.pidlockfile
 import signal
@@ -18,19 +19,32 @@ import stack.mq
 
 class Publisher(stack.mq.Receiver):
 
-	def __init__(self, context, outPort):
+	def __init__(self, context, outPort, batch=1, delay=0.05):
 		stack.mq.Receiver.__init__(self)
 
 		self.channels = {}
 		self.pub = context.socket(zmq.PUB)
 		self.pub.bind('tcp://*:%d' % outPort)
 
+		# In batch mode (batch > 1) the messages of each channel
+		# are held for up to delay seconds, and sent batch at a
+		# time in one multipart send.
+
+		self.batch    = batch
+		self.delay    = delay
+		self.pending  = {}	# channel -> [ message text ]
+		self.oldest   = None
+		self.counters = stack.mq.Counters()
+		if self.batch > 1:
+			self.timeout = self.delay
+
 
 	def callback(self, message):
 		"""
 		Process incomming messages from the UDP receiver.
 		"""
 		channel = message.getChannel()
+		self.counters.add(channel, 'received')
 
 		# For each channel keep track of the last message
 		# ID and timestamp.
@@ -49,14 +63,24 @@ class Publisher(stack.mq.Receiver):
 
 		# Publish the message:
 		#
-		# <channel> stack.mq.Message
+		# <channel> stack.mq.Message [stack.mq.Message ...]
 		#   text	json
 
 		message.addHop().setChannel(None)
 
 		if 'STACKDEBUG' in os.environ:
 			print(channel, message)
-		self.pub.send_multipart((channel.encode(), str(message).encode()))
+
+		if channel not in self.pending:
+			self.pending[channel] = []
+		self.pending[channel].append(str(message))
+		if self.oldest is None:
+			self.oldest = time.time()
+
+		if len(self.pending[channel]) >= self.batch:
+			self.send(channel)
+		elif time.time() - self.oldest >= self.delay:
+			self.flush()
 
 		# If this is the first message for the given channel 
 		# send the list of channels over the smq channel to
@@ -69,22 +93,71 @@ class Publisher(stack.mq.Receiver):
 		# TODO: Think about how to be smarter here
 
 		if (num % 12) == 0:
-			message = stack.mq.Message({'type':'status', 'channels':self.channels},
+			self.flush()
+			message = stack.mq.Message({'type':'status', 
+						    'channels':self.channels,
+						    'counters':self.counters.get(),
+						    'overflow':self.overflow,
+						    'bad':self.bad},
 						   time=time.asctime())
 			self.pub.send_multipart(('smq'.encode(), str(message).encode()))
 
+	def send(self, channel):
+		"""
+		Publishes the pending messages of the channel. A PUB
+		socket silently drops what a slow subscriber has no room
+		for, so only failed sends are counted as dropped. The
+		datagrams lost before they were received are reported as
+		overflow in the status.
+		"""
+		messages = self.pending.pop(channel, [])
+		if not messages:
+			return
+		if not self.pending:
+			self.oldest = None
+
+		try:
+			self.pub.send_multipart([ channel.encode() ] + 
+						[ m.encode() for m in messages ])
+		except zmq.ZMQError:
+			self.counters.add(channel, 'dropped', len(messages))
+		else:
+			self.counters.add(channel, 'forwarded', len(messages))
+
+	def flush(self):
+		for channel in list(self.pending):
+			self.send(channel)
+		self.oldest = None
+
+	def idle(self):
+		self.flush()
+
 
 def Handler(signal, frame):
 	sys.exit(0)
 
 
+try:
+	opt, args = getopt.getopt(sys.argv[1:], 'b:d:')
+except getopt.GetoptError as err:
+	print('usage: [-b batch] [-d delay]')
+	sys.exit(-1)
+
+batch = 1
+delay = 0.05
+for o, a in opt:
+	if o == '-b':
+		batch = int(a)
+	if o == '-d':
+		delay = float(a)
+
 if 'STACKDEBUG' not in os.environ:
 	lock = lockfile.pidlockfile.PIDLockFile('/var/run/%s/%s.pid' % 
 						('smq-publisher', 'smq-publisher'))
 	daemon.DaemonContext(pidfile=lock).open()
 
 context   = zmq.Context()
-publisher = Publisher(context, stack.mq.ports.subscribe)
+publisher = Publisher(context, stack.mq.ports.subscribe, batch, delay)
 publisher.setDaemon(True)
 
 publisher.start()
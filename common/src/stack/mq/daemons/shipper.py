@@ -8,6 +8,8 @@
 
 import os
 import sys
+import time
+import getopt
 import socket
 import threading
 import signal
@@ -19,7 +21,11 @@ import stack.mq
 
 
 class Subscriber(stack.mq.Subscriber):
-	def __init__(self, context, host):
+
+	# Largest datagram sent in batch mode
+	MaxDatagram = 60000
+
+	def __init__(self, context, host, batch=1, delay=0.05):
 
 		addr = socket.gethostbyname(host)
 			
@@ -29,6 +35,19 @@ class Subscriber(stack.mq.Subscriber):
 		self.tx  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		self.dst = (addr, stack.mq.ports.publish)
 
+		# In batch mode (batch > 1) messages are held for up to
+		# delay seconds and shipped in one datagram carrying a
+		# json list of up to batch messages.
+
+		self.batch    = batch
+		self.delay    = delay
+		self.pending  = []	# (channel, message text)
+		self.size     = 0
+		self.oldest   = None
+		self.counters = stack.mq.Counters()
+		if self.batch > 1:
+			self.timeout = self.delay
+
 	def callback(self, message):
 		if message.getChannel() == 'smq':
 			smq = message.getPayload()
@@ -39,11 +58,45 @@ class Subscriber(stack.mq.Subscriber):
 			except:
 				pass
 		else:
-			message.addHop()
-			try:
-				self.tx.sendto(str(message).encode(), self.dst)
-			except: # ignore failed sends
-				pass
+			channel = message.getChannel()
+			self.counters.add(channel, 'received')
+			text = str(message.addHop())
+
+			if self.batch <= 1:
+				self.ship([ (channel, text) ], text.encode())
+				return
+
+			if self.pending and self.size + len(text) + 2 > self.MaxDatagram:
+				self.flush()
+			self.pending.append((channel, text))
+			self.size += len(text) + 2
+			if self.oldest is None:
+				self.oldest = time.time()
+
+			if len(self.pending) >= self.batch or \
+			   time.time() - self.oldest >= self.delay:
+				self.flush()
+
+	def ship(self, messages, pkt):
+		try:
+			self.tx.sendto(pkt, self.dst)
+		except: # ignore failed sends
+			counter = 'dropped'
+		else:
+			counter = 'forwarded'
+		for channel, text in messages:
+			self.counters.add(channel, counter)
+
+	def flush(self):
+		messages     = self.pending
+		self.pending = []
+		self.size    = 0
+		self.oldest  = None
+		if messages:
+			self.ship(messages, stack.mq.encodeBatch([ text for channel, text in messages ]))
+
+	def idle(self):
+		self.flush()
 
 
 class Controller(threading.Thread):
@@ -95,6 +148,9 @@ class Controller(threading.Thread):
 			elif c == 'status':
 				channels = self.channels +  list(subscriber.channels.keys())
 				self.rep.send_string("Enabled channels: %s" % ' '.join(channels))
+
+			elif c == 'counters':
+				self.rep.send_string(json.dumps(subscriber.counters.get()))
 			else:
 				self.rep.send_string('')
 
@@ -103,6 +159,20 @@ def Handler(signal, frame):
 	sys.exit(0)
 
 
+try:
+	opt, args = getopt.getopt(sys.argv[1:], 'b:d:')
+except getopt.GetoptError as err:
+	print('usage: [-b batch] [-d delay]')
+	sys.exit(-1)
+
+batch = 1
+delay = 0.05
+for o, a in opt:
+	if o == '-b':
+		batch = int(a)
+	if o == '-d':
+		delay = float(a)
+
 host = None
 try:
 	fin = open('/etc/sysconfig/stack-mq', 'r')
@@ -132,7 +202,7 @@ if 'STACKDEBUG' not in os.environ:
 
 
 context    = zmq.Context()
-subscriber = Subscriber(context, host)
+subscriber = Subscriber(context, host, batch, delay)
 controller = Controller(context, channels)
 subscriber.setDaemon(True)
 controller.setDaemon(True)
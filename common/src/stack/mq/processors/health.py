@@ -5,8 +5,13 @@
 # @copyright@
 
 import json
+import time
 import stack.api
 import stack.mq.processors
+try:
+	import redis
+except ModuleNotFoundError:
+	pass
 
 
 class ProcessorBase(stack.mq.processors.ProcessorBase):
@@ -16,15 +21,91 @@ class ProcessorBase(stack.mq.processors.ProcessorBase):
 	This is used to cache host information.
 	"""
 
+	# Seconds between reloads of the host map
+	HostsRefresh = 5 * 60
+
+	# Seconds the host:* keys live without a reload
+	HostsTTL = 60 * 60
+
+	def __init__(self, context, sock):
+		stack.mq.processors.ProcessorBase.__init__(self, context, sock)
+		self.hosts  = {}	# addr -> keys
+		self.loaded = 0
+
 	def isActive(self):
 		return self.redis
 
+	def loadHosts(self):
+		"""
+		Reloads the map of the IP addresses of all the hosts in the
+		cluster to their keys with two stack commands, and rewrites
+		the Redis keys of all the hosts in one pipeline.
+		"""
+
+		self.loaded = time.time()
+
+		hosts = {}
+		for row in stack.api.Call('list.host', [ 'expanded=true' ]):
+			hosts[row['host']] = row
+
+		addrs = {}
+		for row in stack.api.Call('list.host.interface'):
+			host = hosts.get(row['host'])
+			if host and row['ip'] and row['ip'] not in addrs:
+				addrs[row['ip']] = { 'id'  : host['id'],
+						     'addr': row['ip'],
+						     'rack': host['rack'],
+						     'rank': host['rank'] }
+		if not addrs:
+			# Keep what we had, try again next time
+			return
+
+		try:
+			p = self.redis.pipeline(transaction=False)
+			for addr, keys in addrs.items():
+				self.pipeKeys(p, keys)
+			p.execute()
+		except redis.exceptions.ConnectionError:
+			pass
+
+		self.hosts = addrs
+
+	def lookupHost(self, client):
+		"""
+		Looks up a single host by the address CLIENT, for addresses
+		not in the host map (e.g. 127.0.0.1).
+		"""
+
+		keys = None
+		for row in stack.api.Call('list.host', [ client, 'expanded=true' ]):
+			keys = { 'id'  : row['id'],
+				 'addr': client,
+				 'rack': row['rack'],
+				 'rank': row['rank'] }
+			try:
+				p = self.redis.pipeline(transaction=False)
+				self.pipeKeys(p, keys)
+				p.execute()
+			except redis.exceptions.ConnectionError:
+				pass
+
+		return keys
+
+	def pipeKeys(self, p, keys):
+		p.set('host:%s:id'   % keys['addr'], keys['id'],   ex=self.HostsTTL)
+		p.set('host:%s:addr' % keys['id'],   keys['addr'], ex=self.HostsTTL)
+		p.set('host:%s:rack' % keys['id'],   keys['rack'], ex=self.HostsTTL)
+		p.set('host:%s:rank' % keys['id'],   keys['rank'], ex=self.HostsTTL)
+
 	def updateHostKeys(self, client):
 		"""
-		Updates the Redis keys for a given host in the cluster.	 
-		If Redis does not know about the host the cluster database is inspected and
-		the keys are created with a one hour timeout.
-		If Redis already contains the keys the timeout is reset.
+		Returns the keys of a given host in the cluster.
+		The hosts are looked up in a map of all the hosts that is
+		reloaded from the cluster database every HostsRefresh
+		seconds, which also rewrites the Redis keys of all the
+		hosts with a one hour timeout.
+		Hosts not in the map are looked up on their own, and
+		remembered (even if unknown) until the next reload.
 		The following Redis keys are defined for the host::
 
 			host:ID:rack
@@ -36,34 +117,17 @@ class ProcessorBase(stack.mq.processors.ProcessorBase):
 		:type addr: string
 		:returns: dictionary with *id*, *addr*, *rack*, and *rank*
 		"""
-		keys = None
 
 		if not client:
 			client = '127.0.0.1'
 
-		id = self.getKey('host:%s:id' % client)
-		if id:
-			rack = self.getKey('host:%s:rack' % id)
-			rank = self.getKey('host:%s:rank' % id)
-			addr = self.getKey('host:%s:addr' % id)
-
-		if not id or not rack or not rank or not addr:
-			for row in stack.api.Call('list.host', [ client, 'expanded=true' ]):
-				id   = row['id']
-				rack = row['rack']
-				rank = row['rank']
-
-				self.setKey('host:%s:id'   % client, id,     60 * 60)
-				self.setKey('host:%s:addr' % id,     client, 60 * 60)
-				self.setKey('host:%s:rack' % id,     rack,   60 * 60)
-				self.setKey('host:%s:rank' % id,     rank,   60 * 60)
-		if id:
-			keys = { 'id'  : id,
-				 'addr': client,
-				 'rack': rack,
-				 'rank': rank }
+		if time.time() - self.loaded > self.HostsRefresh:
+			self.loadHosts()
 
-		return keys
+		if client not in self.hosts:
+			self.hosts[client] = self.lookupHost(client)
+
+		return self.hosts[client]
 
 
 
@@ -101,11 +165,17 @@ class Processor(ProcessorBase):
 			except ValueError:
 				health = { 'state': payload }
 
-			for component, state in health.items():
-				if ttl == -1:
-					ttl = None
-				self.setKey('host:%s:status:%s' % 
-					    (keys['id'], component), state, ttl)
+			if ttl == -1:
+				ttl = None
+
+			try:
+				p = self.redis.pipeline(transaction=False)
+				for component, state in health.items():
+					p.set('host:%s:status:%s' % 
+					      (keys['id'], component), state, ex=ttl)
+				p.execute()
+			except redis.exceptions.ConnectionError:
+				pass
 
 
 		return None
@@ -10,6 +10,8 @@ import json
 import socket
 import sys
 import os
+import re
+import struct
 
 # We need the "ports" class when we are inside the installer, but don't need to
 # setup and zmq based services. The alternative is to add zmq and dependencies
@@ -22,6 +24,11 @@ except ImportError:
 	pass
 
 
+# Not in the socket module, this is the value on Linux
+
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+
+
 
 class ports:
 	"""
@@ -56,8 +63,9 @@ class Message():
 		:param payload: body of message
 		:type payload: string
 
-		:param message: json representation of a Message
-		:type message: string
+		:param message: json representation of a Message, or the
+				already decoded dictionary
+		:type message: string or dict
 
 		:param channel: channel source or destination
 		:type channel: string
@@ -80,7 +88,9 @@ class Message():
 		:returns: a new :class:`Message`
 		"""
 
-		if message:
+		if isinstance(message, dict):
+			msg = message
+		elif message:
 			msg = json.loads(message)
 		else:
 			msg = {}
@@ -96,6 +106,11 @@ class Message():
 		self.source  = source  if source  else msg.get('source')
 		self.time    = time    if time    else msg.get('time')
 
+		# The json encoding of the payload, kept for as long as
+		# the payload does not change (see decodeMessages)
+
+		self.encoded = None
+
 		# Set default values for hops and ttl
 
 		if self.hops is None:
@@ -122,8 +137,6 @@ class Message():
 			d['channel'] = self.channel
 		if self.id is not None:
 			d['id'] = self.id
-		if self.payload:
-			d['payload'] = self.payload
 		if self.hops:
 			d['hops'] = self.hops
 		if self.ttl:
@@ -132,7 +145,21 @@ class Message():
 			d['source'] = self.source
 		if self.time:
 			d['time'] = self.time
-		return json.dumps(d)
+		text = json.dumps(d)
+
+		# The header fields change on every hop, the payload
+		# (which is most of the message) does not.  Encode it
+		# only once, or not at all for a received message that
+		# kept its json text, and splice it into the header.
+
+		if self.payload:
+			if self.encoded is None:
+				self.encoded = json.dumps(self.payload)
+			if d:
+				text = '%s, "payload": %s}' % (text[:-1], self.encoded)
+			else:
+				text = '{"payload": %s}' % self.encoded
+		return text
 
 
 	def getChannel(self):
@@ -165,6 +192,7 @@ class Message():
 		:type payload: string
 		"""
 		self.payload = payload
+		self.encoded = None
 		return self
 
 	def getHops(self):
@@ -244,6 +272,142 @@ class Message():
 
 
 
+class Counters:
+	"""
+	Per channel counts of the messages received, forwarded, and
+	dropped by a daemon.
+
+	Dropped messages are only the ones the daemon failed to send.
+	Neither the messages ZeroMQ discards for a subscriber at its
+	high-water mark (PUB sockets do not tell) nor the datagrams the
+	kernel discards before they are received (the *overflow* of a
+	:class:`Receiver`) are counted here.
+	"""
+
+	def __init__(self):
+		self.lock     = threading.Lock()
+		self.channels = {}
+
+	def add(self, channel, counter, n=1):
+		"""
+		Adds *n* to the *counter* ('received', 'forwarded', or
+		'dropped') of the *channel*.
+		"""
+		with self.lock:
+			if channel not in self.channels:
+				self.channels[channel] = { 'received' : 0,
+							   'forwarded': 0,
+							   'dropped'  : 0 }
+			self.channels[channel][counter] += n
+
+	def get(self):
+		"""
+		:returns: dictionary of channel names to their counters
+		"""
+		with self.lock:
+			return { c: dict(v) for c, v in self.channels.items() }
+
+
+_decoder    = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def _skip(text, idx):
+	return _whitespace.match(text, idx).end()
+
+
+def _decodeObject(text, idx):
+	"""
+	Decodes the json object starting at *text[idx]*.  Returns the
+	object, the json text of its payload (None if it has none), and
+	the index just past the object.
+	"""
+	obj     = {}
+	payload = None
+	idx     = _skip(text, idx + 1)
+	if text[idx:idx + 1] == '}':
+		return obj, payload, idx + 1
+
+	while True:
+		if text[idx:idx + 1] != '"':
+			raise ValueError('expecting a name at %d' % idx)
+		key, idx = json.decoder.scanstring(text, idx + 1)
+		idx = _skip(text, idx)
+		if text[idx:idx + 1] != ':':
+			raise ValueError('expecting ":" at %d' % idx)
+		start = _skip(text, idx + 1)
+		obj[key], idx = _decoder.raw_decode(text, start)
+		if key == 'payload':
+			payload = text[start:idx]
+
+		idx = _skip(text, idx)
+		c   = text[idx:idx + 1]
+		idx = _skip(text, idx + 1)
+		if c == '}':
+			return obj, payload, idx
+		if c != ',':
+			raise ValueError('expecting "," at %d' % idx)
+
+
+def decodeMessages(text, **fields):
+	"""
+	Returns the list of :class:`Message` objects in the json *text*,
+	either one message or a list of them (as sent by a daemon in batch
+	mode).  Elements of the list that are not messages are None.
+	Any *fields* are passed to every :class:`Message`.
+
+	The json text of each payload is kept in the :class:`Message`, so
+	forwarding the message does not encode the payload again.
+
+	:raises ValueError: *text* is not a json message or list
+	"""
+
+	def message(idx):
+		if text[idx:idx + 1] != '{':
+			value, idx = _decoder.raw_decode(text, idx)
+			return None, idx
+		obj, payload, idx = _decodeObject(text, idx)
+		msg = Message(message=obj, **fields)
+		if payload is not None and msg.payload is obj.get('payload'):
+			msg.encoded = payload
+		return msg, idx
+
+	msgs = []
+	idx  = _skip(text, 0)
+	if text[idx:idx + 1] == '[':
+		idx = _skip(text, idx + 1)
+		if text[idx:idx + 1] == ']':
+			idx += 1
+		else:
+			while True:
+				msg, idx = message(idx)
+				msgs.append(msg)
+				idx = _skip(text, idx)
+				c   = text[idx:idx + 1]
+				idx = _skip(text, idx + 1)
+				if c == ']':
+					break
+				if c != ',':
+					raise ValueError('expecting "," at %d' % idx)
+	elif text[idx:idx + 1] == '{':
+		msg, idx = message(idx)
+		msgs.append(msg)
+	else:
+		raise ValueError('expecting a json message')
+
+	if _skip(text, idx) != len(text):
+		raise ValueError('extra data at %d' % idx)
+	return msgs
+
+
+def encodeBatch(messages):
+	"""
+	Returns the datagram carrying the json encoded *messages* (a list
+	of :class:`Message` text) as one json list.
+	"""
+	return ('[%s]' % ', '.join(messages)).encode()
+
+
 class Subscriber(threading.Thread):
 	"""
 	A Subscriber thread is used by application to subscribe and unsubscribe
@@ -269,6 +433,11 @@ class Subscriber(threading.Thread):
 		self.sub = context.socket(zmq.SUB)
 		self.sub.connect('tcp://%s:%d' % (host, ports.subscribe))
 
+		# Seconds to wait for a message before calling idle(),
+		# None waits forever
+
+		self.timeout = None
+
 	def subscribe(self, channel):
 		"""
 		Subscribes to all channels that start with the
@@ -292,15 +461,39 @@ class Subscriber(threading.Thread):
 		
 	def run(self):
 		while True:
+			if self.timeout is not None and \
+			   not self.sub.poll(self.timeout * 1000):
+				self.idle()
+				continue
+
+			# A publisher in batch mode sends all the
+			# messages of a batch in one multipart send:
+			#
+			# <channel> <message> [<message> ...]
+
 			try:
-				channel, payload = self.sub.recv_multipart()
-				msg = Message(message=payload.decode(), 
-					      channel=channel.decode())
+				frames  = self.sub.recv_multipart()
+				channel = frames[0].decode()
 			except:
 				continue
-			if 'STACKDEBUG' in os.environ:
-				print(msg)
-			self.callback(msg)
+			for payload in frames[1:]:
+				try:
+					msg, = decodeMessages(payload.decode(),
+							      channel=channel)
+				except:
+					continue
+				if msg is None:
+					continue
+				if 'STACKDEBUG' in os.environ:
+					print(msg)
+				self.callback(msg)
+
+	def idle(self):
+		"""
+		Called when no message was received for *timeout* seconds.
+		The default behavior does nothing.
+		"""
+		pass
 
 
 	def callback(self, message):
@@ -323,47 +516,116 @@ class Receiver(threading.Thread):
 	Once the Receiver thread is started it will not exit.
 	"""
 
+	# Size of the socket receive buffer, bursts of messages larger
+	# than this are dropped by the kernel (the kernel may use less,
+	# see net.core.rmem_max)
+
+	RecvBuffer = 8 * 1024 * 1024
+
 	def __init__(self):
 		threading.Thread.__init__(self)
 
 		self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		self.rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-		self.rx.bind(('', ports.publish))
+		try:
+			self.rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RecvBuffer)
+		except OSError:
+			pass
 
-	def run(self):
-		while True:
-			pkt, addr = self.rx.recvfrom(65565)
+		# Have Linux report the number of datagrams it dropped
+		# because the receive buffer was full.
 
-			# All clients send text (<channel> <payload>)
-			# But, internally all messages are json.  To allow
-			# arbitrary wiring of daemons we need to accept
-			# json as input also.
-			#
-			# Note the callback() always pushes data as
-			# stack.mq.Message objects.  This is the only
-			# part of the code where we handle receiving 
-			# unstructured data.
-			#
-			# Design point here was to keep the clients 
-			# simple so we don't need an API to write to
-			# the message queue.
+		try:
+			self.rx.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+		except OSError:
+			pass
+		self.overflow = 0
+
+		# Number of datagrams (or elements of a batch) that were
+		# not messages
 
-			msg = None
-			try:		      # try json first
-				msg = Message(message=pkt.decode())
+		self.bad = 0
+
+		self.rx.bind(('', ports.publish))
+
+		# Seconds to wait for a message before calling idle(),
+		# None waits forever
+
+		self.timeout = None
+
+	def decode(self, pkt, addr):
+		"""
+		Returns the list of :class:`Message` objects in the
+		datagram *pkt*.
+		"""
+
+		# All clients send text (<channel> <payload>)
+		# But, internally all messages are json.  To allow
+		# arbitrary wiring of daemons we need to accept
+		# json as input also.  Daemons in batch mode send a
+		# json list of messages.
+		#
+		# Note the callback() always pushes data as
+		# stack.mq.Message objects.  This is the only
+		# part of the code where we handle receiving 
+		# unstructured data.
+		#
+		# Design point here was to keep the clients 
+		# simple so we don't need an API to write to
+		# the message queue.
+
+		msgs = []
+		try:		      # try json first
+			for msg in decodeMessages(pkt.decode()):
+				if msg is None:
+					self.bad += 1	# skip bad element of a batch
+				else:
+					msgs.append(msg)
+		except:
+			try:
+				(channel, payload) = pkt.decode().split(' ', 1)
+				msgs.append(Message(payload, channel=channel))
 			except:
-				try:
-					(channel, payload) = pkt.decode().split(' ', 1)
-					msg = Message(payload, channel=channel)
-				except:
-					pass   # drop bad message
-			if msg:
-				if not msg.getTime():
-					msg.setTime(time.asctime())
-				if not msg.getSource() and addr[0] != '127.0.0.1':
-					msg.setSource(addr[0])
+				self.bad += 1	# drop bad message
+
+		for msg in msgs:
+			if not msg.getTime():
+				msg.setTime(time.asctime())
+			if not msg.getSource() and addr[0] != '127.0.0.1':
+				msg.setSource(addr[0])
+
+		return msgs
+
+	def receive(self):
+		"""
+		Returns the next datagram and its source address, and
+		updates the *overflow* count from the kernel.
+		"""
+
+		pkt, ancdata, flags, addr = self.rx.recvmsg(65565, socket.CMSG_SPACE(4))
+		for level, type, data in ancdata:
+			if level == socket.SOL_SOCKET and type == SO_RXQ_OVFL and len(data) >= 4:
+				self.overflow = struct.unpack('=I', data[:4])[0]
+		return pkt, addr
+
+	def run(self):
+		self.rx.settimeout(self.timeout)
+		while True:
+			try:
+				pkt, addr = self.receive()
+			except socket.timeout:
+				self.idle()
+				continue
+			for msg in self.decode(pkt, addr):
 				self.callback(msg)
 
+	def idle(self):
+		"""
+		Called when no message was received for *timeout* seconds.
+		The default behavior does nothing.
+		"""
+		pass
+
 	def callback(self, message):
 		"""
 		Called for every received message.  All derived classes must
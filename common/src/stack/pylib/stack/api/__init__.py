@@ -6,13 +6,26 @@
 
 import os
 import sys
-import subprocess
 import json
+import marshal
+import importlib
+import threading
+import traceback
+import subprocess
+from stack.exception import CommandError
 
 __stack__ = '/opt/stack/bin/stack'
 
 rc = None
 
+# On the frontend list commands are run in this process, on a connection
+# shared by all the calls, rather than by running the stack command.
+# Set InProcess to False to always run the stack command.
+
+InProcess   = True
+_connection = None
+_lock       = threading.RLock()
+
 
 def ReturnCode():
 	"""
@@ -21,11 +34,157 @@ def ReturnCode():
 	return rc
 
 
+def _connect():
+	"""
+	Returns the connection shared by the commands run in this process,
+	or None if there is no database to connect to.
+	"""
+
+	global _connection
+
+	if _connection:
+		try:
+			_connection.ping(reconnect=True)
+		except Exception:
+			_connection = None
+
+	if not _connection:
+		from stack.commands import get_mysql_connection
+		_connection = get_mysql_connection()
+
+	return _connection
+
+
+def _run(command, args, stderr):
+	"""
+	Runs the stack list COMMAND (a list of words) with ARGS in this
+	process. Returns the exit code, and the rows of the command, or
+	None if the command cannot be run in this process.
+
+	Only list commands are run here, their output is the rows kept by
+	the command. Other commands write to stdout, or run programs that
+	do, so they are run as the stack command.
+	"""
+
+	global _connection
+
+	if not InProcess or command[0] != 'list':
+		return None
+
+	try:
+		module  = importlib.import_module('stack.commands.%s' % '.'.join(command))
+		Command = module.Command
+	except (ImportError, AttributeError):
+		return None
+
+	with _lock:
+		try:
+			db = _connect()
+		except ImportError:
+			return None
+		if not db:
+			return None
+
+		o = Command(db)
+		o.keepRows = True
+
+		# Other processes may have changed the database since
+		# the last call.
+		o.db.clearCache()
+
+		try:
+			result = o.runWrapper(' '.join(command), args)
+		except CommandError as e:
+			if stderr:
+				sys.stderr.write('%s\n' % e)
+			return 255, None
+		except Exception:
+			if stderr:
+				traceback.print_exc()
+			return 255, None
+		finally:
+			if not db.open:
+				_connection = None
+
+	rows = o.rows
+	text = o.getText()
+	if rows is None and isinstance(text, bytes):
+		# Written as binary without going through endOutput()
+		rows = marshal.loads(text)
+
+	return (0 if result is True else 255), rows
+
+
+def Iterate(cmd, args=None, sudo=False, *, stderr=True):
+	"""
+	Call the Stack Command Line list command CMD and yield the rows
+	of the result, as they are read when the stack command is run.
+
+	Example:
+		for row in stack.api.Iterate('list host interface'):
+			...
+	"""
+
+	global rc
+
+	if not os.path.exists(__stack__):
+		return
+
+	command = cmd.replace('.', ' ').strip().split()
+	args    = list(args or [])
+
+	result = None
+	if not sudo:
+		result = _run(command, args + [ 'output-format=binary' ], stderr)
+	if result:
+		rc, rows = result
+		if not rc:
+			yield from rows or []
+		return
+
+	argv = ([ sudo ] if sudo else []) + [ __stack__ ] + command + args
+	argv.append('output-format=json')
+
+	p = subprocess.Popen(argv, stdout=subprocess.PIPE,
+			     stderr=None if stderr else subprocess.DEVNULL,
+			     encoding='utf-8')
+
+	# The output is a JSON list of rows, decode each row as soon as
+	# all of it has been read.
+
+	decoder = json.JSONDecoder()
+	buf     = ''
+	try:
+		for chunk in iter(lambda: p.stdout.read(65536), ''):
+			buf += chunk
+			pos  = 0
+			while True:
+				while pos < len(buf) and buf[pos] in '[], \t\r\n':
+					pos += 1
+				if pos == len(buf):
+					break
+				try:
+					row, pos = decoder.raw_decode(buf, pos)
+				except ValueError:
+					break
+				yield row
+			buf = buf[pos:]
+	finally:
+		p.stdout.close()
+		rc = p.wait()
+
+	if buf.strip():
+		json.loads(buf)
+
+
 def Call(cmd, args=None, format='json', sudo=False, *, stderr=True):
 	"""
 	Call the Stack Command Line and return a python dictionary as the
 	result.  Currently only works with list commands.
 
+	On the frontend list commands are run in this process, otherwise
+	(or with sudo) the stack command is run.
+
 	Example:
 		result = stack.api.Call('list network', [ 'private' ])
 	"""
@@ -37,6 +196,14 @@ def Call(cmd, args=None, format='json', sudo=False, *, stderr=True):
 		return [ ]
 	
 	command = cmd.replace('.', ' ').strip().split()
+
+	if not sudo and format == 'json':
+		result = _run(command, (args or []) + [ 'output-format=binary' ], stderr)
+		if result:
+			rc, rows = result
+			if rc:
+				return [ ]
+			return rows or [ ]
 	
 	if sudo:
 		list = [ sudo ]
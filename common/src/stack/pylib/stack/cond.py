@@ -146,3 +146,27 @@ def EvalCondExpr(cond, attrs):
 		result = False
 
 	return result
+
+
+def CondExprNames(cond):
+	"""Returns the set of attribute names the conditional expression
+	COND refers to, or None if COND is not a valid expression.  Since
+	EvalCondExpr only looks up these names the result of a condition
+	depends only on the values of these attributes.
+	"""
+	if not cond:
+		return set()
+
+	try:
+		code = compile(cond.strip().replace('.', '_DOT_'), '<cond>', 'eval')
+	except SyntaxError:
+		return None
+
+	names = set()
+	pending = [ code ]
+	while pending:
+		c = pending.pop()
+		names.update(n.replace('_DOT_', '.') for n in c.co_names)
+		pending.extend(k for k in c.co_consts if hasattr(k, 'co_names'))
+
+	return names
@@ -0,0 +1,333 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import json
+import time
+import atexit
+import struct
+import threading
+import subprocess
+
+
+# The loop run by a PythonWorker. Each job is a script that is run the
+# way "python3 < script" would run it, with the output of the job
+# (including that of any subprocesses) captured in temporary files.
+
+_WORKER = r'''
+import os
+import sys
+import json
+import struct
+import tempfile
+import traceback
+
+rin  = os.fdopen(os.dup(0), 'rb')
+wout = os.fdopen(os.dup(1), 'wb')
+os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+
+path    = list(sys.path)
+environ = dict(os.environ)
+
+def read(size):
+	data = b''
+	while len(data) < size:
+		chunk = rin.read(size - len(data))
+		if not chunk:
+			sys.exit(0)
+		data += chunk
+	return data
+
+while True:
+	size, = struct.unpack('!I', read(4))
+	job   = json.loads(read(size).decode())
+
+	out = tempfile.TemporaryFile()
+	err = tempfile.TemporaryFile()
+	os.dup2(out.fileno(), 1)
+	os.dup2(err.fileno(), 2)
+
+	rc = 0
+	try:
+		os.chdir(job['cwd'])
+		exec(compile(job['text'], '<stdin>', 'exec'), { '__name__': '__main__' })
+	except SystemExit as e:
+		if isinstance(e.code, int):
+			rc = e.code
+		elif e.code is not None:
+			print(e.code, file=sys.stderr)
+			rc = 1
+	except BaseException:
+		etype, value, tb = sys.exc_info()
+		traceback.print_exception(etype, value, tb.tb_next)
+		rc = 1
+
+	sys.stdout = sys.__stdout__
+	sys.stderr = sys.__stderr__
+	sys.stdout.flush()
+	sys.stderr.flush()
+	sys.path[:] = path
+	os.environ.clear()
+	os.environ.update(environ)
+
+	out.seek(0)
+	err.seek(0)
+	o = out.read()
+	e = err.read()
+	out.close()
+	err.close()
+
+	wout.write(struct.pack('!iII', rc, len(o), len(e)) + o + e)
+	wout.flush()
+'''
+
+
+class PythonWorker:
+	"""
+	A warm Python interpreter that runs scripts sent to it, saving the
+	interpreter startup and module imports of every eval. Modules
+	imported by a script stay imported for the next one. The working
+	directory, sys.path, and environment are reset after every script.
+	"""
+
+	def __init__(self, shell):
+		self.shell   = shell
+		self.process = subprocess.Popen([ shell, '-c', _WORKER ],
+						stdin=subprocess.PIPE,
+						stdout=subprocess.PIPE,
+						stderr=subprocess.DEVNULL)
+
+	def read(self, size):
+		data = b''
+		while len(data) < size:
+			chunk = self.process.stdout.read(size - len(data))
+			if not chunk:
+				raise EOFError('python worker exited')
+			data += chunk
+		return data
+
+	def send(self, text):
+		"""
+		Sends the python script TEXT to the worker to run.
+		"""
+
+		job = json.dumps({ 'text': text, 'cwd': os.getcwd() }).encode()
+		self.process.stdin.write(struct.pack('!I', len(job)) + job)
+		self.process.stdin.flush()
+
+	def receive(self):
+		"""
+		Returns the exit code, stdout, and stderr of the script sent
+		to the worker.
+		"""
+
+		rc, outlen, errlen = struct.unpack('!iII', self.read(12))
+		return rc, self.read(outlen), self.read(errlen)
+
+	def run(self, text):
+		"""
+		Returns the exit code, stdout, and stderr of running the
+		python script TEXT.
+		"""
+
+		self.send(text)
+		return self.receive()
+
+	def close(self):
+		try:
+			self.process.stdin.close()
+			self.process.wait(timeout=5)
+		except (OSError, subprocess.TimeoutExpired):
+			self.process.kill()
+
+
+class EvalExecutor:
+	"""
+	Runs the <stack:eval> and <stack:report> sections of the node
+	files.
+
+	Python evals are sent to a pool of warm PythonWorkers, other
+	shells are run as before. The output of evals and reports is kept
+	for TTL seconds and reused for identical sections (same shell and
+	text after entity expansion, same report command and arguments)
+	of the same profile. The profile commands clear() it before
+	generating a profile, as long lived processes (the profile
+	service, the REST API) must not hand out output from before the
+	database last changed. Failed evals are never reused.
+
+	The time spent in each section is collected by getTimings(), and
+	the number of sections run with caching turned off is counted in
+	uncached (a profile with such a section is never cached either).
+	The timings are kept per file and shell (or report command), and
+	at most SIZE outputs are remembered, so neither grows with the
+	number of hosts in long lived processes.
+	"""
+
+	def __init__(self, workers=4, ttl=60, size=1024):
+		self.workers = workers
+		self.ttl     = ttl
+		self.size    = size
+		self.idle    = {}	# shell -> [ PythonWorker ]
+		self.memo    = {}	# key -> (time, result)
+		self.timings = {}	# (filename, label) -> stats
+		self.uncached = 0
+		self.lock    = threading.Lock()
+
+	def isPython(self, shell):
+		return os.path.basename(shell).startswith('python')
+
+	def acquire(self, shell):
+		with self.lock:
+			idle = self.idle.get(shell)
+			if idle:
+				return idle.pop()
+		return PythonWorker(shell)
+
+	def release(self, worker):
+		with self.lock:
+			idle = self.idle.setdefault(worker.shell, [])
+			if len(idle) < self.workers:
+				idle.append(worker)
+				return
+		worker.close()
+
+	def lookup(self, key):
+		"""
+		Returns the remembered result for KEY as a one element
+		tuple, or None if there is none.
+		"""
+
+		with self.lock:
+			entry = self.memo.get(key)
+			if entry and time.time() - entry[0] < self.ttl:
+				return (entry[1],)
+			self.memo.pop(key, None)
+		return None
+
+	def remember(self, key, result):
+		now = time.time()
+		with self.lock:
+			# The memo is kept in the order the results were
+			# remembered, so the oldest (and expired) ones are
+			# at the front.
+			self.memo.pop(key, None)
+			for k in list(self.memo):
+				if len(self.memo) < self.size and \
+				   now - self.memo[k][0] < self.ttl:
+					break
+				del self.memo[k]
+			self.memo[key] = (now, result)
+
+	def clear(self):
+		"""
+		Forgets the remembered results.
+		"""
+
+		with self.lock:
+			self.memo = {}
+
+	def record(self, filename, label, seconds, cached, cache=True):
+		with self.lock:
+			if not cache:
+				self.uncached += 1
+			stats = self.timings.setdefault((filename, label), {
+				'count': 0, 'cached': 0, 'total': 0.0, 'max': 0.0
+			})
+			stats['count'] += 1
+			stats['total'] += seconds
+			stats['max']    = max(stats['max'], seconds)
+			if cached:
+				stats['cached'] += 1
+
+	def getTimings(self):
+		"""
+		Returns a list of (filename, label, stats) with the slowest
+		sections first.
+		"""
+
+		with self.lock:
+			timings = [ (filename, label, dict(stats))
+				    for (filename, label), stats in self.timings.items() ]
+		return sorted(timings, key=lambda t: t[2]['total'], reverse=True)
+
+	def run(self, shell, text, filename=None, cache=True):
+		"""
+		Returns the exit code, stdout, and stderr of running TEXT
+		through SHELL.
+		"""
+
+		t0     = time.time()
+		label  = os.path.basename(shell)
+		key    = ('eval', shell, text, os.getcwd())
+		hit    = self.lookup(key) if cache else None
+		if hit:
+			self.record(filename, label, time.time() - t0, True)
+			return hit[0]
+
+		result = None
+		if self.isPython(shell):
+			worker = None
+			sent   = False
+			try:
+				worker = self.acquire(shell)
+				worker.send(text)
+				sent   = True
+				result = worker.receive()
+				self.release(worker)
+			except (OSError, EOFError, struct.error):
+				# If the worker failed before it got the
+				# script, run the script on its own. If the
+				# worker died running it (or the script
+				# killed it) running it again would repeat
+				# whatever it already did.
+				if worker:
+					worker.close()
+				if sent:
+					result = (1, b'', b'python worker exited while running the script\n')
+
+		if result is None:
+			p = subprocess.Popen([ '%s' % shell ],
+					     stdin=subprocess.PIPE,
+					     stdout=subprocess.PIPE,
+					     stderr=subprocess.PIPE)
+			out, err = p.communicate(text.encode())
+			result = (p.returncode, out, err)
+
+		if cache and result[0] == 0:
+			self.remember(key, result)
+		self.record(filename, label, time.time() - t0, False, cache)
+
+		return result
+
+	def report(self, rcl, command, args, filename=None, cache=True):
+		"""
+		Returns the output of the stack command COMMAND run by the
+		command object RCL.
+		"""
+
+		t0     = time.time()
+		key    = ('report', command, tuple(args))
+		hit    = self.lookup(key) if cache else None
+		if hit:
+			result = hit[0]
+		else:
+			result = rcl.command(command, args)
+			if cache:
+				self.remember(key, result)
+		self.record(filename, command.replace('.', ' '), time.time() - t0, bool(hit), cache)
+
+		return result
+
+	def close(self):
+		with self.lock:
+			workers   = [ w for idle in self.idle.values() for w in idle ]
+			self.idle = {}
+		for worker in workers:
+			worker.close()
+
+
+executor = EvalExecutor()
+atexit.register(executor.close)
@@ -0,0 +1,337 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import os
+import re
+import pwd
+import grp
+import select
+import tempfile
+import subprocess
+import xml.dom.minidom
+from xml.parsers.expat import ExpatError
+
+from stack.bool import str2bool
+
+
+# The umask of the process for new files. Reading it means setting it,
+# which is only safe before there are other threads, so it is read once
+# when the module is imported.
+
+umask = os.umask(0o022)
+os.umask(umask)
+
+
+class Unsupported(Exception):
+	"""
+	The report output needs the full profile generator (and shell) to be
+	turned into files.
+	"""
+	pass
+
+
+class Materializer:
+	"""
+	Writes the <stack:file> sections of the output of a report command
+	in-process, the way 'stack report script' piped into a shell
+	would, without running either.
+
+	Every file is written to a temporary file and renamed into place,
+	and only if its contents, owner, or permissions differ from what
+	is on disk. Any shell code between the files is run in order with
+	the files, all of it by one SHELL, so variables and the working
+	directory carry over from one section to the next. As with a
+	shell running the whole report, nothing after a section the shell
+	exits in is done. Output that needs more than this (entity
+	expansion, stack:expr, other profile tags) is refused with
+	Unsupported so the caller can fall back to the shell.
+
+	Paths are written under ROOT, which is only ever changed for
+	testing.
+	"""
+
+	RCS = '/opt/stack/bin/rcs'
+
+	def __init__(self, root='/', shell='/bin/sh'):
+		self.root    = root
+		self.shell   = shell
+		self.changed = []
+		self.pending = {}	# path -> file
+		self.order   = []
+		self.rcs     = set()
+		self.process = None
+
+	def parse(self, text):
+		"""
+		Returns the report output TEXT as a list of ('file', node)
+		and ('shell', text) sections.
+		"""
+
+		try:
+			doc = xml.dom.minidom.parseString(
+				'<stack:report xmlns:stack="http://www.stacki.com">\n%s</stack:report>' % text)
+		except ExpatError as e:
+			raise Unsupported('%s' % e)
+
+		sections = []
+		for node in doc.documentElement.childNodes:
+			if node.nodeType in [ node.TEXT_NODE, node.CDATA_SECTION_NODE ]:
+				if node.nodeValue.strip():
+					sections.append(('shell', node.nodeValue))
+			elif node.nodeType == node.ELEMENT_NODE:
+				if node.tagName != 'stack:file':
+					raise Unsupported('<%s>' % node.tagName)
+				if node.getAttribute('stack:expr') or \
+				   node.getAttribute('stack:vars') == 'expanded':
+					raise Unsupported('<stack:file stack:name="%s">' %
+							  node.getAttribute('stack:name'))
+				sections.append(('file', node))
+		return sections
+
+	def collect(self, node):
+		l = []
+		for child in node.childNodes:
+			if child.nodeType in [ child.TEXT_NODE, child.CDATA_SECTION_NODE ]:
+				l.append(child.nodeValue)
+			elif child.nodeType == child.ELEMENT_NODE:
+				l.append(child.toxml())
+		return ''.join(l)
+
+	def getPath(self, name):
+		return os.path.join(self.root, name.lstrip(os.sep))
+
+	def read(self, path):
+		if path in self.pending:
+			return self.pending[path]['contents']
+		try:
+			with open(path, 'rb') as fin:
+				return fin.read()
+		except FileNotFoundError:
+			return None
+
+	def addFile(self, node):
+		name = node.getAttribute('stack:name')
+		if not name:
+			return
+
+		path   = self.getPath(name)
+		text   = self.collect(node)
+		owner  = node.getAttribute('stack:owner')
+		perms  = node.getAttribute('stack:perms')
+		append = node.getAttribute('stack:mode') == 'append'
+		rcs    = str2bool(node.getAttribute('stack:rcs') or 'true')
+
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		if rcs:
+			self.rcsBegin(path, owner)
+
+		current = self.read(path)
+		if not text:
+			# touch
+			contents = current if current is not None else b''
+		else:
+			# The shell here document drops a leading newline
+			# and always ends with one.
+			if text[0] == '\n':
+				text = text[1:]
+			if text[-1:] != '\n':
+				text += '\n'
+			contents = text.encode()
+			if append and current is not None:
+				contents = current + contents
+
+		entry = self.pending.get(path)
+		if not entry:
+			entry = self.pending[path] = { 'name': name, 'owner': '', 'perms': '' }
+			self.order.append(path)
+		entry['contents'] = contents
+		entry['owner']    = owner or entry['owner']
+		entry['perms']    = perms or entry['perms']
+
+	def rcsBegin(self, path, owner):
+		"""
+		Checks a file into RCS the first time it is written, as the
+		shell code of the profile generator does.
+		"""
+
+		if path in self.rcs or not os.path.exists(self.RCS):
+			return
+		self.rcs.add(path)
+
+		rcsdir  = os.path.join(os.path.dirname(path), 'RCS')
+		rcsfile = '%s,v' % os.path.join(rcsdir, os.path.basename(path))
+		if os.path.exists(rcsfile):
+			return
+
+		if not os.path.exists(path):
+			open(path, 'a').close()
+		if not os.path.isdir(rcsdir):
+			os.mkdir(rcsdir, 0o700)
+			os.chown(rcsdir, 0, 0)
+		for cmd in ([ '/opt/stack/bin/ci', '-q', path ],
+			    [ '/opt/stack/bin/rcs', '-noriginal:', path ],
+			    [ '/opt/stack/bin/co', '-q', '-f', '-l', path ]):
+			subprocess.run(cmd, input=b'original',
+				       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		if owner:
+			self.chown(rcsfile, owner)
+
+	def chown(self, path, owner):
+		"""
+		Changes the owner of PATH to OWNER ("user", "user:group",
+		or "user.group"), ignoring unknown users and groups like
+		chown failing would.
+		"""
+
+		user, group = re.match('([^:.]*)[:.]?(.*)$', owner).groups()
+		try:
+			uid = -1
+			gid = -1
+			if user:
+				uid = int(user) if user.isdigit() else pwd.getpwnam(user).pw_uid
+			if group:
+				gid = int(group) if group.isdigit() else grp.getgrnam(group).gr_gid
+			os.chown(path, uid, gid)
+		except (KeyError, OSError):
+			pass
+
+	def chmod(self, path, perms):
+		if re.match('^[0-7]+$', perms):
+			try:
+				os.chmod(path, int(perms, 8))
+			except OSError:
+				pass
+		else:
+			subprocess.run([ 'chmod', perms, path ],
+				       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+	def write(self, path, contents):
+		"""
+		Atomically replaces the contents of PATH (following symlinks
+		like the shell redirect would), keeping its owner and mode.
+		"""
+
+		real = os.path.realpath(path)
+		try:
+			st = os.stat(real)
+		except FileNotFoundError:
+			st = None
+
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(real),
+					   prefix='.%s.' % os.path.basename(real))
+		try:
+			with os.fdopen(fd, 'wb') as fout:
+				fout.write(contents)
+			if st:
+				os.chmod(tmp, st.st_mode & 0o7777)
+				try:
+					os.chown(tmp, st.st_uid, st.st_gid)
+				except PermissionError:
+					pass
+			else:
+				os.chmod(tmp, 0o666 & ~umask)
+			os.replace(tmp, real)
+		except BaseException:
+			os.unlink(tmp)
+			raise
+
+	def flush(self):
+		"""
+		Writes the pending files and records the ones that changed.
+		"""
+
+		for path in self.order:
+			entry = self.pending[path]
+
+			try:
+				st = os.stat(path)
+				with open(path, 'rb') as fin:
+					current = fin.read()
+			except FileNotFoundError:
+				st = None
+				current = None
+
+			changed = current != entry['contents']
+			if changed:
+				self.write(path, entry['contents'])
+			if entry['owner']:
+				self.chown(path, entry['owner'])
+			if entry['perms']:
+				self.chmod(path, entry['perms'])
+
+			if st:
+				after = os.stat(path)
+				changed = changed or (st.st_mode, st.st_uid, st.st_gid) != \
+					(after.st_mode, after.st_uid, after.st_gid)
+			if changed and entry['name'] not in self.changed:
+				self.changed.append(entry['name'])
+
+		self.pending = {}
+		self.order   = []
+
+	def runShell(self, code):
+		"""
+		Runs the shell CODE and waits for it to finish. The shell is
+		started for the first section, and tells when each one is
+		done on its own stdout, which the sections do not get.
+		Returns False once the shell exited.
+		"""
+
+		if not self.process:
+			self.process = subprocess.Popen([ self.shell ],
+							stdin=subprocess.PIPE,
+							stdout=subprocess.PIPE,
+							stderr=subprocess.DEVNULL)
+			code = 'exec 3>&1 >/dev/null\n%s' % code
+
+		try:
+			self.process.stdin.write(b'%s\necho >&3\n' % code.encode())
+			self.process.stdin.flush()
+		except BrokenPipeError:
+			return False
+
+		# Background commands may keep the pipe open after the
+		# shell exited.
+		done = self.process.stdout.fileno()
+		while True:
+			ready, _, _ = select.select([ done ], [], [], 0.1)
+			if ready:
+				return os.read(done, 1) != b''
+			if self.process.poll() is not None:
+				return False
+
+	def close(self):
+		if not self.process:
+			return
+		try:
+			self.process.stdin.close()
+		except BrokenPipeError:
+			pass
+		self.process.wait()
+		self.process.stdout.close()
+		self.process = None
+
+	def run(self, text):
+		"""
+		Writes the files in the report output TEXT and runs any
+		shell code in it. Returns the names of the files that
+		changed.
+		"""
+
+		self.changed = []
+		try:
+			for section, value in self.parse(text):
+				if section == 'file':
+					self.addFile(value)
+				else:
+					self.flush()
+					if not self.runShell(value):
+						break
+			self.flush()
+		finally:
+			self.close()
+
+		return self.changed
@@ -13,11 +13,18 @@
 # @rocks@
 
 import os
+import re
 import sys
-import subprocess
+import json
+import time
+import fcntl
+import hashlib
+import tempfile
 import stack.util
 import stack.graph
 import stack.cond
+import stack.evaluate
+from stack.bool import str2bool
 
 from xml.sax import saxutils
 from xml.sax import handler
@@ -97,7 +104,7 @@ class GraphHandler(handler.ContentHandler,
 		   handler.ErrorHandler,
 		   AttributeHandler):
 
-	def __init__(self, attrs, prune=True, directories=[ '.' ]):
+	def __init__(self, attrs, prune=True, directories=[ '.' ], tokenize=True):
 		handler.ContentHandler.__init__(self)
 		self.setAttributes(attrs)
 		self.graph			= stack.util.Struct()
@@ -120,6 +127,11 @@ class GraphHandler(handler.ContentHandler,
 		# representation of graph is required.
 		self.prune			= prune
 
+		# Replay node files from the NodeTokenizer cache rather
+		# than parsing them for every host.
+		self.tokenize			= tokenize
+		self.entities			= {}
+
 
 	def nsAttrs(self):
 		return self.xmlns
@@ -130,6 +142,61 @@ class GraphHandler(handler.ContentHandler,
 	def getOrderGraph(self):
 		return self.graph.order
 
+	def parseFile(self, filename):
+		"""
+		Feeds the graph file FILENAME through the handler.
+		"""
+
+		parser = make_parser(["stack.expatreader"])
+		parser.setContentHandler(self)
+		parser.feed(self.getXMLHeader())
+		linenumber = 0
+
+		with open(filename, 'r') as xml:
+			for line in xml.readlines():
+				linenumber = linenumber + 1
+				if line.find('<?xml') != -1:
+					continue
+				try:
+					parser.feed(line)
+				except Exception as e:
+					self.parseError(e, filename, linenumber)
+					raise
+
+	def parseError(self, e, filename, linenumber):
+		print('XML parse error in graph file - %s in file %s on line %d\n' % (e.args[-1], filename, linenumber))
+
+	def parseGraph(self, directory, cache=None):
+		"""
+		Adds all the graph files in DIRECTORY to the graph. If a
+		GraphCache is given the compiled graph files are used
+		instead of parsing the XML.
+		"""
+
+		if cache:
+			for filename, records in cache.load(directory):
+				if records is None:
+					self.parseFile(filename)
+				else:
+					self.replay(records)
+			return
+
+		for file in os.listdir(directory):
+			base, ext = os.path.splitext(file)
+			if ext == '.xml':
+				self.parseFile(os.path.join(directory, file))
+
+	def replay(self, records):
+		"""
+		Adds the edges recorded by a GraphCompiler to the graph.
+		"""
+
+		for record in records:
+			if record[0] == 'edge':
+				self.addFrameworkEdge(*record[1:])
+			else:
+				self.addOrderEdge(*record[1:])
+
 	def parseNode(self, node, eval=True, rcl=None):
 		if node.name in [ 'HEAD', 'TAIL' ]:
 			return
@@ -173,55 +240,21 @@ class GraphHandler(handler.ContentHandler,
 			#	- Expand XML Entities
 			#	- Expand EVAL tags
 			#	- Logging for post sections
+			#
+			# The node file is only parsed once, after that the
+			# tokens are replayed with the entities of this host.
 
-			fin       = open(xmlFile, 'r')
-			parser    = make_parser(["stack.expatreader"])
 			handler_1 = Pass1NodeHandler(node, xmlFile, self.attributes, eval, rcl)
-			parser.setContentHandler(handler_1)
-			parser.setFeature(handler.feature_namespaces, True)
+			xmlns     = handler_1.nsAttrs()
 
-			xmlns   = handler_1.nsAttrs()
-			header  = handler_1.getXMLHeader()
-			header += '<stack:ns %s>' % xmlns
+			tokens = None
+			if self.tokenize and 'STACKDEBUG' not in os.environ:
+				tokens = NodeTokenizer.getTokens(xmlFile, xmlns)
 
-			if 'STACKDEBUG' in os.environ:
-				i = 1
-				for x in header.split('\n'):
-					sys.stderr.write('[parse1 %4d]%s\n' % (i, x))
-					i += 1
-			parser.feed(header)
-
-			linenumber = 0
-			for line in fin.readlines():
-				linenumber += 1
-
-				# Some of the node files might have the <?xml
-				# document header.  Since we are replacing
-				# the XML header with our own (which includes
-				# the entities) we need to skip it.
-
-				if line.find('<?xml') != -1:
-					continue
-
-				# Send the XML to stderr for debugging before
-				# we parse it.
-
-				if 'STACKDEBUG' in os.environ:
-					sys.stderr.write('[parse1 %4d %s]%s' % (i,
-										xmlFileBasename,
-										line))
-					i += 1
-				try:
-					parser.feed(line)
-				except Exception as e:
-					print('XML parse error in node file - %s in file %s on line %d\n' %
-					      (e.args[-1], xmlFile, linenumber))
-					raise
-
-			if 'STACKDEBUG' in os.environ:
-				sys.stderr.write('[parse1 %4d]</stack:ns>\n' % i)
-			parser.feed('</stack:ns>')
-			fin.close()
+			if tokens is None:
+				self.parsePass1(handler_1, xmlFile)
+			else:
+				self.replayPass1(handler_1, tokens)
 
 			# 2nd Pass
 			#	- Expand XML Entities
@@ -253,35 +286,134 @@ class GraphHandler(handler.ContentHandler,
 
 		self.xmlns = xmlns
 
+	def parsePass1(self, handler_1, xmlFile):
+		xmlFileBasename = os.path.split(xmlFile)[1]
+
+		fin       = open(xmlFile, 'r')
+		parser    = make_parser(["stack.expatreader"])
+		parser.setContentHandler(handler_1)
+		parser.setFeature(handler.feature_namespaces, True)
+
+		xmlns   = handler_1.nsAttrs()
+		header  = handler_1.getXMLHeader()
+		header += '<stack:ns %s>' % xmlns
+
+		if 'STACKDEBUG' in os.environ:
+			i = 1
+			for x in header.split('\n'):
+				sys.stderr.write('[parse1 %4d]%s\n' % (i, x))
+				i += 1
+		parser.feed(header)
+
+		linenumber = 0
+		for line in fin.readlines():
+			linenumber += 1
+
+			# Some of the node files might have the <?xml
+			# document header.  Since we are replacing
+			# the XML header with our own (which includes
+			# the entities) we need to skip it.
+
+			if line.find('<?xml') != -1:
+				continue
+
+			# Send the XML to stderr for debugging before
+			# we parse it.
+
+			if 'STACKDEBUG' in os.environ:
+				sys.stderr.write('[parse1 %4d %s]%s' % (i,
+									xmlFileBasename,
+									line))
+				i += 1
+			try:
+				parser.feed(line)
+			except Exception as e:
+				print('XML parse error in node file - %s in file %s on line %d\n' %
+				      (e.args[-1], xmlFile, linenumber))
+				raise
+
+		if 'STACKDEBUG' in os.environ:
+			sys.stderr.write('[parse1 %4d]</stack:ns>\n' % i)
+		parser.feed('</stack:ns>')
+		fin.close()
+
+	def replayPass1(self, handler_1, tokens):
+		for token in tokens:
+			kind = token[0]
+			if kind == 'start':
+				handler_1.startElementNS(token[1], token[2], token[3])
+			elif kind == 'end':
+				handler_1.endElementNS(token[1], token[2])
+			elif kind == 'chars':
+				handler_1.characters(token[1])
+			else:
+				for text in self.getEntity(token[1]):
+					handler_1.characters(text)
+
+	def getEntity(self, name):
+		"""
+		Returns the text the entity NAME expands to for this host,
+		as the list of chunks the parser would have reported it in.
+		"""
+
+		if name not in self.entities:
+			tokenizer = NodeTokenizer()
+			parser    = make_parser(["stack.expatreader"])
+			parser.setContentHandler(tokenizer)
+			parser.feed(self.getXMLHeader())
+			parser.feed('<entity>&%s;</entity>' % name)
+			self.entities[name] = [ token[1] for token in tokenizer.tokens
+						if token[0] == 'chars' ]
+
+		return self.entities[name]
+
 	def addOrder(self):
-		if self.graph.order.hasNode(self.attrs.order.head):
-			head = self.graph.order.getNode(self.attrs.order.head)
+		self.addOrderEdge(self.attrs.order.head,
+				  self.attrs.order.tail,
+				  self.attrs.order.gen)
+
+	def addOrderEdge(self, head, tail, gen):
+		if self.graph.order.hasNode(head):
+			head = self.graph.order.getNode(head)
 		else:
-			head = Node(self.attrs.order.head)
+			head = Node(head)
 
-		if self.graph.order.hasNode(self.attrs.order.tail):
-			tail = self.graph.order.getNode(self.attrs.order.tail)
+		if self.graph.order.hasNode(tail):
+			tail = self.graph.order.getNode(tail)
 		else:
-			tail = Node(self.attrs.order.tail)
+			tail = Node(tail)
 
-		e = OrderEdge(head, tail, self.attrs.order.gen)
+		e = OrderEdge(head, tail, gen)
 		self.graph.order.addEdge(e)
 
 
-	def addEdge(self):
-		if self.graph.main.hasNode(self.attrs.main.parent):
-			head = self.graph.main.getNode(self.attrs.main.parent)
+	def addEdge(self, test=None):
+		self.addFrameworkEdge(self.attrs.main.parent,
+				      self.attrs.main.child,
+				      self.attrs.main.default.cond,
+				      test)
+
+	def addFrameworkEdge(self, parent, child, cond, test=None):
+		# The <to> and <from> conditionals decide if the edge
+		# exists at all (when pruning), the <edge> conditional
+		# is kept on the edge.
+
+		if self.prune and not stack.cond.EvalCondExpr(test, self.attributes):
+			return
+
+		if self.graph.main.hasNode(parent):
+			head = self.graph.main.getNode(parent)
 		else:
-			head = Node(self.attrs.main.parent)
+			head = Node(parent)
 
-		if self.graph.main.hasNode(self.attrs.main.child):
-			tail = self.graph.main.getNode(self.attrs.main.child)
+		if self.graph.main.hasNode(child):
+			tail = self.graph.main.getNode(child)
 		else:
-			tail = Node(self.attrs.main.child)
+			tail = Node(child)
 
 		e = FrameworkEdge(tail, head)
 
-		e.setConditional(self.attrs.main.default.cond)
+		e.setConditional(cond)
 
 		self.graph.main.addEdge(e)
 
@@ -347,9 +479,8 @@ class GraphHandler(handler.ContentHandler,
 			stack.cond.CreateCondExpr(arch, osname, release, cond)
 
 	def endElement_to(self, name):
-		if (not self.prune) or stack.cond.EvalCondExpr(self.attrs.main.cond, self.attributes):
-			self.attrs.main.parent = self.text
-			self.addEdge()
+		self.attrs.main.parent = self.text
+		self.addEdge(self.attrs.main.cond)
 		self.attrs.main.parent = None
 
 	# <from>
@@ -378,10 +509,8 @@ class GraphHandler(handler.ContentHandler,
 
 
 	def endElement_from(self, name):
-		if (not self.prune) or \
-			stack.cond.EvalCondExpr(self.attrs.main.cond, self.attributes):
-			self.attrs.main.child = self.text
-			self.addEdge()
+		self.attrs.main.child = self.text
+		self.addEdge(self.attrs.main.cond)
 		self.attrs.main.child = None
 
 	# <order>
@@ -473,6 +602,413 @@ class GraphHandler(handler.ContentHandler,
 		self.text = self.text + s
 
 
+class GraphCompiler(GraphHandler):
+	"""
+	Parses a graph file into the list of edges it adds, without
+	evaluating any of the conditionals. The records are replayed into
+	a GraphHandler for a specific set of attributes.
+
+	Graph files that use attribute entities depend on the host and
+	cannot be compiled, for these compile() returns None.
+	"""
+
+	# Entity references other than the XML predefined ones are the
+	# attributes of the host.
+
+	entity = re.compile(r'&(?!(?:amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)[^;\s]+;')
+
+	def __init__(self):
+		GraphHandler.__init__(self, { 'os': None }, prune=False)
+		self.setAttributes({})
+		self.records = []
+
+	def addOrderEdge(self, head, tail, gen):
+		self.records.append(('order', head, tail, gen))
+
+	def addFrameworkEdge(self, parent, child, cond, test=None):
+		self.records.append(('edge', parent, child, cond, test))
+
+	def parseError(self, e, filename, linenumber):
+		pass
+
+	def compile(self, filename):
+		"""
+		Returns the edge records of FILENAME, or None if the file
+		must be parsed for every host.
+		"""
+
+		try:
+			with open(filename, 'r') as xml:
+				if self.entity.search(xml.read()):
+					return None
+			self.parseFile(filename)
+		except Exception:
+			# Leave it to the real parse to report
+			return None
+
+		return self.records
+
+
+class GraphCache:
+	"""
+	Persistent cache of compiled graph directories.
+
+	Each graph directory is compiled into one JSON file holding the
+	edge records of all its graph files, along with the name, mtime
+	and size of every file. The compiled graph is used until any of the
+	graph files is added, removed or modified.
+	"""
+
+	VERSION = 1
+
+	def __init__(self, path='/var/cache/stack/graph'):
+		self.path = path
+
+	def getFilename(self, directory):
+		digest = hashlib.md5(os.path.realpath(directory).encode()).hexdigest()
+		return os.path.join(self.path, '%s.graph' % digest)
+
+	def fingerprint(self, directory):
+		files = []
+		for file in os.listdir(directory):
+			base, ext = os.path.splitext(file)
+			if ext == '.xml':
+				st = os.stat(os.path.join(directory, file))
+				files.append((file, st.st_mtime_ns, st.st_size))
+		return files
+
+	def read(self, filename):
+		try:
+			with open(filename, 'r') as fin:
+				compiled = json.load(fin)
+		except Exception:
+			return None
+
+		if not isinstance(compiled, dict) or compiled.get('version') != self.VERSION:
+			return None
+		return compiled
+
+	def write(self, compiled):
+		# Not being able to save the compiled graph (e.g. not
+		# running as root) only costs us the next compile.
+
+		try:
+			os.makedirs(self.path, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=self.path)
+			with os.fdopen(fd, 'w') as fout:
+				json.dump(compiled, fout)
+			os.replace(tmp, self.getFilename(compiled['directory']))
+		except OSError:
+			pass
+
+	def isCurrent(self, compiled):
+		try:
+			files = self.fingerprint(compiled['directory'])
+		except OSError:
+			return False
+		return sorted(files) == sorted(tuple(f) for f in compiled['fingerprint'])
+
+	def compile(self, directory):
+		files = self.fingerprint(directory)
+		compiled = {
+			'version':     self.VERSION,
+			'directory':   os.path.realpath(directory),
+			'fingerprint': files,
+			'files':       [],
+		}
+		for file, mtime, size in files:
+			compiled['files'].append((file,
+				GraphCompiler().compile(os.path.join(directory, file))))
+
+		self.write(compiled)
+		return compiled
+
+	def load(self, directory):
+		"""
+		Returns a list of (filename, records) for the graph files in
+		DIRECTORY, compiling the directory if needed. The records
+		are None for graph files that must be parsed.
+		"""
+
+		compiled = self.read(self.getFilename(directory))
+		if not compiled or not self.isCurrent(compiled):
+			compiled = self.compile(directory)
+
+		return [ (os.path.join(directory, file), records)
+			 for file, records in compiled['files'] ]
+
+	def getCompiled(self):
+		"""
+		Returns all the compiled graphs in the cache.
+		"""
+
+		list = []
+		if os.path.isdir(self.path):
+			for file in sorted(os.listdir(self.path)):
+				if file.endswith('.graph'):
+					compiled = self.read(os.path.join(self.path, file))
+					if compiled:
+						list.append(compiled)
+		return list
+
+	def invalidate(self, directories=None):
+		"""
+		Removes the compiled graphs of DIRECTORIES, or all of them.
+		Returns the number of compiled graphs removed.
+		"""
+
+		if directories is None:
+			filenames = []
+			if os.path.isdir(self.path):
+				for file in os.listdir(self.path):
+					if file.endswith('.graph'):
+						filenames.append(os.path.join(self.path, file))
+		else:
+			filenames = [ self.getFilename(d) for d in directories ]
+
+		count = 0
+		for filename in filenames:
+			try:
+				os.unlink(filename)
+				count += 1
+			except FileNotFoundError:
+				pass
+		return count
+
+
+class ProfileCache:
+	"""
+	Persistent cache of the generated host profiles.
+
+	The profile of a host (the output of 'list host xml') is kept with
+	a fingerprint of what it was generated from: the attributes of the
+	host, the contents of the tables read by the report sections, and
+	the graph and node files of the box. The profile is reused until
+	the fingerprint changes.
+
+	Profiles hold secrets, the cache files are only readable by their
+	owner and group (root and apache share the cache directory).
+	"""
+
+	VERSION = 1
+
+	# The tables the report sections read. Attributes are not here,
+	# they are fingerprinted per host, and every install sets some
+	# (e.g. cpus) so the table as a whole changes all the time.
+
+	TABLES = [
+		'oses', 'environments', 'appliances', 'boxes', 'nodes',
+		'subnets', 'networks', 'aliases', 'carts', 'rolls', 'stacks',
+		'cart_stacks', 'groups', 'memberships', 'scope_map',
+		'firewall_rules', 'routes', 'storage_controller',
+		'storage_partition', 'public_keys'
+	]
+
+	def __init__(self, path='/var/cache/stack/profile'):
+		self.path   = path
+		self.stamps = {}
+
+	def getFilename(self, host):
+		return os.path.join(self.path, '%s.profile' % host)
+
+	def stamp(self, directory):
+		"""
+		Returns the name, mtime and size of the graph and node files
+		of a pallet or cart DIRECTORY, and of its top level entries
+		(so adding packages to a cart is noticed as well).
+		"""
+
+		if directory not in self.stamps:
+			files = []
+			if os.path.isdir(directory):
+				for entry in sorted(os.listdir(directory)):
+					st = os.stat(os.path.join(directory, entry))
+					files.append((entry, st.st_mtime_ns, st.st_size))
+				for sub in [ 'graph', 'nodes' ]:
+					for path, dirs, names in os.walk(os.path.join(directory, sub)):
+						dirs.sort()
+						for name in sorted(names):
+							st = os.stat(os.path.join(path, name))
+							files.append((os.path.join(path, name),
+								      st.st_mtime_ns, st.st_size))
+			self.stamps[directory] = files
+		return self.stamps[directory]
+
+	def fingerprint(self, attrs, tables, directories, files=[]):
+		"""
+		Returns the fingerprint of a profile generated from the host
+		ATTRS, the (table, checksum) rows of TABLES, and the
+		DIRECTORIES and FILES it reads.
+		"""
+
+		m = hashlib.md5()
+		m.update(repr(sorted(attrs.items())).encode())
+		m.update(repr(sorted(tables)).encode())
+		for directory in directories:
+			m.update(repr((directory, self.stamp(directory))).encode())
+		for file in files:
+			try:
+				st = os.stat(file)
+				m.update(repr((file, st.st_mtime_ns, st.st_size)).encode())
+			except OSError:
+				m.update(repr((file, None)).encode())
+		return m.hexdigest()
+
+	def read(self, filename):
+		# The cache directory is shared with apache, so the entries
+		# are plain JSON and anything that does not look like one
+		# is a miss.
+
+		try:
+			with open(filename) as fin:
+				entry = json.load(fin)
+		except Exception:
+			return None
+
+		if not isinstance(entry, dict) or entry.get('version') != self.VERSION:
+			return None
+		for key, types in [ ('host', str), ('fingerprint', str),
+				    ('time', (int, float)), ('profile', str) ]:
+			if not isinstance(entry.get(key), types):
+				return None
+		return entry
+
+	def write(self, entry):
+		# Same as the graph cache, failing to save the profile only
+		# costs us generating it again.
+
+		try:
+			os.makedirs(self.path, mode=0o770, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=self.path)
+			os.fchmod(fd, 0o660)
+			with os.fdopen(fd, 'w') as fout:
+				json.dump(entry, fout)
+			os.replace(tmp, self.getFilename(entry['host']))
+		except OSError:
+			pass
+
+	def get(self, host, fingerprint):
+		"""
+		Returns the cached profile of HOST if it was generated from
+		the same FINGERPRINT, otherwise None.
+		"""
+
+		entry = self.read(self.getFilename(host))
+		if entry and entry['fingerprint'] == fingerprint:
+			self.record(host, True)
+			return entry['profile']
+
+		self.record(host, False)
+		return None
+
+	def put(self, host, fingerprint, profile):
+		self.write({
+			'version':     self.VERSION,
+			'host':	       host,
+			'fingerprint': fingerprint,
+			'time':	       time.time(),
+			'profile':     profile
+		})
+
+	def getStatsFilename(self, host):
+		return os.path.join(self.path, '%s.stats' % host)
+
+	def record(self, host, hit):
+		"""
+		Counts a cache hit or miss for HOST. Each host has its own
+		counts, so only lookups of the same host wait on each
+		other.
+		"""
+
+		try:
+			os.makedirs(self.path, mode=0o770, exist_ok=True)
+			fd = os.open(self.getStatsFilename(host), os.O_RDWR | os.O_CREAT, 0o660)
+		except OSError:
+			return
+
+		with os.fdopen(fd, 'r+') as f:
+			fcntl.flock(f, fcntl.LOCK_EX)
+			counts = self.readCounts(f)
+			counts[0 if hit else 1] += 1
+			f.seek(0)
+			f.truncate()
+			f.write(json.dumps(counts))
+
+	def readCounts(self, f):
+		try:
+			counts = json.loads(f.read() or '[0, 0]')
+		except ValueError:
+			counts = None
+		if not isinstance(counts, list) or len(counts) != 2 or \
+		   not all(isinstance(c, int) for c in counts):
+			counts = [ 0, 0 ]
+		return counts
+
+	def getStats(self):
+		"""
+		Returns a dictionary of host to their [ hits, misses ].
+		"""
+
+		stats = {}
+		if os.path.isdir(self.path):
+			for file in sorted(os.listdir(self.path)):
+				if file.endswith('.stats'):
+					try:
+						with open(os.path.join(self.path, file)) as f:
+							fcntl.flock(f, fcntl.LOCK_SH)
+							stats[file[:-len('.stats')]] = self.readCounts(f)
+					except OSError:
+						pass
+		return stats
+
+	def getEntries(self):
+		"""
+		Returns all the cached profiles.
+		"""
+
+		list = []
+		if os.path.isdir(self.path):
+			for file in sorted(os.listdir(self.path)):
+				if file.endswith('.profile'):
+					entry = self.read(os.path.join(self.path, file))
+					if entry:
+						list.append(entry)
+		return list
+
+	def invalidate(self, hosts=None):
+		"""
+		Removes the cached profiles of HOSTS, or all of them, along
+		with their hit counts. Returns the number of profiles
+		removed.
+		"""
+
+		if hosts is None:
+			hosts = []
+			if os.path.isdir(self.path):
+				for file in os.listdir(self.path):
+					if file.endswith('.profile'):
+						hosts.append(file[:-len('.profile')])
+					elif file.endswith('.stats'):
+						try:
+							os.unlink(os.path.join(self.path, file))
+						except FileNotFoundError:
+							pass
+
+		count = 0
+		for host in hosts:
+			try:
+				os.unlink(self.getFilename(host))
+				count += 1
+			except FileNotFoundError:
+				pass
+			try:
+				os.unlink(self.getStatsFilename(host))
+			except FileNotFoundError:
+				pass
+
+		return count
+
+
 class NodeHandler(handler.ContentHandler,
 		  handler.DTDHandler,
 		  handler.EntityResolver,
@@ -535,10 +1071,101 @@ class NodeHandler(handler.ContentHandler,
 
 
 
+class NodeTokenizer(handler.ContentHandler, AttributeHandler):
+	"""
+	Records the SAX events of a node file parsed without any entities
+	defined, the references to the (attribute) entities are recorded
+	in their place. GraphHandler.replayPass1 feeds the events to the
+	Pass1NodeHandler substituting the entities of the host, which is
+	the same as parsing the file with the entities defined.
+
+	The tokens of each node file are kept until the file changes.
+	"""
+
+	cache = {}
+
+	# An entity in an attribute value is expanded by the parser
+	# without telling us, files that do this are always parsed.
+
+	attrEntity = re.compile(r'<[^>]*&(?!(?:amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)[^;\s]+;[^>]*>')
+
+	def __init__(self):
+		handler.ContentHandler.__init__(self)
+		self.setAttributes({})
+		self.tokens = []
+
+	def startElementNS(self, name, qname, attrs):
+		self.tokens.append(('start', name, qname, attrs))
+
+	def endElementNS(self, name, qname):
+		self.tokens.append(('end', name, qname))
+
+	def characters(self, s):
+		self.tokens.append(('chars', s))
+
+	def skippedEntity(self, name):
+		self.tokens.append(('entity', name))
+
+	@classmethod
+	def getTokens(cls, filename, xmlns):
+		"""
+		Returns the tokens of the node file FILENAME, or None if the
+		file must be parsed.
+		"""
+
+		try:
+			st = os.stat(filename)
+		except OSError:
+			return None
+
+		key = (filename, xmlns)
+		if key in cls.cache:
+			mtime, size, tokens = cls.cache[key]
+			if (mtime, size) == (st.st_mtime_ns, st.st_size):
+				return tokens
+
+		tokens = cls.tokenize(filename, xmlns)
+		cls.cache[key] = (st.st_mtime_ns, st.st_size, tokens)
+		return tokens
+
+	@classmethod
+	def tokenize(cls, filename, xmlns):
+		with open(filename, 'r') as fin:
+			lines = fin.readlines()
+
+		if cls.attrEntity.search(''.join(lines)):
+			return None
+
+		tokenizer = cls()
+		parser    = make_parser(["stack.expatreader"])
+		parser.setContentHandler(tokenizer)
+		parser.setFeature(handler.feature_namespaces, True)
+		parser.feed(tokenizer.getXMLHeader())
+		parser.feed('<stack:ns %s>' % xmlns)
+
+		try:
+			for line in lines:
+				if line.find('<?xml') != -1:
+					continue
+				parser.feed(line)
+			parser.feed('</stack:ns>')
+		except Exception:
+			# Parse the file for real so the error is reported
+			return None
+
+		return tokenizer.tokens
+
+
 class Pass1NodeHandler(NodeHandler):
 
 	"""Sax Parser for the Kickstart Node files"""
 
+	# Reuse the output of identical eval and report sections, unless
+	# the section sets stack:cache="false".
+
+	evalCache = True
+	filename  = None
+
 	def __init__(self, node, filename, attrs, eval=0, rcl=None):
 
 		NodeHandler.__init__(self, node, attrs)
@@ -571,6 +1198,12 @@ class Pass1NodeHandler(NodeHandler):
 					       self.attributes)
 
 
+	def getCacheAttr(self, attrs):
+		cache = self.getAttr(attrs, 'stack:cache') or self.getAttr(attrs, 'cache')
+		if cache is None:
+			return True
+		return str2bool(cache)
+
 	def startTag_stack_description(self, ns, tag, attrs):
 		self.stripText = True
 
@@ -622,6 +1255,8 @@ class Pass1NodeHandler(NodeHandler):
 			return
 		if not self.doEval or not self.rcl:
 			return
+		self.evalCache = self.getCacheAttr(attrs)
+
 		# still allow non-namespace xml attributes (deprecated)
 		prefix = self.getAttr(attrs, 'prefix')
 		command = self.getAttr(attrs, 'stack:name') or self.getAttr(attrs, 'name')
@@ -637,7 +1272,8 @@ class Pass1NodeHandler(NodeHandler):
 			return
 		if not self.doEval or not self.rcl:
 			return
-		result = self.rcl.command(self.rclCommand, self.rclArgs)
+		result = stack.evaluate.executor.report(self.rcl, self.rclCommand, self.rclArgs,
+							 self.filename, self.evalCache)
 		if not result: # do not return None
 			result = ''
 		self.xml.append(result)
@@ -655,6 +1291,7 @@ class Pass1NodeHandler(NodeHandler):
 			return
 		if not self.doEval:
 			return
+		self.evalCache = self.getCacheAttr(attrs)
 
 		# Same as stack_report still allow non-namespace xml
 		# attributes, we will kill this off after we know
@@ -705,15 +1342,11 @@ class Pass1NodeHandler(NodeHandler):
 				i += 1
 
 
-		p = subprocess.Popen([ '%s' % self.evalShell ],
-				     stdin=subprocess.PIPE,
-				     stdout=subprocess.PIPE,
-				     stderr=subprocess.PIPE)
-
 		s = ''.join(self.evalText)
-		out, err = p.communicate(s.encode())
+		returncode, out, err = stack.evaluate.executor.run(self.evalShell, s,
+								   self.filename, self.evalCache)
 
-		if p.returncode != 0:
+		if returncode != 0:
 			raise stack.util.KickstartNodeError(
 				f"Failed to evaluate {self.evalText} using {self.evalShell} with error:\n\n{err}"
 			)
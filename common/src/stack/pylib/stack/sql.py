@@ -0,0 +1,236 @@
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+
+import re
+import threading
+from collections import OrderedDict
+
+# Foreign keys that delete (or null out) rows in other tables when a row
+# is deleted from the referenced table. This mirrors the ON DELETE clauses
+# in database-schema.xml and is used to widen cache invalidation for
+# deletes, since the database changes the dependent tables behind our back.
+
+_CASCADES = {
+	'appliances':		 ('nodes', 'scope_map'),
+	'bootactions':		 ('nodes',),
+	'bootnames':		 ('bootactions',),
+	'boxes':		 ('cart_stacks', 'nodes', 'stacks'),
+	'carts':		 ('cart_stacks',),
+	'environments':		 ('nodes', 'scope_map'),
+	'firmware':		 ('firmware_mapping',),
+	'firmware_version_regex': ('firmware_make', 'firmware_model'),
+	'groups':		 ('memberships',),
+	'ib_partitions':	 ('ib_memberships',),
+	'networks':		 ('aliases', 'ib_memberships', 'switchports'),
+	'nodes':		 ('boot', 'firmware_mapping', 'ib_memberships',
+				  'ib_partitions', 'memberships', 'networks',
+				  'partitions', 'public_keys', 'scope_map',
+				  'switchports'),
+	'oses':			 ('bootactions', 'boxes', 'scope_map'),
+	'rolls':		 ('stacks',),
+	'scope_map':		 ('attributes', 'shadow.attributes',
+				  'firewall_rules', 'routes',
+				  'storage_controller', 'storage_partition'),
+	'subnets':		 ('firewall_rules', 'networks', 'routes'),
+}
+
+_SQL_TABLE   = r'`?[a-zA-Z_][\w$]*`?(?:\.`?[a-zA-Z_][\w$]*`?)?'
+_SQL_SOURCES = re.compile(
+	r'\b(?:from|join)\s+(%s(?:\s+(?:as\s+)?\w+)?(?:\s*,\s*%s(?:\s+(?:as\s+)?\w+)?)*)'
+	% (_SQL_TABLE, _SQL_TABLE), re.IGNORECASE
+)
+_SQL_TARGET  = re.compile(
+	r'^(?:insert|replace)\s+(?:(?:low_priority|delayed|high_priority|ignore)\s+)*(?:into\s+)?(%s)'
+	r'|^update\s+(?:(?:low_priority|ignore)\s+)*(.+?)\s+set\b'
+	r'|^delete\s+(?:(?:low_priority|quick|ignore)\s+)*(?:from\s+)?(%s)'
+	r'|^truncate\s+(?:table\s+)?(%s)'
+	% (_SQL_TABLE, _SQL_TABLE, _SQL_TABLE), re.IGNORECASE | re.DOTALL
+)
+_SQL_SINGLE_DELETE = re.compile(
+	r'^delete\s+(?:(?:low_priority|quick|ignore)\s+)*from\s(?!.*\busing\b)',
+	re.IGNORECASE | re.DOTALL
+)
+
+
+def _sql_verb(command):
+	"""
+	Returns the lowercase leading keyword of an SQL statement, skipping
+	over the parentheses that start a UNION of selects.
+	"""
+
+	words = command.lstrip('( \t\n').split(None, 1)
+	if words:
+		return words[0].lower()
+	return ''
+
+
+def _sql_table_name(name, database=None):
+	"""
+	Normalize a table reference, dropping quoting and the qualifier for
+	the current database so "cluster.nodes" and "nodes" are the same.
+	"""
+
+	name = name.replace('`', '').lower()
+	if database and name.startswith(f'{database.lower()}.'):
+		name = name.split('.', 1)[1]
+	return name
+
+
+def sql_read_tables(command, database=None):
+	"""
+	Returns the set of tables a select reads, or None if they could not
+	be determined.
+	"""
+
+	tables = set()
+	for sources in _SQL_SOURCES.findall(command):
+		for source in sources.split(','):
+			tables.add(_sql_table_name(source.split()[0], database))
+
+	return tables or None
+
+
+def sql_write_tables(command, database=None):
+	"""
+	Returns the set of tables whose contents may change by running the
+	SQL statement. This includes the tables changed by foreign key
+	cascades. An empty set means nothing changes (e.g. a commit), and
+	None means anything could have changed.
+	"""
+
+	verb = _sql_verb(command)
+	if verb in ('select', 'show', 'describe', 'desc', 'explain', 'checksum',
+		    'begin', 'start', 'commit', 'savepoint', 'release'):
+		return set()
+
+	match = _SQL_TARGET.match(command.strip())
+	if not match:
+		return None
+
+	insert, update, delete, truncate = match.groups()
+	if update:
+		# The table references of an update may be a join
+		tables = sql_read_tables(f'from {update}', database) or set()
+	elif delete and _SQL_SINGLE_DELETE.match(command.strip()):
+		tables = {_sql_table_name(delete, database)}
+	elif delete:
+		# Multi-table deletes can name their targets anywhere in
+		# the table list, so take every table mentioned.
+		tables = sql_read_tables(command, database) or set()
+		tables.add(_sql_table_name(delete, database))
+	else:
+		tables = {_sql_table_name(insert or truncate, database)}
+
+	# Deletes (a replace is a delete followed by an insert) ripple
+	# through the foreign keys.
+	if verb in ('delete', 'replace', 'truncate'):
+		pending = list(tables)
+		while pending:
+			for dependent in _CASCADES.get(pending.pop(), ()):
+				if dependent not in tables:
+					tables.add(dependent)
+					pending.append(dependent)
+
+	return tables
+
+
+class SelectCache:
+	"""
+	Bounded LRU cache of select results for a single database.
+
+	Each entry remembers which tables its query read, so a write only
+	evicts the entries that read one of the tables it modified. Entries
+	for queries whose tables could not be determined are evicted by any
+	write.
+	"""
+
+	ANY = '*'
+
+	def __init__(self, maxsize=None):
+		self.maxsize   = maxsize
+		self.entries   = OrderedDict()	# key -> (tables, rows)
+		self.readers   = {}		# table -> set of keys
+		self.lock      = threading.RLock()
+		self.hits      = 0
+		self.misses    = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def get(self, key):
+		"""
+		Returns the cached rows for KEY, or None on a miss.
+		"""
+
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return self.entries[key][1]
+
+	def put(self, key, rows, tables=None):
+		"""
+		Cache ROWS under KEY. TABLES is the set of tables the query
+		read, None means unknown.
+		"""
+
+		tables = frozenset(tables or (self.ANY,))
+
+		with self.lock:
+			self._remove(key)
+			self.entries[key] = (tables, rows)
+			for table in tables:
+				self.readers.setdefault(table, set()).add(key)
+
+			while self.maxsize and len(self.entries) > self.maxsize:
+				self._remove(next(iter(self.entries)))
+				self.evictions += 1
+
+	def invalidate(self, tables=None):
+		"""
+		Evict every entry that read from any of TABLES, or everything
+		if TABLES is None. Returns the number of entries evicted.
+		"""
+
+		with self.lock:
+			if tables is None:
+				count = len(self.entries)
+				self.entries.clear()
+				self.readers.clear()
+				return count
+
+			keys = set(self.readers.get(self.ANY, ()))
+			for table in tables:
+				keys.update(self.readers.get(table, ()))
+			for key in keys:
+				self._remove(key)
+			return len(keys)
+
+	def stats(self):
+		with self.lock:
+			return {
+				'entries':   len(self.entries),
+				'hits':      self.hits,
+				'misses':    self.misses,
+				'evictions': self.evictions,
+			}
+
+	def _remove(self, key):
+		entry = self.entries.pop(key, None)
+		if entry:
+			for table in entry[0]:
+				keys = self.readers.get(table)
+				if keys:
+					keys.discard(key)
+					if not keys:
+						del self.readers[table]
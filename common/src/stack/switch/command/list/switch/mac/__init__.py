@@ -4,6 +4,8 @@
 # https://github.com/Teradata/stacki/blob/master/LICENSE.txt
 # @copyright@
 
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import stack.commands
 import stack.util
 from stack.exception import CommandError
@@ -35,6 +37,26 @@ class Command(command):
 	List mac table for all known switches/
 	</example>
 	"""
+	# Number of switches queried at the same time
+	SwitchThreads = 32
+
+	# Number of hosts pinged at the same time
+	PingProcesses = 256
+
+	def ping(self, addresses):
+		"""
+		Pings each address once, many at a time, and waits for all
+		of them.
+		"""
+		running = []
+		for address in addresses:
+			if len(running) >= self.PingProcesses:
+				running.pop(0).wait()
+			running.append(subprocess.Popen(['ping', '-c', '1', '-W', '1', address],
+				stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+		for p in running:
+			p.wait()
+
 	def run(self, params, args):
 
 		(pinghosts,) = self.fillParams([
@@ -44,11 +66,58 @@ class Command(command):
 		self.pinghosts = self.str2bool(pinghosts)
 
 		_switches = self.getSwitchNames(args)
+		switches = self.call('list.host.interface', _switches)
+
+		# Everything the implementations need is loaded here once,
+		# rather than for every switch or every mac address.
+
+		self.switch_attrs = self.getHostAttrDict(list(_switches)) if _switches else {}
+		self.frontend_interfaces = self.call('list.host.interface', ['localhost'])
+		self.macs = {}
+		for mac, host, interface in self.db.select("""
+			networks.mac, nodes.name, networks.device FROM nodes, networks
+			WHERE networks.node=nodes.id AND networks.mac IS NOT NULL
+			"""):
+			self.macs.setdefault(mac.lower(), (host, interface))
+
+		# Send traffic through the switches first before requesting
+		# the mac tables
+		if self.pinghosts and switches:
+			networks = set(switch['network'] for switch in switches)
+			self.ping(dict.fromkeys(
+				host['ip'] for host in self.call('list.host.interface')
+				if host['network'] in networks and host['ip']))
+
+		# Query the switches with a known model concurrently
+		queries = []
+		for switch in switches:
+			model = self.switch_attrs.get(switch['host'], {}).get('component.model')
+			if model and model not in self.impl_list:
+				self.loadImplementation(model)
+			if model in self.impl_list:
+				queries.append((self.impl_list[model], switch))
+
+		with ThreadPoolExecutor(max_workers = self.SwitchThreads) as executor:
+			futures = [
+				executor.submit(implementation.run, [switch])
+				for implementation, switch in queries
+			]
+
 		self.beginOutput()
-		for switch in self.call('list.host.interface', _switches):
+		errors = []
+		for future in futures:
+			error = future.exception()
+			if error is not None:
+				# if this looks like a stacki exception type, grab the message from it.
+				if hasattr(error, 'message') and callable(getattr(error, 'message')):
+					errors.append(error.message())
+				else:
+					errors.append(f'{error}')
+				continue
+			for switch_name, row in future.result() or []:
+				self.addOutput(switch_name, row)
 
-			switch_name = switch['host']
-			model = self.getHostAttr(switch_name, 'component.model')
-			self.runImplementation(model, [switch])
+		if errors:
+			raise CommandError(self, '\n'.join(errors))
 
 		self.endOutput(header=['switch', 'port',  'mac', 'host', 'interface', 'vlan'])
@@ -5,7 +5,6 @@
 # @copyright@
 
 import stack.commands
-import subprocess
 from stack.exception import CommandError
 from stack.switch import SwitchException
 from stack.switch.x1052 import SwitchDellX1052
@@ -13,28 +12,28 @@ from stack.switch.x1052 import SwitchDellX1052
 
 class Implementation(stack.commands.Implementation):
 	def run(self, args):
+		"""
+		Returns the (switch, [port, mac, host, interface, vlan]) rows
+		of the known hosts in the mac address table of the switch.
+		"""
 
 		switch = args[0]
 
 		# Get frontend ip for tftp address
 		try:
-			(_frontend, *args) = [host for host in self.owner.call('list.host.interface', ['localhost'])
+			(_frontend, *args) = [host for host in self.owner.frontend_interfaces
 					if host['network'] == switch['network']]
 		except:
 			raise CommandError(self, '"%s" and the frontend do not share a network' % switch['host'])
 
-		# Send traffic through the switch first before requesting mac table
-		if self.owner.pinghosts:
-			_host_interfaces = [host for host in self.owner.call('list.host.interface')
-					if host['network'] == switch['network']]
-			for host in _host_interfaces:
-				x = subprocess.Popen(['ping', '-c', '1', host['ip']], stdout=subprocess.PIPE)
-
 		frontend_tftp_address = _frontend['ip']
 		switch_address = switch['ip']
 		switch_name = switch['host']
-		switch_username = self.owner.getHostAttr(switch_name, 'switch_username')
-		switch_password = self.owner.getHostAttr(switch_name, 'switch_password')
+		switch_attrs = self.owner.switch_attrs.get(switch_name, {})
+		switch_username = switch_attrs.get('switch_username')
+		switch_password = switch_attrs.get('switch_password')
+
+		rows = []
 
 		# Connect to the switch
 		with SwitchDellX1052(switch_address, switch_name, switch_username, switch_password) as switch:
@@ -44,17 +43,16 @@ class Implementation(stack.commands.Implementation):
 
 				hosts = switch.get_mac_address_table()
 				for _vlan, _mac, _port, _ in hosts:
-					row = self.owner.db.select("""
-						nodes.name, networks.device FROM nodes, networks
-						WHERE networks.node=nodes.id AND networks.mac=%s
-					""", (_mac,))
+					row = self.owner.macs.get(_mac.lower())
 
 					if row:
-						_hostname, _interface = row[0]
-						self.owner.addOutput(switch_name,
-							[_port, _mac, _hostname, _interface, _vlan])
+						_hostname, _interface = row
+						rows.append((switch_name,
+							[_port, _mac, _hostname, _interface, _vlan]))
 
 			except SwitchException as switch_error:
 				raise CommandError(self, switch_error)
 			except Exception as exception:
 				raise CommandError(self, f"There was an error getting the mac address table. {exception}")
+
+		return rows
@@ -10,7 +10,8 @@ class Command(stack.commands.Command):
 	"""
 	Report /etc/sudoers.d/stacki_ws file with
 	a list of all the commands that can be called
-	by apache using sudo
+	by apache using sudo, and the webservice sudo
+	worker that runs them
 	<example cmd="report api sudo command">
 	Output the /etc/sudoers.d/stacki_ws file
 	</example>
@@ -29,7 +30,8 @@ class Command(stack.commands.Command):
 			self.addOutput(None, "<stack:file stack:name='/etc/sudoers.d/stacki_ws' stack:perms='0400' stack:rcs='no'>")
 			self.addOutput(None, "# Stacki - SUDO Access to run commands as Apache")
 			self.addOutput(None, "Cmnd_Alias STACK_CMDS = %s" % ', \\\n\t'.join(sudo_list))
-			self.addOutput(None, "Defaults!STACK_CMDS !requiretty")
-			self.addOutput(None, "apache ALL = (root) NOPASSWD:STACK_CMDS")
+			self.addOutput(None, "Cmnd_Alias STACK_WORKER = /opt/stack/sbin/ws-sudo-worker \"\"")
+			self.addOutput(None, "Defaults!STACK_CMDS, STACK_WORKER !requiretty")
+			self.addOutput(None, "apache ALL = (root) NOPASSWD:STACK_CMDS, STACK_WORKER")
 			self.addOutput(None, "</stack:file>")
 			self.endOutput()
@@ -0,0 +1,67 @@
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+
+import re
+import threading
+from functools import lru_cache
+
+from django.db.models import Count, Max
+
+
+@lru_cache(maxsize=4096)
+def commandPattern(command):
+	"""
+	Returns the compiled regular expression of a command list entry
+	(e.g. "list host *") for matching module names ("list.host.attr").
+	"""
+
+	return re.compile(re.sub('[ \t]+', '.', command))
+
+
+def commandMatch(command, mod):
+	"""
+	Returns True if the command list entry COMMAND matches the entire
+	module name MOD.
+	"""
+
+	m = commandPattern(str(command)).match(mod)
+	return bool(m) and m.group() == mod
+
+
+class CommandMatcher:
+	"""
+	Matches module names against the commands of a command list model
+	(BlackList, SudoList).
+
+	The commands are read once and kept until the model changes. The
+	lists only ever have entries added and removed, and are changed
+	from other processes (e.g. 'stack add api blacklist command'), so
+	a change is noticed by the row count and highest id of the table.
+	"""
+
+	def __init__(self, model):
+		self.model    = model
+		self.commands = None
+		self.stamp    = None
+		self.lock     = threading.Lock()
+
+	def getCommands(self):
+		stamp = self.model.objects.aggregate(count=Count('id'), last=Max('id'))
+		stamp = (stamp['count'], stamp['last'])
+
+		with self.lock:
+			if self.commands is None or stamp != self.stamp:
+				self.commands = [ row['command'] for row in self.model.objects.values('command') ]
+				self.stamp    = stamp
+			return self.commands
+
+	def match(self, mod):
+		for command in self.getCommands():
+			if commandMatch(command, mod):
+				return True
+		return False
@@ -9,6 +9,7 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User, Group
 from stack.restapi.models import UserAccess,GroupAccess
+from stack.restapi.acl import commandMatch
 import re
 
 class CommandBackend(ModelBackend):
@@ -59,11 +60,7 @@ class CommandBackend(ModelBackend):
 		# Also, make sure that the matches are exact
 		# and not just subset matches
 		for p in perms:
-			p = re.sub('[ \t]+','.',p)
-			r = re.compile(str(p))
-			m = r.match(perm)
-			if m:
-				if m.group() == perm:
-					return True
+			if commandMatch(p, perm):
+				return True
 
 		return False
@@ -0,0 +1,91 @@
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+
+import threading
+from contextlib import contextmanager
+
+from stack.commands import get_mysql_connection
+
+
+class ConnectionPool:
+	"""
+	Pool of open database connections for running commands, kept per
+	database user. Up to SIZE idle connections of each user are kept
+	open between requests, rather than connecting for every request.
+	"""
+
+	def __init__(self, size=4):
+		self.size = size
+		self.idle = {}		# (user, password) -> [ connection ]
+		self.lock = threading.Lock()
+
+	def acquire(self, user=None, password=None):
+		with self.lock:
+			idle = self.idle.get((user, password))
+			connection = idle.pop() if idle else None
+
+		if connection:
+			# The server may have dropped the connection while
+			# it sat in the pool.
+			try:
+				connection.ping(reconnect=True)
+				return connection
+			except Exception:
+				self.discard(connection)
+
+		return get_mysql_connection(user, password)
+
+	def release(self, connection, user=None, password=None):
+		if not connection:
+			return
+
+		# Never hand out a connection in the middle of a
+		# transaction a failed command left behind.
+		try:
+			connection.rollback()
+		except Exception:
+			self.discard(connection)
+			return
+
+		with self.lock:
+			idle = self.idle.setdefault((user, password), [])
+			if len(idle) < self.size:
+				idle.append(connection)
+				return
+		self.discard(connection)
+
+	def discard(self, connection):
+		try:
+			connection.close()
+		except Exception:
+			pass
+
+	@contextmanager
+	def connection(self, user=None, password=None):
+		"""
+		Context manager for a pooled connection. The connection is
+		None if the database cannot be reached, the same as
+		get_mysql_connection().
+		"""
+
+		connection = self.acquire(user, password)
+		try:
+			yield connection
+		except BaseException:
+			self.discard(connection)
+			connection = None
+			raise
+		finally:
+			self.release(connection, user, password)
+
+	def close(self):
+		with self.lock:
+			connections = [ c for idle in self.idle.values() for c in idle ]
+			self.idle   = {}
+		for connection in connections:
+			self.discard(connection)
@@ -0,0 +1,158 @@
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+
+import json
+import struct
+import threading
+import subprocess
+
+
+def send(stream, message):
+	data = json.dumps(message).encode()
+	stream.write(struct.pack('!I', len(data)) + data)
+	stream.flush()
+
+
+def recv(stream):
+	"""
+	Returns the next message on STREAM, or None at the end of it.
+	"""
+
+	def read(size):
+		data = b''
+		while len(data) < size:
+			chunk = stream.read(size - len(data))
+			if not chunk:
+				return None
+			data += chunk
+		return data
+
+	header = read(4)
+	if header is None:
+		return None
+	size, = struct.unpack('!I', header)
+	data = read(size)
+	if data is None:
+		return None
+	return json.loads(data.decode())
+
+
+class SudoWorker:
+	"""
+	Client of the privileged worker (ws-sudo-worker) that runs the sudo
+	list commands for the webservice.
+
+	The worker is started with sudo the first time it is needed and
+	then kept running, instead of a sudo and a new stack process for
+	every command. The worker checks every command against the sudoers
+	file itself.
+	"""
+
+	COMMAND = [ '/usr/bin/sudo', '-n', '/opt/stack/sbin/ws-sudo-worker' ]
+
+	def __init__(self):
+		self.process = None
+		self.lock    = threading.Lock()
+
+	def start(self):
+		"""
+		Starts the worker and waits for it to be ready. Returns
+		False if it cannot be started (e.g. the sudoers file does
+		not allow it yet).
+		"""
+
+		try:
+			self.process = subprocess.Popen(self.COMMAND,
+							stdin=subprocess.PIPE,
+							stdout=subprocess.PIPE,
+							stderr=subprocess.DEVNULL)
+			hello = recv(self.process.stdout)
+		except (OSError, ValueError, struct.error):
+			hello = None
+
+		if not hello or not hello.get('ready'):
+			self.close()
+			return False
+		return True
+
+	def run(self, command, args):
+		"""
+		Returns the exit code, output, and error output of running
+		the stack command COMMAND (e.g. "sync.config") with ARGS as
+		root, or None if there is no worker to run it.
+		"""
+
+		with self.lock:
+			if not self.process or self.process.poll() is not None:
+				if not self.start():
+					return None
+
+			try:
+				send(self.process.stdin, { 'command': command, 'args': args })
+				result = recv(self.process.stdout)
+			except (OSError, ValueError, struct.error):
+				result = None
+
+			if result is None:
+				# The command may or may not have run, so
+				# it must not be run again.
+				self.close()
+				return (1, '', 'sudo worker failed running %s' % command.replace('.', ' '))
+
+			return (result['rc'], result['output'], result['error'])
+
+	def close(self):
+		if not self.process:
+			return
+		try:
+			self.process.stdin.close()
+			self.process.wait(timeout=5)
+		except (OSError, subprocess.TimeoutExpired):
+			self.process.kill()
+		self.process = None
+
+
+class SudoWorkerPool:
+	"""
+	Up to SIZE sudo workers, so one long command (e.g. 'sync config')
+	does not hold up the others. Workers are started as they are needed
+	and kept for the next commands, and a command waits for a worker
+	only when all SIZE of them are busy.
+	"""
+
+	def __init__(self, size=4):
+		self.size    = size
+		self.idle    = []
+		self.workers = 0
+		self.cond    = threading.Condition()
+
+	def run(self, command, args):
+		"""
+		Runs COMMAND with ARGS on an idle worker, see SudoWorker.run.
+		"""
+
+		with self.cond:
+			while not self.idle and self.workers >= self.size:
+				self.cond.wait()
+			if self.idle:
+				worker = self.idle.pop()
+			else:
+				worker = SudoWorker()
+				self.workers += 1
+
+		try:
+			return worker.run(command, args)
+		finally:
+			with self.cond:
+				self.idle.append(worker)
+				self.cond.notify()
+
+	def close(self):
+		with self.cond:
+			for worker in self.idle:
+				worker.close()
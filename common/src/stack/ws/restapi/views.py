@@ -14,9 +14,11 @@ from django.contrib.auth import authenticate, login, logout
 
 from stack.restapi.models import BlackList
 from stack.restapi.models import SudoList
+from stack.restapi.acl import CommandMatcher
+from stack.restapi.pool import ConnectionPool
+from stack.restapi.sudo import SudoWorkerPool
 from stack.exception import CommandError
 import stack.commands
-from stack.commands import get_mysql_connection
 
 import pymysql
 
@@ -28,7 +30,6 @@ import tempfile
 
 import logging
 import shlex
-import re
 
 import traceback
 
@@ -39,6 +40,60 @@ log = logging.getLogger("SWS")
 # from: https://mariadb.com/kb/en/mariadb/mariadb-error-codes/
 MYSQL_EX = [1044, 1045, 1142, 1143, 1227]
 
+# Shared by all the requests served by this process. The command
+# lists are re-read only when they change, database connections are
+# kept open between requests, and the sudo list commands go to a
+# few privileged workers.
+blacklist   = CommandMatcher(BlackList)
+sudolist    = CommandMatcher(SudoList)
+connections = ConnectionPool()
+sudoworkers = SudoWorkerPool()
+
+
+# Command classes found so far, by module name. Modules that are not
+# found are looked for again, a pallet may add them later.
+commands = {}
+
+def findCommand(mod_name):
+	"""
+	Returns the Command class of the command module MOD_NAME
+	(e.g. "list.host"), or None if there is no such command.
+	"""
+
+	Command = commands.get(mod_name)
+	if Command:
+		return Command
+
+	mod = 'stack.commands.%s' % mod_name
+	try:
+		__import__(mod)
+	except ImportError:
+		return None
+	except:
+		log.error("%s: %s" % (mod, sys.exc_info()[1]))
+		return None
+
+	Command = getattr(sys.modules[mod], 'Command', None)
+	if Command:
+		commands[mod_name] = Command
+	return Command
+
+
+def resolveCommand(args):
+	"""
+	Finds the command for the longest leading part of ARGS.
+	Returns the module name, Command class, and the rest of
+	ARGS as the command arguments, or None for the name and
+	class if there is no command.
+	"""
+
+	for i in range(len(args), 0, -1):
+		mod_name = '.'.join(args[:i])
+		Command = findCommand(mod_name)
+		if Command:
+			return mod_name, Command, args[i:]
+	return None, None, list(args)
+
 
 class StackWS(View):
 
@@ -80,17 +135,13 @@ class StackWS(View):
 		# Filter out all the args
 		args = [a for a in filter(lambda x: len(x.split('=')) == 1, args)]
 
-		done = False
-		command = None
-		cmd_arg_list = []
-
 		# Get the command module to execute
 		mod_name = '.'.join(args)
 
 		log.info(f'user {request.user.username} called "{mod_name}" {params}')
 
 		# Check if command is blacklisted
-		if self._blacklisted(mod_name):
+		if blacklist.match(mod_name):
 			return HttpResponseForbidden(f'Blacklisted Command: Command {mod_name} is not permitted',
 						     content_type="text/plain")
 
@@ -101,220 +152,181 @@ class StackWS(View):
 						     (request.user.username, mod_name),
 						     content_type="text/plain")
 
-		try:
-			# Get command module class
-			if request.user.is_superuser:
-				connection = get_mysql_connection()
-			else:
-				connection = get_mysql_connection('nobody', '')
-
-			while not done:
-				try:
-					if len(args) == 0:
-						done = True
-					else:
-						mod_name = '.'.join(args)
-						mod = 'stack.commands.%s' % mod_name
-
-						__import__(mod)
-						m = eval(mod)
-
-						if hasattr(m, 'Command'):
-							command = m.Command(connection)
-
-							# Flush the cache, we do this
-							# since multiple threads may be
-							# running and there is no
-							# mechanism for one thread to
-							# invalidate the cache of
-							# another thread.
-							command.db.clearCache()
-
-							done = True
-						else:
-							cmd_arg_list.append(args.pop())
-				except ImportError:
-					cmd_arg_list.append(args.pop())
-				except:
-					log.error("%s" % sys.exc_info()[1])
-
-			# If command does not exist, return Not Found
-			if not command:
-				output = {"API Error": "Command Not Found"}
-				return HttpResponse(str(json.dumps(output)),
-						content_type="application/json",
-						status=404)
-
-			# Handle case where json data is posted (currently only for `stack load`)
-			with tempfile.NamedTemporaryFile(mode='w') as json_file:
-				# Parse the command out. A couple of special
-				# cases are called out.
-				cmd_arg_list.reverse()
-
-				data = body.get('data')
-				if data:
-					json.dump(data, json_file)
-					json_file.flush()
-					cmd_arg_list.append(json_file.name)
-
-				cmd_arg_list.extend(params)
-				cmd_arg_list.append("output-format=json")
-				cmd_module = str('.'.join(mod.split('.')[2:]))
-
-				# Don't allow "run host" commands. This opens
-				# the door for arbitrary command executions
-				if cmd_module == "run.host":
-					return HttpResponseForbidden(
-						"'run host' command is not permitted",
-						content_type="text/plain",
-					)
-
-				# If command is a sync/load command, run
-				# it with sudo, as the command will require
-				# some root privileges. However, if the user
-				# isn't a django superuser (with admin privileges)
-				# don't allow command to run.
-				elif self._isSudoCommand(cmd_module):
-					if not request.user.is_superuser:
-						cmd_str = cmd_module.replace('.', ' ')
-						return HttpResponseForbidden(
-							f"Command \"{cmd_str}\" requires Admin Privileges" ,
-							content_type="text/plain",
-						)
-					# Run the sync command using sudo
-					else:
-						c = [
-							"/usr/bin/sudo",
-							"/opt/stack/bin/stack",
-						]
-
-						c.extend(cmd_module.split('.'))
-						c.extend(cmd_arg_list)
-						log.info(f'{c}')
-						p = subprocess.Popen(
-							c,
-							stdout=subprocess.PIPE,
-							stderr=subprocess.PIPE,
-							encoding='utf-8',
-						)
-						output, error = p.communicate()
-						rc = p.wait()
-						if rc:
-							j = {"API Error": error, "Output": output}
-							return HttpResponse(
-								str(json.dumps(j)),
-								content_type="application/json",
-								status=500,
-							)
-						else:
-							if not output:
-								output = {}
-
-							# Check to see if text is json
-							try:
-								j = json.loads(output)
-							except:
-								j = {"Output": output}
-
-							return HttpResponse(
-								str(json.dumps(j)),
-								content_type="application/json",
-								status=200,
-							)
-				# If it's not the sync command, run the
-				# command module wrapper directly.
-				else:
-					try:
-						rc = command.runWrapper(cmd_module, cmd_arg_list)
-					# If we hit a database error, check if it's an access
-					# denied error. If so, sanitize the error message, and
-					# don't expose database access.
-					except pymysql.OperationalError as e:
-						errortext = str(sys.exc_info()[1])
-						log.error(errortext)
-						if int(e.args[0]) in MYSQL_EX:
-							errortext = "Database Permission Denied. Admin privileges required"
-							status_code = 403
-						else:
-							status_code = 500
-						return HttpResponse(
-							json.dumps({'API Error': errortext}),
-							content_type='application/json',
-							status=status_code,
-						)
-					except CommandError as e:
-						# Get output from command
-						text = command.getText()
-
-						if not text:
-							text = {}
-
-						return HttpResponse(
-							json.dumps({'API Error': '%s' % e, 'Output': text}),
-							content_type='application/json',
-							status=500,
-						)
-
-					# Any other type of error, simply forward it
-					# to the client
-					except:
-						errortext = str(traceback.format_exc())
-						log.error(errortext)
-						return HttpResponse(
-							json.dumps({'API Error': errortext}),
-							content_type='application/json',
-							status=500,
-						)
-
-					# Get output from command
-					text = command.getText()
-
-					if not text:
-						text = {}
-
-					# Check to see if text is json
-					try:
-						j = json.loads(text)
-					except:
-						j = {"Output": text}
-					return HttpResponse(
-						str(json.dumps(j)),
-						content_type="application/json",
-					)
+		# Get command module class
+		cmd_module, Command, cmd_arg_list = resolveCommand(args)
+
+		# If command does not exist, return Not Found
+		if not Command:
+			output = {"API Error": "Command Not Found"}
+			return HttpResponse(str(json.dumps(output)),
+					content_type="application/json",
+					status=404)
+
+		# Don't allow "run host" commands. This opens
+		# the door for arbitrary command executions
+		if cmd_module == "run.host":
+			return HttpResponseForbidden(
+				"'run host' command is not permitted",
+				content_type="text/plain",
+			)
+
+		# If command is a sync/load command, run it as root,
+		# as the command will require some root privileges.
+		# However, if the user isn't a django superuser (with
+		# admin privileges) don't allow command to run.
+		sudo = sudolist.match(cmd_module)
+		if sudo and not request.user.is_superuser:
+			cmd_str = cmd_module.replace('.', ' ')
+			return HttpResponseForbidden(
+				f"Command \"{cmd_str}\" requires Admin Privileges" ,
+				content_type="text/plain",
+			)
+
+		# Handle case where json data is posted (currently only for `stack load`)
+		data = body.get('data')
+		json_file = None
+		if data:
+			json_file = tempfile.NamedTemporaryFile(mode='w')
+			json.dump(data, json_file)
+			json_file.flush()
+			cmd_arg_list.append(json_file.name)
+
+		cmd_arg_list.extend(params)
+		cmd_arg_list.append("output-format=json")
 
+		try:
+			if sudo:
+				return self._runSudo(cmd_module, cmd_arg_list)
+			return self._run(request, Command, cmd_module, cmd_arg_list)
 		finally:
-			if connection:
-				connection.close()
-
-	# Check if command is blacklisted
-	def _blacklisted(self, mod):
-		# Get all blacklisted commands
-		c = BlackList.objects.values("command")
-		# Get actual command values
-		bl = map(lambda x: x['command'], c)
-		for cmd in bl:
-			# Make sure to match the module names
-			cmd = re.sub('[ \t]+', '.', cmd)
-			r = re.compile(str(cmd))
-			m = r.match(mod)
-			if m:
-				# Match the exact blacklisted command
-				if m.group() == mod:
-					return True
-		return False
-
-	def _isSudoCommand(self, mod):
-		# Get a list of all sudo commands
-		c = SudoList.objects.values("command")
-		sl = [ i['command'] for i in c ]
-		for cmd in sl:
-			cmd = re.sub('[ \t]+', '.', cmd)
-			r = re.compile(str(cmd))
-			m = r.match(mod)
-			if m and m.group() == mod:
-				return True
-
-		return False
+			if json_file:
+				json_file.close()
+
+	# Run the command module wrapper in this process,
+	# on a pooled database connection
+	def _run(self, request, Command, cmd_module, cmd_arg_list):
+		if request.user.is_superuser:
+			user = (None, None)
+		else:
+			user = ('nobody', '')
+
+		with connections.connection(*user) as connection:
+			command = Command(connection)
+
+			# Flush the cache, we do this
+			# since multiple threads may be
+			# running and there is no
+			# mechanism for one thread to
+			# invalidate the cache of
+			# another thread.
+			command.db.clearCache()
+
+			try:
+				rc = command.runWrapper(cmd_module, cmd_arg_list)
+			# If we hit a database error, check if it's an access
+			# denied error. If so, sanitize the error message, and
+			# don't expose database access.
+			except pymysql.OperationalError as e:
+				errortext = str(sys.exc_info()[1])
+				log.error(errortext)
+				if int(e.args[0]) in MYSQL_EX:
+					errortext = "Database Permission Denied. Admin privileges required"
+					status_code = 403
+				else:
+					status_code = 500
+				return HttpResponse(
+					json.dumps({'API Error': errortext}),
+					content_type='application/json',
+					status=status_code,
+				)
+			except CommandError as e:
+				# Get output from command
+				text = command.getText()
+
+				if not text:
+					text = {}
+
+				return HttpResponse(
+					json.dumps({'API Error': '%s' % e, 'Output': text}),
+					content_type='application/json',
+					status=500,
+				)
+
+			# Any other type of error, simply forward it
+			# to the client
+			except:
+				errortext = str(traceback.format_exc())
+				log.error(errortext)
+				return HttpResponse(
+					json.dumps({'API Error': errortext}),
+					content_type='application/json',
+					status=500,
+				)
+
+			# Get output from command
+			text = command.getText()
+
+		if not text:
+			text = {}
+
+		# Check to see if text is json
+		try:
+			j = json.loads(text)
+		except:
+			j = {"Output": text}
+		return HttpResponse(
+			str(json.dumps(j)),
+			content_type="application/json",
+		)
+
+	# Run the command as root in a sudo worker, or
+	# with sudo if the worker cannot be started (e.g.
+	# the sudoers file has not been updated for it)
+	def _runSudo(self, cmd_module, cmd_arg_list):
+		log.info(f'sudo {cmd_module} {cmd_arg_list}')
+		result = sudoworkers.run(cmd_module, cmd_arg_list)
+		if result:
+			rc, output, error = result
+		else:
+			c = [
+				"/usr/bin/sudo",
+				"/opt/stack/bin/stack",
+			]
+
+			c.extend(cmd_module.split('.'))
+			c.extend(cmd_arg_list)
+			log.info(f'{c}')
+			p = subprocess.Popen(
+				c,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE,
+				encoding='utf-8',
+			)
+			output, error = p.communicate()
+			rc = p.wait()
+
+		if rc:
+			j = {"API Error": error, "Output": output}
+			return HttpResponse(
+				str(json.dumps(j)),
+				content_type="application/json",
+				status=500,
+			)
+
+		if not output:
+			output = {}
+
+		# Check to see if text is json
+		try:
+			j = json.loads(output)
+		except:
+			j = {"Output": output}
+
+		return HttpResponse(
+			str(json.dumps(j)),
+			content_type="application/json",
+			status=200,
+		)
 
 
 # Function to log in the user
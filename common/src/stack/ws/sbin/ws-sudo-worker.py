@@ -0,0 +1,160 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Privileged worker of the webservice. Started by the webservice with
+# sudo and kept running, it runs the sudo list commands (sync, load,
+# ...) sent to it on stdin and answers on stdout. Every command is
+# checked here against the sudoers file written by 'report api sudo
+# command', the same gate sudo used to be, and is run in a forked
+# child of this already warm process.
+
+import os
+import sys
+import stat
+import fnmatch
+import tempfile
+import traceback
+
+import stack.django_env
+import django.db
+
+import stack.cli
+import stack.commands
+from stack.commands import get_mysql_connection
+from stack.restapi.sudo import send, recv
+
+SUDOERS = '/etc/sudoers.d/stacki_ws'
+STACK   = '/opt/stack/bin/stack'
+
+
+def sudoCommands(path=SUDOERS):
+	"""
+	Returns the STACK_CMDS command lines of the sudoers file PATH.
+
+	The sudo list in the database can be written by the webservice
+	itself, so the worker only trusts the file root generated from
+	it. Nothing is allowed if the file is missing or anyone but root
+	can change it.
+	"""
+
+	try:
+		with open(path) as f:
+			st = os.fstat(f.fileno())
+			if st.st_uid != 0 or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+				return []
+			text = f.read()
+	except OSError:
+		return []
+
+	for line in text.replace('\\\n', ' ').splitlines():
+		name, _, value = line.partition('=')
+		if name.split() == [ 'Cmnd_Alias', 'STACK_CMDS' ]:
+			return [ ' '.join(cmd.split()) for cmd in value.split(',') if cmd.strip() ]
+	return []
+
+
+def allowed(command, args, path=SUDOERS):
+	"""
+	Returns True if sudo would let the webservice run the stack
+	COMMAND (e.g. "sync.config") with ARGS.
+	"""
+
+	if command == 'run.host':
+		return False
+
+	cmdline = ' '.join([ STACK ] + command.split('.') + args)
+	for pattern in sudoCommands(path):
+		if fnmatch.fnmatchcase(cmdline, pattern):
+			return True
+	return False
+
+
+def load(command):
+	"""
+	Imports the module of COMMAND (e.g. "sync.config") in the worker,
+	so the children do not have to. Returns False if there is no
+	such command.
+	"""
+
+	try:
+		module = __import__('stack.commands.%s' % command, fromlist=[ 'Command' ])
+	except Exception:
+		return False
+	return hasattr(module, 'Command')
+
+
+def run(command, args):
+	"""
+	Returns the exit code, output, and error output of running the
+	stack COMMAND with ARGS in a child process.
+	"""
+
+	out = tempfile.TemporaryFile()
+	err = tempfile.TemporaryFile()
+
+	# The child must not share the Django connection of the worker.
+	django.db.connections.close_all()
+
+	pid = os.fork()
+	if pid == 0:
+		rc = 1
+		try:
+			os.dup2(out.fileno(), 1)
+			os.dup2(err.fileno(), 2)
+			os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+			rc = stack.cli.run_command([ command.replace('.', ' ') ] + args,
+						   get_mysql_connection())
+		except BaseException:
+			traceback.print_exc()
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			os._exit(0 if rc == 0 else 1)
+
+	_, status = os.waitpid(pid, 0)
+	rc = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+	out.seek(0)
+	err.seek(0)
+	output = out.read().decode(errors='replace')
+	error  = err.read().decode(errors='replace')
+	out.close()
+	err.close()
+
+	return rc, output, error
+
+
+def main():
+	rin  = os.fdopen(os.dup(0), 'rb')
+	wout = os.fdopen(os.dup(1), 'wb')
+
+	# Nothing but the replies goes to the webservice.
+	os.dup2(os.open(os.devnull, os.O_RDWR), 1)
+
+	send(wout, { 'ready': True })
+
+	while True:
+		request = recv(rin)
+		if request is None:
+			break
+
+		command = str(request.get('command', ''))
+		args    = [ str(arg) for arg in request.get('args', []) ]
+
+		if not allowed(command, args):
+			result = (1, '', 'Command "%s" is not in the sudo list' % command.replace('.', ' '))
+		elif not load(command):
+			result = (1, '', 'Command "%s" not found' % command.replace('.', ' '))
+		else:
+			result = run(command, args)
+
+		send(wout, { 'rc': result[0], 'output': result[1], 'error': result[2] })
+
+
+if __name__ == '__main__':
+	main()
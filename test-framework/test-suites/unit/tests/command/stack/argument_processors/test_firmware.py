@@ -445,6 +445,33 @@ class TestFirmwareArgumentProcessor:
 		with pytest.raises(CommandError):
 			argument_processor.get_common_frontend_ip(hostname = mock_hostname)
 
+	# Use create = True here because the self.call and self.getHostnames methods come from the Command class,
+	# which the class under test is expected to be mixed in with.
+	@patch.object(target = FirmwareArgumentProcessor, attribute = "getHostnames", create = True)
+	@patch.object(target = FirmwareArgumentProcessor, attribute = "call", create = True)
+	def test_get_common_frontend_ips(self, mock_call, mock_getHostnames, argument_processor):
+		"""Test that get_common_frontend_ips gets the common frontend IP of every host from one interface listing."""
+		mock_getHostnames.return_value = ["frontend-0-0"]
+		mock_call.return_value = [
+			{"host": "frontend-0-0", "network": "foo", "ip": "1.2.3.4"},
+			{"host": "frontend-0-0", "network": "bar", "ip": "2.3.4.5"},
+			{"host": "switch-0-0", "network": "baz", "ip": "3.4.5.6"},
+			{"host": "switch-0-0", "network": "foo", "ip": "1.2.3.10"},
+			{"host": "switch-0-1", "network": "bar", "ip": "2.3.4.10"},
+		]
+
+		result = argument_processor.get_common_frontend_ips(hostnames = ["switch-0-0", "switch-0-1"])
+
+		assert {"switch-0-0": "1.2.3.4", "switch-0-1": "2.3.4.5"} == result
+		mock_call.assert_called_once_with(
+			command = "list.host.interface",
+			args = ["switch-0-0", "switch-0-1", "a:frontend"],
+		)
+
+		# A host without a common network fails the same way get_common_frontend_ip does.
+		with pytest.raises(CommandError):
+			argument_processor.get_common_frontend_ips(hostnames = ["switch-0-0", "switch-0-2"])
+
 	@patch.object(target = FirmwareArgumentProcessor, attribute = "get_common_frontend_ip", autospec = True)
 	@patch(target = "stack.argument_processors.firmware.Path", autospec = True)
 	def test_get_firmware_url(self, mock_path, mock_get_common_frontend_ip, argument_processor):
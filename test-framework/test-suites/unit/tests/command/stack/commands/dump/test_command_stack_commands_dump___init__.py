@@ -0,0 +1,60 @@
+import io
+import json
+from collections import OrderedDict
+from unittest.mock import MagicMock
+import pytest
+from stack.commands.dump import command
+
+class TestDumpCommand:
+	"""A test case for the stack dump command base class."""
+
+	class CommandUnderTest(command):
+		"""A class derived from the command class under test used to override __init__."""
+		def __init__(self):
+			self.stream = io.StringIO()
+
+	@pytest.mark.parametrize("hosts", (0, 1, 3))
+	def test_write_json(self, hosts):
+		"""The streamed document is the same as json.dumps would write."""
+		sections = OrderedDict(
+			version = '1.0',
+			attr    = [OrderedDict(name = 'a', value = 'b')],
+			host    = [OrderedDict(name = f'backend-0-{i}', group = ['x', 'y'], attr = []) for i in range(hosts)],
+			empty   = {},
+		)
+
+		test_command = self.CommandUnderTest()
+		test_command.write_json((name, iter(value) if name == 'host' else value) for name, value in sections.items())
+
+		assert test_command.stream.getvalue() == json.dumps(sections, indent=8) + '\n'
+
+	def test_get_rows(self):
+		"""The rows of every object in a scope are listed once."""
+		test_command = self.CommandUnderTest()
+		test_command.set_scope('host')
+		fetch = MagicMock(return_value = [
+			{'host': 'backend-0-0', 'attr': 'a'},
+			{'host': 'backend-0-1', 'attr': 'b'},
+			{'host': 'backend-0-0', 'attr': 'c'},
+		])
+
+		assert [row['attr'] for row in test_command.get_rows('attr', 'backend-0-0', fetch)] == ['a', 'c']
+		assert [row['attr'] for row in test_command.get_rows('attr', 'backend-0-1', fetch)] == ['b']
+		assert test_command.get_rows('attr', 'backend-0-2', fetch) == []
+		fetch.assert_called_once_with()
+
+	def test_get_rows_dropped(self):
+		"""The rows are not kept once they are dumped, or once the scope is done."""
+		test_command = self.CommandUnderTest()
+		test_command.set_scope('host')
+		fetch = MagicMock(return_value = [
+			{'host': 'backend-0-0', 'attr': 'a'},
+			{'host': 'backend-0-1', 'attr': 'b'},
+		])
+
+		assert test_command.get_rows('attr', 'backend-0-0', fetch)
+		assert test_command.get_rows('attr', 'backend-0-0', fetch) == []
+		assert test_command._command__dump_rows == {('attr', 'host'): {'backend-0-1': [{'host': 'backend-0-1', 'attr': 'b'}]}}
+
+		test_command.end_scope()
+		assert test_command._command__dump_rows == {}
@@ -0,0 +1,43 @@
+import os
+from unittest.mock import patch
+import pytest
+from stack.commands.list.host.hash import Command
+
+class TestListHostHashCommand:
+	"""A test case for hashing the pallets and carts of hosts."""
+
+	class CommandUnderTest(Command):
+		"""A class derived from the Command class under test used to override __init__."""
+		def __init__(self):
+			pass
+
+	@pytest.fixture
+	def command(self, tmp_path):
+		command = self.CommandUnderTest()
+		command.CACHE = str(tmp_path / 'cache' / 'directories.json')
+		command.dirhashes = {}
+		command.dircache = command.readCache()
+		command.dircache_changed = False
+		return command
+
+	def test_directoryhash(self, command, tmp_path):
+		"""Directories are walked once, and again only once they change."""
+		pallet = tmp_path / 'pallet'
+		(pallet / 'RPMS').mkdir(parents=True)
+		(pallet / 'RPMS' / 'a.rpm').write_text('a')
+
+		dirhash = command.walkhash(str(pallet))
+		assert command.directoryhash(str(pallet)) == dirhash
+		command.writeCache(command.dircache)
+
+		# The next run uses the kept hash
+		command.dirhashes = {}
+		command.dircache = command.readCache()
+		with patch.object(Command, 'walkhash') as mock_walkhash:
+			assert command.directoryhash(str(pallet)) == dirhash
+			mock_walkhash.assert_not_called()
+
+		# A new file changes the directory
+		(pallet / 'RPMS' / 'b.rpm').write_text('b')
+		command.dirhashes = {}
+		assert command.directoryhash(str(pallet)) == command.walkhash(str(pallet)) != dirhash
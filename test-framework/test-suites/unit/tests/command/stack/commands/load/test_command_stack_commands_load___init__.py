@@ -1,7 +1,7 @@
 from stack.commands.load import command
 from stack.exception import CommandError
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 class CommandUnderTest(command):
 	"""A subclass of the stack load command that replaces __init__ to remove the database dependency."""
@@ -187,3 +187,80 @@ class TestLoadCommand:
 			args = args,
 			params = expected_params,
 		)
+
+	@patch.object(target = CommandUnderTest, attribute = "stack", autospec = True)
+	def test_load_attr_bulk(self, mock_stack):
+		"""Test that bulk loads replace the attrs in one pass."""
+		test_command = CommandUnderTest()
+		test_command.bulk = True
+		test_command.attr_queue = []
+		test_command.set_scope("host")
+		test_command.db = MagicMock()
+		test_command.db.fetchall.side_effect = [
+			(("backend-0-0", 1), ("backend-0-1", 2)),
+			(("x", 10, 2), ("X", 11, 2), ("x", 12, 1)),
+			(),
+			((20, 2), (21, 2)),
+		]
+
+		test_command.load_attr(
+			[
+				{"name": "x", "value": "1"},
+				{"name": "X", "value": "2"},
+				{"name": "y", "value": "3", "shadow": True},
+				{"name": "z", "value": None},
+			],
+			target = "Backend-0-1",
+		)
+		mock_stack.assert_not_called()
+		test_command.flush_attrs()
+
+		calls = test_command.db.execute.call_args_list
+		assert len(calls) == 8
+		# The attr is replaced whatever the case of its name
+		assert calls[3][0][1:] == (([10, 11],),)
+		# One insert for all the scope_map rows, MySQL assigns the ids
+		assert calls[4][0][1] == ["host", None, None, None, 2, "host", None, None, None, 2]
+		assert "LAST_INSERT_ID()" in calls[5][0][0]
+		assert " attributes(" in calls[6][0][0]
+		assert calls[6][0][1] == [(21, "X", "2")]
+		assert calls[6][1] == {"many": True}
+		assert "shadow.attributes(" in calls[7][0][0]
+		assert calls[7][0][1] == [(20, "y", "3")]
+		assert test_command.attr_queue == []
+
+	@pytest.mark.parametrize(
+		"host, error",
+		(
+			({"name": "backend-0-0", "appliance": "backend", "box": "default"}, None),
+			({"name": "backend-0-0", "appliance": "Backend"}, None),
+			({"name": "backend-0-0", "appliance": "nas"}, None),
+			({"name": "backend-0-0", "environment": "prod"}, None),
+			({"name": "backend-0-0", "appliance": "missing"}, 'appliance "missing" does not exist'),
+			({"name": "backend-0-0", "box": "missing"}, 'box "missing" does not exist'),
+			({"appliance": "backend"}, 'host section missing "name"'),
+		)
+	)
+	@patch.object(target = CommandUnderTest, attribute = "validate_partition", autospec = True)
+	def test_validate(self, mock_validate_partition, host, error):
+		"""Test that validate checks the targets the document refers to before anything is loaded."""
+		test_command = CommandUnderTest()
+		test_command.db = MagicMock()
+		test_command.db.fetchall.side_effect = [
+			(("sles", 1),),
+			(("backend", 1),),
+			(),
+			(("default",),),
+		]
+		document = {
+			"appliance": [{"name": "nas"}],
+			"environment": [{"name": "prod"}],
+			"host": [host],
+		}
+
+		if error:
+			with pytest.raises(CommandError) as exception:
+				test_command.validate(document)
+			assert error in str(exception.value)
+		else:
+			test_command.validate(document)
@@ -0,0 +1,179 @@
+from unittest.mock import patch, MagicMock
+import pytest
+from stack.commands.sync.config import Command
+
+class TestSyncConfigCommand:
+	"""A test case for the incremental sync config command."""
+
+	class CommandUnderTest(Command):
+		"""A class derived from the Command class under test used to override __init__."""
+		def __init__(self):
+			self._params = {}
+
+	@pytest.fixture
+	def command(self, tmp_path):
+		command = self.CommandUnderTest()
+		command.STATE = str(tmp_path / 'sync' / 'config.json')
+		return command
+
+	def plugin(self, name, tables=None, files=None, services=None):
+		spec = ['provides', 'run']
+		for method, value in (('tables', tables), ('files', files), ('services', services)):
+			if value is not None:
+				spec.append(method)
+		plugin = MagicMock(spec = spec)
+		plugin.provides.return_value = name
+		if tables is not None:
+			plugin.tables.return_value = tables
+		if files is not None:
+			plugin.files.return_value = files
+		if services is not None:
+			plugin.services.return_value = services
+		return plugin
+
+	@patch.object(target = Command, attribute = "notify", autospec = True)
+	@patch.object(target = Command, attribute = "runPlugins", autospec = True)
+	@patch.object(target = Command, attribute = "getChecksums", autospec = True)
+	@patch.object(target = Command, attribute = "loadPlugins", autospec = True)
+	def test_run_incremental(self, mock_loadPlugins, mock_getChecksums, mock_runPlugins, mock_notify, command):
+		"""Plugins only run again once the tables they are built from change."""
+		host  = self.plugin('hostfile', ['nodes', 'aliases'])
+		repo  = self.plugin('repo', ['rolls'])
+		other = self.plugin('other')
+		mock_loadPlugins.return_value = [host, repo, other]
+		mock_getChecksums.return_value = {'nodes': 1, 'aliases': 2, 'rolls': 3}
+
+		def ran():
+			plugins = [c[1]['plugins'][0] for c in mock_runPlugins.call_args_list]
+			mock_runPlugins.reset_mock()
+			return plugins
+
+		command.run({}, [])
+		assert ran() == [host, repo, other]
+
+		command.run({}, [])
+		assert ran() == [other]
+
+		mock_getChecksums.return_value = {'nodes': 1, 'aliases': 4, 'rolls': 3}
+		command.run({}, [])
+		assert ran() == [host, other]
+
+		command._params = {'force': 'true'}
+		command.run({}, [])
+		assert ran() == [host, repo, other]
+
+	@patch("subprocess.call", autospec = True)
+	@patch.object(target = Command, attribute = "notify", autospec = True)
+	@patch.object(target = Command, attribute = "runPlugins", autospec = True)
+	@patch.object(target = Command, attribute = "getChecksums", autospec = True)
+	@patch.object(target = Command, attribute = "loadPlugins", autospec = True)
+	def test_run_files(self, mock_loadPlugins, mock_getChecksums, mock_runPlugins, mock_notify, mock_call, command, tmp_path):
+		"""Plugins run again when the files they write were removed or changed, and their services are started."""
+		hosts = tmp_path / 'hosts'
+		hosts.write_text('127.0.0.1 localhost\n')
+		host = self.plugin('hostfile', ['nodes'], files = [str(hosts), str(tmp_path / '*.conf')], services = ['dhcpd'])
+		mock_loadPlugins.return_value = [host]
+		mock_getChecksums.return_value = {'nodes': 1}
+
+		def ran():
+			plugins = [c[1]['plugins'][0] for c in mock_runPlugins.call_args_list]
+			mock_runPlugins.reset_mock()
+			return plugins
+
+		command.run({}, [])
+		assert ran() == [host]
+		mock_call.assert_not_called()
+
+		# Nothing changed, the service is started in case it was stopped
+		command.run({}, [])
+		assert ran() == []
+		mock_call.assert_called_once_with(['/sbin/service', 'dhcpd', 'start'], stdout = -3, stderr = -3)
+
+		hosts.write_text('127.0.0.1 localhost edited\n')
+		command.run({}, [])
+		assert ran() == [host]
+
+		hosts.unlink()
+		command.run({}, [])
+		assert ran() == [host]
+
+		(tmp_path / 'new.conf').write_text('')
+		command.run({}, [])
+		assert ran() == [host]
+
+		command.run({}, [])
+		assert ran() == []
+
+	@patch.object(target = Command, attribute = "runPlugins", autospec = True)
+	@patch.object(target = Command, attribute = "getChecksums", autospec = True)
+	@patch.object(target = Command, attribute = "loadPlugins", autospec = True)
+	def test_run_failure(self, mock_loadPlugins, mock_getChecksums, mock_runPlugins, command):
+		"""A plugin that fails is run again next time."""
+		host = self.plugin('hostfile', ['nodes'])
+		mock_loadPlugins.return_value = [host]
+		mock_getChecksums.return_value = {'nodes': 1}
+		mock_runPlugins.side_effect = ValueError
+
+		with patch.object(Command, 'notify'), pytest.raises(ValueError):
+			command.run({}, [])
+		assert command.readState() == {}
+
+	@patch.object(target = Command, attribute = "endOutput", autospec = True)
+	@patch.object(target = Command, attribute = "addOutput", autospec = True)
+	@patch.object(target = Command, attribute = "beginOutput", autospec = True)
+	@patch.object(target = Command, attribute = "runPlugins", autospec = True)
+	@patch.object(target = Command, attribute = "getChecksums", autospec = True)
+	@patch.object(target = Command, attribute = "loadPlugins", autospec = True)
+	def test_run_dryrun(
+		self,
+		mock_loadPlugins,
+		mock_getChecksums,
+		mock_runPlugins,
+		mock_beginOutput,
+		mock_addOutput,
+		mock_endOutput,
+		command,
+	):
+		"""A dry run lists what would run and why, and runs nothing."""
+		mock_loadPlugins.return_value = [self.plugin('hostfile', ['nodes']), self.plugin('other')]
+		mock_getChecksums.return_value = {'nodes': 1}
+
+		command._params = {'dryrun': 'true'}
+		command.run({}, [])
+
+		mock_runPlugins.assert_not_called()
+		assert [c[0][1:] for c in mock_addOutput.call_args_list] == [
+			('hostfile', ('run', 'never synced')),
+			('other', ('run', 'no tables listed')),
+		]
+
+	def test_get_checksums(self, command):
+		"""Tables are checksummed by MySQL, the queries by their rows."""
+		command.db = MagicMock()
+		command.db.fetchall.side_effect = [
+			(("frontend-0-0", "10.1.1.1"),),
+			(("global", "Kickstart_Timezone", "UTC"),),
+			(("cluster.nodes", 1), ("cluster.rolls", 2)),
+		]
+
+		checksums = command.getChecksums(['rolls', 'frontend', 'nodes'])
+
+		assert command.db.execute.call_args[0][0] == 'checksum table nodes, rolls'
+		assert checksums['nodes'] == 1
+		assert checksums['rolls'] == 2
+
+		# Any change to the frontend's rows changes its checksum
+		command.db.fetchall.side_effect = [
+			(("frontend-0-0", "10.1.1.2"),),
+			(("global", "Kickstart_Timezone", "UTC"),),
+		]
+		assert command.getChecksums(['frontend'])['frontend'] != checksums['frontend']
+
+	def test_plugin_tables(self):
+		"""The plugins not built from every host are not run again for every host added."""
+		from stack.commands.sync.config import plugin_dns, plugin_host, plugin_repo
+
+		for module in (plugin_dns, plugin_host, plugin_repo):
+			assert 'attributes' not in module.Plugin(MagicMock()).tables()
+		assert 'nodes' not in plugin_repo.Plugin(MagicMock()).tables()
+		assert plugin_dns.Plugin(MagicMock()).services() == ['named']
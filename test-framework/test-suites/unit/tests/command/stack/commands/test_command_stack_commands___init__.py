@@ -1,9 +1,11 @@
 from stack.commands import Command, Implementation, ScopeArgumentProcessor, DatabaseConnection
+from stack.commands import HostArgumentProcessor
 from stack.exception import CommandError
 from unittest.mock import patch, create_autospec, ANY, MagicMock
 from concurrent.futures import Future
 from collections import namedtuple
 import time
+import threading
 import pytest
 
 class CommandUnderTest(Command):
@@ -343,6 +345,109 @@ class TestCommand:
 		# make sure the command is listed as well as its arguments
 		assert "foo bar baz a b=c" in str(exception_info.value)
 
+	@pytest.mark.parametrize("keep_rows", (True, False))
+	@patch(target = "stack.commands.__import__", create = True)
+	@patch(target = "stack.commands.eval", create = True)
+	def test_call_rows(self, mock_eval, mock__import__, keep_rows):
+		"""Test that call returns the same rows whether or not they were marshalled."""
+		class SubCommand(CommandUnderTest):
+			def __init__(self, *args, **kwargs):
+				super().__init__(*args, **kwargs)
+				self.text = []
+				self.bytes = []
+				self.rows = None
+				self.keepRows = False
+
+			def runWrapper(self, name, args, level = 0):
+				self._params = {"output-format": "binary"}
+				self.keepRows = self.keepRows and keep_rows
+				self.beginOutput()
+				self.addOutput("backend-0-0", ("rack", "0"))
+				self.addOutput("backend-0-1", ("rack", "1"))
+				self.endOutput(header = ["host", "attr", "value"])
+				return True
+
+		mock_eval.return_value.Command = SubCommand
+
+		result = CommandUnderTest().call("list.host.attr", ["a:backend"])
+		assert result == [
+			{"host": "backend-0-0", "attr": "rack", "value": "0"},
+			{"host": "backend-0-1", "attr": "rack", "value": "1"},
+		]
+
+	def plugin(self, name, requires = (), precedes = (), result = None, error = None, log = None, thread_safe = True):
+		plugin = MagicMock()
+		plugin.provides.return_value = name
+		plugin.threadSafe.return_value = thread_safe
+		plugin.requires.return_value = list(requires)
+		plugin.precedes.return_value = list(precedes)
+		def run(args):
+			log.append(("start", name))
+			time.sleep(0.05)
+			log.append(("end", name))
+			if error:
+				raise error
+			return result
+		plugin.run.side_effect = run
+		return plugin
+
+	@pytest.mark.parametrize("threads", [1, 4])
+	def test_run_plugins(self, threads):
+		"""Plugins run after what they require, and results keep the plugin order."""
+		log = []
+		plugins = [
+			self.plugin("dhcpd", requires = ["hostfile"], result = "d", log = log),
+			self.plugin("hostfile", result = "h", log = log),
+			self.plugin("dns", log = log),
+			self.plugin("repo", precedes = ["dhcpd"], result = "r", log = log),
+		]
+		command = CommandUnderTest()
+
+		assert command.runPlugins(args = "a", plugins = plugins, threads = threads) == [
+			("dhcpd", "d"), ("hostfile", "h"), ("repo", "r")
+		]
+		for plugin in plugins:
+			plugin.run.assert_called_once_with("a")
+		if threads > 1:
+			assert log.index(("end", "hostfile")) < log.index(("start", "dhcpd"))
+			assert log.index(("end", "repo")) < log.index(("start", "dhcpd"))
+			# the independent plugins overlapped
+			assert sorted(log[:3]) == [("start", "dns"), ("start", "hostfile"), ("start", "repo")]
+			assert command.db.attachThread.call_count == 4
+			assert command.db.detachThread.call_count == 4
+
+	def test_run_plugins_parallel_error(self):
+		"""A failing plugin stops the plugins that wait on it and its error is raised."""
+		log = []
+		plugins = [
+			self.plugin("hostfile", error = ValueError("boom"), log = log),
+			self.plugin("dhcpd", requires = ["hostfile"], log = log),
+			self.plugin("dns", log = log),
+		]
+
+		with pytest.raises(ValueError, match = "boom"):
+			CommandUnderTest().runPlugins(plugins = plugins, threads = 4)
+		plugins[1].run.assert_not_called()
+		plugins[2].run.assert_called_once()
+
+	def test_run_plugins_parallel_not_thread_safe(self):
+		"""A plugin that is not thread safe runs alone."""
+		log = []
+		plugins = [
+			self.plugin("hostfile", log = log),
+			self.plugin("repo", log = log, thread_safe = False),
+			self.plugin("dns", log = log),
+			self.plugin("time", log = log, thread_safe = False),
+		]
+
+		CommandUnderTest().runPlugins(plugins = plugins, threads = 4)
+
+		for name in ("repo", "time"):
+			start = log.index(("start", name))
+			assert log[start + 1] == ("end", name)
+		assert sorted(log[:2]) == [("start", "dns"), ("start", "hostfile")]
+
+
 class TestScopeArgumentProcessor:
 	"""Test case for the ScopeArgumentProcessor"""
 
@@ -359,3 +464,152 @@ class TestScopeArgumentProcessor:
 
 		with pytest.raises(CommandError):
 			ScopeArgumentProcessor().getScopeMappings(args = test_args, scope = test_scope)
+
+class TestHostArgumentProcessor:
+	"""Test case for resolving host arguments with the host index"""
+
+	ATTRS = {
+		"frontend-0-0": {"appliance": "frontend", "rack": "0", "managed": "true"},
+		"backend-0-0": {"appliance": "backend", "rack": "0", "managed": "true", "group.compute": "true"},
+		"backend-0-1": {"appliance": "backend", "rack": "0", "managed": "true"},
+		"switch-0-0": {"appliance": "switch", "rack": "1", "managed": "false"},
+	}
+
+	@pytest.fixture
+	def command(self):
+		def select(query, args = None, prepend_select = True):
+			if "a.name='frontend'" in query:
+				return (("frontend-0-0",),)
+			if 'a.name != "frontend"' in query:
+				return (("switch-0-0", "1", "0"), ("backend-0-1", "0", "1"), ("backend-0-0", "0", "0"))
+			if "net.ip from" in query:
+				return (("backend-0-0", "10.1.1.1"),)
+			if "s.zone" in query:
+				return (("backend-0-0", "backend-0-0-ib", "ib"),)
+			return ()
+
+		class HostCommand(HostArgumentProcessor, CommandUnderTest):
+			pass
+
+		command = HostCommand()
+		command.db.select.side_effect = select
+		command.db.memoize.side_effect = lambda key, tables, build: build()
+		command.call = MagicMock(return_value = [
+			{"host": host, "attr": attr, "value": value}
+			for host, attrs in self.ATTRS.items() for attr, value in attrs.items()
+		])
+		return command
+
+	def test_all_hosts_sorted(self, command):
+		assert command.getHostnames() == ["frontend-0-0", "backend-0-0", "backend-0-1", "switch-0-0"]
+
+	def test_names_and_ip(self, command):
+		assert command.getHostnames(["BACKEND-0-1"]) == ["backend-0-1"]
+		assert command.getHostnames(["10.1.1.1"]) == ["backend-0-0"]
+		command.db.getHostname.assert_not_called()
+
+	def test_glob(self, command):
+		assert command.getHostnames(["backend-*"]) == ["backend-0-0", "backend-0-1"]
+
+	@pytest.mark.parametrize("names, hosts", [
+		(["a:backend"], ["backend-0-0", "backend-0-1"]),
+		(["r:1"], ["switch-0-0"]),
+		(["g:compute"], ["backend-0-0"]),
+		(['where appliance == "backend" and rack == "0"'], ["backend-0-0", "backend-0-1"]),
+		(["where appliance =="], []),
+	])
+	def test_adhoc_groups(self, command, names, hosts):
+		assert command.getHostnames(names) == hosts
+
+	@patch("stack.commands.EvalCondExpr", autospec = True)
+	def test_adhoc_group_evaluated_per_value(self, mock_eval, command):
+		"""A condition is evaluated once per distinct value of the attributes it uses."""
+		mock_eval.side_effect = lambda exp, attrs: attrs.get("appliance") == "backend"
+		assert command.getHostnames(["a:backend"]) == ["backend-0-0", "backend-0-1"]
+		assert mock_eval.call_count == 3
+
+	def test_where_hosts_attrs(self, command):
+		"""Each condition is evaluated with the attributes it is given."""
+		memo = {}
+		command.db.memoize.side_effect = lambda key, tables, build: memo.setdefault(key, build())
+		assert command._whereHosts('rack == "0"', ["a"], {"a": {"rack": "0"}}) == ["a"]
+		assert command._whereHosts('box == "x"', ["b"], {"b": {"box": "x"}}) == ["b"]
+
+	def test_managed_only(self, command):
+		assert command.getHostnames(["r:%"], managed_only = True) == []
+		assert command.getHostnames(managed_only = True) == ["frontend-0-0", "backend-0-0", "backend-0-1"]
+
+	def test_subnet(self, command):
+		assert command.getHostnames(["backend-0-0"], subnet = "ib") == ["backend-0-0-ib.ib"]
+		assert command.getHostnames(["a:backend"], subnet = "ib") == ["backend-0-0-ib.ib"]
+
+class TestDatabaseConnection:
+	"""Test case for the DatabaseConnection select caching"""
+
+	@pytest.fixture
+	def db(self):
+		database = MagicMock()
+		database.db = b"unit_test"
+		DatabaseConnection.cache.pop("unit_test", None)
+		db = DatabaseConnection(database, caching = True)
+		db.link.execute.return_value = 1
+		db.link.fetchall.side_effect = lambda: (("backend-0-0",),)
+		yield db
+		DatabaseConnection.cache.pop("unit_test", None)
+
+	def test_select_is_cached(self, db):
+		db.select("name from nodes")
+		db.select("name from nodes")
+		assert db.link.execute.call_count == 1
+		assert db.cacheStats()["hits"] == 1
+
+	def test_write_keeps_unrelated_selects(self, db):
+		db.select("name from nodes")
+		db.select("name from attributes")
+		db.execute("insert into attributes (name) values (%s)", ("foo",))
+		db.link.execute.reset_mock()
+
+		db.select("name from nodes")
+		db.select("name from attributes")
+		# Only the attributes query has to go back to the database
+		db.link.execute.assert_called_once_with("select name from attributes", None)
+
+	def test_clear_cache(self, db):
+		db.select("name from nodes")
+		db.clearCache()
+		db.select("name from nodes")
+		assert db.link.execute.call_count == 2
+
+	@patch("stack.commands.pymysql.connect", autospec = True)
+	def test_attach_thread(self, mock_connect, db):
+		"""A thread can swap in a connection of its own, the others keep the shared one."""
+		shared = db.link
+		db.attachThread()
+		assert db.database is mock_connect.return_value
+		assert db.link is mock_connect.return_value.cursor.return_value
+
+		seen = []
+		thread = threading.Thread(target = lambda: seen.append(db.link))
+		thread.start()
+		thread.join()
+		assert seen == [shared]
+
+		db.detachThread()
+		mock_connect.return_value.close.assert_called_once_with()
+		assert db.link is shared
+
+class TestOutputRows:
+	"""Test case for building the structured output rows"""
+
+	def test_output_rows(self):
+		test_command = CommandUnderTest()
+		test_command.output = [["a", 1, 2], ["b", 3, 4]]
+		assert test_command.outputRows(["name", "x", "y"]) == [
+			{"name": "a", "x": 1, "y": 2},
+			{"name": "b", "x": 3, "y": 4},
+		]
+
+	def test_output_rows_repeated_and_empty_header(self):
+		test_command = CommandUnderTest()
+		test_command.output = [["a", 1, 2, 3]]
+		assert test_command.outputRows(["name", "x", "x", ""]) == [{"name": "a", "x": [1, 2]}]
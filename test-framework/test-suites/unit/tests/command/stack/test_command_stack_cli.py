@@ -0,0 +1,36 @@
+import os
+import socket
+from unittest.mock import patch
+
+import stack.cli
+
+
+class TestCli:
+	def test_forward_no_server(self, tmp_path):
+		"""Without a server socket the command must be run locally."""
+		assert stack.cli.forward(["list", "host"], path = str(tmp_path / "command.sock")) is None
+
+	@patch.dict(os.environ, {"STACKSERVER": "no"})
+	def test_forward_disabled(self, tmp_path):
+		"""STACKSERVER=no skips the server even when it is running."""
+		path = tmp_path / "command.sock"
+		path.touch()
+		with patch("socket.socket") as mock_socket:
+			assert stack.cli.forward(["list", "host"], path = str(path)) is None
+			mock_socket.assert_not_called()
+
+	def test_send_recv_fds(self, tmp_path):
+		"""The request and the file descriptors arrive together."""
+		client, server = socket.socketpair()
+		with open(tmp_path / "out", "w") as out:
+			stack.cli.send_fds(client, b'{"argv": []}\n', [out.fileno()])
+			data, fds = stack.cli.recv_fds(server, 3)
+
+		assert data == b'{"argv": []}\n'
+		assert len(fds) == 1
+		os.write(fds[0], b"hello")
+		os.close(fds[0])
+		assert (tmp_path / "out").read_text() == "hello"
+
+		client.close()
+		server.close()
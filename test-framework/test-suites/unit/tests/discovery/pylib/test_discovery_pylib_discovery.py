@@ -0,0 +1,120 @@
+import ipaddress
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from stack.discovery import Discovery
+
+
+class TestDiscovery:
+	@pytest.fixture
+	def discovery(self):
+		discovery = Discovery()
+		discovery._command = MagicMock()
+		discovery._command.db.fetchall.return_value = (
+			("00:00:00:00:00:01", "10.0.0.1", "eth0"),
+			("00:00:00:00:00:02", "10.0.0.3", "vlan2"),
+			(None, "10.0.0.2", None),
+		)
+		discovery._socket = MagicMock()
+		discovery._base_name = "backend"
+		discovery._appliance_name = "backend"
+		discovery._rack = 0
+		discovery._rank = 0
+		discovery._box = "default"
+		discovery._install_action = "default"
+		discovery._install = True
+		return discovery
+
+	def test_is_known_mac_address(self, discovery):
+		"Known MAC addresses are found without going back to the database."
+
+		assert discovery._is_known_mac_address("00:00:00:00:00:01")
+		assert discovery._is_known_mac_address("00:00:00:00:00:02")
+		assert discovery._command.db.execute.call_count == 1
+
+		# Unknown ones are always checked, on their own
+		discovery._command.db.fetchall.return_value = ()
+		assert not discovery._is_known_mac_address("00:00:00:00:00:03")
+		assert discovery._command.db.execute.call_count == 2
+		assert discovery._command.db.execute.call_args[0][1] == ("00:00:00:00:00:03",)
+
+		discovery._command.db.fetchall.return_value = (("00:00:00:00:00:03", "10.0.0.6", "eth0"),)
+		assert discovery._is_known_mac_address("00:00:00:00:00:03")
+		assert "10.0.0.6" in discovery._taken_ips
+
+	@patch("time.time")
+	def test_is_known_mac_address_removed(self, mock_time, discovery):
+		"Known MAC addresses are checked again after a while, in case their host was removed."
+
+		mock_time.return_value = 100
+		assert discovery._is_known_mac_address("00:00:00:00:00:01")
+
+		mock_time.return_value = 100 + discovery._INTERFACES_TTL
+		discovery._command.db.fetchall.return_value = ()
+		assert not discovery._is_known_mac_address("00:00:00:00:00:01")
+		assert discovery._command.db.execute.call_args[0][1] == ("00:00:00:00:00:01",)
+
+	@patch.object(Discovery, "_get_hosts_for_interface")
+	def test_get_next_ip_address(self, mock_get_hosts_for_interface, discovery):
+		"Taken IP addresses are skipped, unless only taken by a vlan interface."
+
+		mock_get_hosts_for_interface.return_value = iter(ipaddress.ip_network("10.0.0.0/29").hosts())
+		discovery._load_interfaces()
+
+		# An address taken since the interfaces were loaded
+		discovery._command.db.fetchall.side_effect = [(), (("00:00:00:00:00:09", "10.0.0.4", "eth0"),), ()]
+
+		assert discovery._get_next_ip_address("eth9") == ipaddress.ip_address("10.0.0.3")
+		assert discovery._get_next_ip_address("eth9") == ipaddress.ip_address("10.0.0.5")
+		discovery._get_next_ip_address_cache.pop("eth9")
+
+	@patch("subprocess.run")
+	@patch("time.time", return_value = 100)
+	@patch.object(Discovery, "_get_network_for_interface", return_value = "private")
+	def test_add_node(self, mock_get_network_for_interface, mock_time, mock_run, discovery):
+		"New nodes are added in the process, then synced together."
+
+		mock_run.return_value.returncode = 0
+
+		for mac_address, ip_address in (("00:00:00:00:00:04", "10.0.0.4"), ("00:00:00:00:00:05", "10.0.0.5")):
+			discovery._add_node("eth9", mac_address, ipaddress.ip_address(ip_address))
+			discovery._rank += 1
+
+		assert [call[0][0] for call in discovery._command.command.call_args_list] == [
+			"add.host", "add.host.interface", "set.host.bootaction", "set.host.attr", "set.host.boot"
+		] * 2
+		assert "10.0.0.5" in discovery._taken_ips
+		mock_run.assert_not_called()
+
+		discovery._sync_pending()
+
+		assert [call[0][0] for call in mock_run.call_args_list] == [
+			["/opt/stack/bin/stack", "sync", "config"],
+			["/opt/stack/bin/stack", "sync", "host", "config", "backend-0-0", "backend-0-1"],
+		]
+		assert discovery._socket.sendto.call_count == 2
+		assert discovery._pending == []
+
+	@patch("subprocess.run")
+	@patch.object(Discovery, "_get_network_for_interface", return_value = "private")
+	def test_sync_pending_failed(self, mock_get_network_for_interface, mock_run, discovery):
+		"Nodes whose sync failed are synced again with the next ones."
+
+		mock_run.return_value.returncode = 1
+		discovery._add_node("eth9", "00:00:00:00:00:04", ipaddress.ip_address("10.0.0.4"))
+		discovery._sync_pending()
+
+		assert [payload["hostname"] for payload in discovery._pending] == ["backend-0-0"]
+		discovery._socket.sendto.assert_not_called()
+
+		mock_run.return_value.returncode = 0
+		discovery._rank += 1
+		discovery._add_node("eth9", "00:00:00:00:00:05", ipaddress.ip_address("10.0.0.5"))
+		discovery._sync_pending()
+
+		assert mock_run.call_args[0][0] == [
+			"/opt/stack/bin/stack", "sync", "host", "config", "backend-0-0", "backend-0-1"
+		]
+		assert discovery._socket.sendto.call_count == 2
+		assert discovery._pending == []
@@ -0,0 +1,215 @@
+import importlib.util
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def server():
+	spec = importlib.util.spec_from_file_location('profile_server', '/export/stack/sbin/profile/server.py')
+	module = importlib.util.module_from_spec(spec)
+	with patch('syslog.openlog'):
+		spec.loader.exec_module(module)
+	return module
+
+
+@pytest.fixture
+def environ():
+	return {
+		'REMOTE_ADDR': '10.1.1.1',
+		'REMOTE_PORT': '1234',
+		'QUERY_STRING': 'os=redhat&arch=x86_64&np=4',
+		'HTTP_X_RHN_PROVISIONING_MAC_1': 'eth1 AA:BB:CC:DD:EE:02 e1000',
+		'HTTP_X_RHN_PROVISIONING_MAC_0': 'eth0 AA:BB:CC:DD:EE:01 e1000 ks',
+		'HTTP_X_RHN_PROVISIONING_MAC_2': 'bad',
+	}
+
+
+@pytest.fixture
+def client(server, environ):
+	client = server.Client(environ)
+	client.status = MagicMock()
+	return client
+
+
+@pytest.fixture
+def profile(client):
+	profile = MagicMock()
+	profile.pre.return_value = None
+	with patch.object(client, 'getProfile', return_value=profile):
+		yield profile
+
+
+@pytest.fixture
+def service(server):
+	with patch('syslog.openlog'):
+		service = server.ProfileService(workers=1, backlog=1, timeout=0.1)
+	return service
+
+
+class TestClient:
+
+	def test_init(self, client):
+		assert (client.addr, client.port) == ('10.1.1.1', 1234)
+		assert (client.os, client.arch, client.np) == ('redhat', 'x86_64', '4')
+		assert client.interfaces == [
+			('eth0', 'aa:bb:cc:dd:ee:01', 'e1000', 'ks'),
+			('eth1', 'aa:bb:cc:dd:ee:02', 'e1000', ''),
+		]
+
+	def test_reply(self, client):
+		client.error('500 Server Error', 'Profile Error', retry=60)
+		client.reply('200 OK', 'profile')
+
+		# The first reply wins
+		status, headers, body = client.response
+		assert status == '500 Server Error'
+		assert ('Retry-After', '60') in headers
+		assert body == b'<h1>Profile Error</h1>\n'
+
+	def test_pickle(self, client):
+		"""The client goes to the worker without the worker's command."""
+		client.caller = MagicMock()
+		assert client.__getstate__()['caller'] is None
+
+	def test_call(self, client):
+		client.caller = MagicMock()
+		client.caller.call.return_value = [{'value': 'true'}]
+
+		assert client.call('list host attr', ['a']) == [{'value': 'true'}]
+		client.caller.call.assert_called_once_with('list.host.attr', ['a'])
+
+		client.caller.call.side_effect = Exception('failed')
+		with patch('syslog.syslog'):
+			assert client.call('list host attr', ['a']) == []
+
+
+class TestGenerate:
+
+	@pytest.fixture
+	def caller(self, server):
+		caller = MagicMock()
+		with patch.object(server, '_caller', caller):
+			yield caller
+
+	def test_generate(self, server, caller, client, profile):
+		caller.call.return_value = []
+		profile.main.side_effect = lambda client: client.reply('200 OK', 'profile')
+
+		response, seconds = server.generate(client)
+
+		assert response == ('200 OK', [], b'profile')
+		caller.db.clearCache.assert_called_once_with()
+		caller.call.assert_any_call('config.host.interface', [
+			'10.1.1.1',
+			'interface=eth0,eth1',
+			'mac=aa:bb:cc:dd:ee:01,aa:bb:cc:dd:ee:02',
+			'module=e1000,e1000',
+			'flag=ks,',
+			'sync=False',
+		])
+		assert client.caller is None
+
+	def test_generate_discovery(self, server, caller, client, profile):
+		"""A host discovered without installing is told to shut down."""
+		def call(command, args):
+			if args[1:] == ['attr=discovery.install']:
+				return [{'value': 'false'}]
+			return []
+		caller.call.side_effect = call
+
+		response, seconds = server.generate(client)
+
+		assert response[0] == '204 No Content'
+		profile.main.assert_not_called()
+
+	def test_generate_fails(self, server, caller, client, profile):
+		caller.call.return_value = []
+		profile.main.side_effect = Exception('bad')
+
+		with patch('syslog.syslog'):
+			response, seconds = server.generate(client)
+
+		assert response[0] == '500 Server Error'
+
+
+class TestProfileService:
+
+	@pytest.mark.parametrize('threads, backlog', ((256, 224), (16, 8), (None, 224)))
+	def test_backlog(self, server, threads, backlog):
+		"""The backlog leaves some server threads to wait for it."""
+		with patch.object(server, 'serverThreads', return_value=threads), patch('syslog.openlog'):
+			service = server.ProfileService()
+
+		assert service.backlog._value == backlog
+
+	def test_serve(self, service, client, profile):
+		with patch.object(service, 'submit', return_value=(('200 OK', [], b'profile'), 0.5)) as mock_submit:
+			response, queued, generating = service.serve(client)
+
+		assert response == ('200 OK', [], b'profile')
+		assert generating == 0.5
+		mock_submit.assert_called_once_with(client)
+		profile.pre.assert_called_once_with(client)
+		profile.post.assert_called_once_with(client)
+		assert service.pending == 0
+
+	@pytest.mark.parametrize('field, value', (('arch', 'x86_64;'), ('np', 'x'), ('os', None)))
+	def test_serve_invalid(self, service, client, profile, field, value):
+		setattr(client, field, value)
+
+		with patch.object(service, 'submit') as mock_submit:
+			response, queued, generating = service.serve(client)
+
+		assert response[0] == '500 Internal Error'
+		assert b'Invalid %s field' % field.encode() in response[2]
+		mock_submit.assert_not_called()
+
+	def test_serve_pre_reply(self, service, client, profile):
+		"""A profile answered by pre() never goes to a worker."""
+		profile.pre.side_effect = lambda client: client.reply('200 OK', 'cached')
+
+		with patch.object(service, 'submit') as mock_submit:
+			response, queued, generating = service.serve(client)
+
+		assert response == ('200 OK', [], b'cached')
+		mock_submit.assert_not_called()
+		profile.post.assert_not_called()
+
+	def test_serve_busy(self, service, client, server, environ, profile):
+		"""Requests that wait too long for the backlog are told to retry."""
+		generating = threading.Event()
+		finish = threading.Event()
+
+		def submit(client):
+			generating.set()
+			finish.wait(5)
+			return ('200 OK', [], b'profile'), 0.0
+
+		with patch.object(service, 'submit', side_effect=submit):
+			thread = threading.Thread(target=service.serve, args=(client,))
+			thread.start()
+			assert generating.wait(5)
+
+			other = server.Client(environ)
+			other.status = MagicMock()
+			with patch.object(other, 'getProfile', return_value=profile):
+				response, queued, seconds = service.serve(other)
+
+			finish.set()
+			thread.join(5)
+
+		status, headers, body = response
+		assert status == '503 Service Busy'
+		assert ('Retry-After', '15') in headers
+		other.status.assert_called_with('install profile retry')
+
+	def test_call(self, service, environ):
+		start_response = MagicMock()
+
+		with patch.object(service, 'serve', return_value=(('200 OK', [], b'profile'), 0.0, 0.0)), \
+		     patch('syslog.syslog'):
+			assert service(environ, start_response) == [b'profile']
+
+		start_response.assert_called_once_with('200 OK', [('Content-length', '7')])
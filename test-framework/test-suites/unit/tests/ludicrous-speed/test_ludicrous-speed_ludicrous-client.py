@@ -0,0 +1,194 @@
+import hashlib
+import importlib.util
+from unittest.mock import call, patch
+
+import pytest
+import requests
+
+
+@pytest.fixture
+def client():
+	spec = importlib.util.spec_from_file_location('ludicrous_client', '/opt/stack/bin/ludicrous-client.py')
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	module.tracker_settings['TRACKER'] = '10.1.1.1'
+	return module
+
+
+def manifest_of(data, piece_size):
+	pieces = [ data[i:i + piece_size] for i in range(0, len(data), piece_size) ]
+	return {
+		'success': True,
+		'size': len(data),
+		'piece_size': piece_size,
+		'pieces': [ hashlib.sha256(piece).hexdigest() for piece in pieces ],
+	}
+
+
+def response(status_code, content=b''):
+	res = requests.Response()
+	res.status_code = status_code
+	res._content = content
+	return res
+
+
+class TestLudicrousClient:
+
+	def test_read_write_pieces(self, client, tmp_path):
+		local_file = str(tmp_path / 'foo.rpm')
+		manifest = manifest_of(b'abcdefgh', 4)
+
+		client.write_pieces(local_file, manifest, {1, 0})
+
+		state = client.read_pieces(local_file, manifest)
+		assert state['done'] == [0, 1]
+		assert client.read_pieces(local_file)['pieces'] == manifest['pieces']
+		assert not (tmp_path / 'foo.rpm.pieces.tmp').exists()
+
+	def test_read_pieces_changed_file(self, client, tmp_path):
+		local_file = str(tmp_path / 'foo.rpm')
+		client.write_pieces(local_file, manifest_of(b'abcdefgh', 4), {0})
+
+		# The pieces downloaded so far are no good once the file changed
+		assert client.read_pieces(local_file, manifest_of(b'abcdefgX', 4)) is None
+
+	def test_read_pieces_missing(self, client, tmp_path):
+		assert client.read_pieces(str(tmp_path / 'foo.rpm')) is None
+
+		(tmp_path / 'foo.rpm.pieces').write_text('not json')
+		assert client.read_pieces(str(tmp_path / 'foo.rpm')) is None
+
+	@patch('requests.get')
+	def test_get_piece_from_peer(self, mock_get, client):
+		manifest = manifest_of(b'abcdefgh', 4)
+		mock_get.return_value = response(200, b'efgh')
+
+		assert client.get_piece(manifest, 1, ['a:80', 'b:80'], '/install/foo.rpm') == b'efgh'
+
+		# The pieces are spread over the peers
+		mock_get.assert_called_once_with(
+			'http://b:80/piece/1/install/foo.rpm',
+			params={'piece_size': 4},
+			timeout=(0.1, 5),
+		)
+
+	@patch('requests.get')
+	def test_get_piece_bad_hash(self, mock_get, client):
+		manifest = manifest_of(b'abcdefgh', 4)
+		mock_get.side_effect = [
+			response(200, b'XXXX'),
+			response(404),
+			response(206, b'abcd'),
+		]
+
+		assert client.get_piece(manifest, 0, ['a:80', 'b:80'], '/install/foo.rpm') == b'abcd'
+
+		# The frontend is asked for the range last
+		assert mock_get.call_args == call(
+			'http://10.1.1.1/install/foo.rpm',
+			headers={'Range': 'bytes=0-3'},
+			timeout=(0.1, 5),
+		)
+
+	@patch('requests.get')
+	def test_get_piece_range_ignored(self, mock_get, client):
+		manifest = manifest_of(b'abcdefghij', 4)
+		mock_get.return_value = response(200, b'abcdefghij')
+
+		assert client.get_piece(manifest, 2, [], '/install/foo.rpm') == b'ij'
+
+	@patch('requests.get')
+	def test_get_piece_unavailable(self, mock_get, client):
+		manifest = manifest_of(b'abcdefgh', 4)
+		mock_get.return_value = response(404)
+
+		assert client.get_piece(manifest, 0, ['a:80'], '/install/foo.rpm') is None
+		assert mock_get.call_count == 2
+
+	def test_download_file_gives_up_on_pieces(self, client, tmp_path):
+		"""Test that a file whose pieces can't be fetched is downloaded whole from the frontend."""
+		manifest = manifest_of(b'abcdefgh', 4)
+
+		with patch.object(client, 'lookup_pieces', return_value=manifest) as mock_lookup_pieces, \
+		     patch.object(client, 'get_file_in_pieces', return_value=False) as mock_get_file_in_pieces, \
+		     patch.object(client, 'lookup_file', side_effect=Exception), \
+		     patch.object(client, 'register_file'), \
+		     patch.object(client, 'sleep'), \
+		     patch('requests.get') as mock_get:
+			mock_get.return_value.status_code = 200
+			mock_get.return_value.iter_content.return_value = [b'abcdefgh']
+
+			client.download_file('/install/foo.rpm', str(tmp_path), 'foo.rpm', 'hash', True)
+
+		# The pieces are looked up again on every attempt
+		assert mock_lookup_pieces.call_count == client.PIECE_ATTEMPTS
+		assert mock_get_file_in_pieces.call_count == client.PIECE_ATTEMPTS
+		assert (tmp_path / 'foo.rpm').read_bytes() == b'abcdefgh'
+
+	def test_get_file_in_pieces(self, client, tmp_path):
+		data = b'abcdefghij'
+		manifest = manifest_of(data, 4)
+		local_file = str(tmp_path / 'install' / 'foo.rpm')
+
+		def get_piece(manifest, index, peers, remote_file):
+			return data[index * 4:index * 4 + 4] if index != 1 else None
+
+		with patch.object(client, 'register_file') as mock_register_file, \
+		     patch.object(client, 'lookup_file', side_effect=Exception), \
+		     patch.object(client, 'get_piece', side_effect=get_piece):
+			assert not client.get_file_in_pieces(manifest, '/install/foo.rpm', local_file, 'hash')
+
+		# The pieces so far are kept for the next attempt
+		assert client.read_pieces(local_file, manifest)['done'] == [0, 2]
+		mock_register_file.assert_called_once_with(80, 'hash', partial=True)
+
+		with patch.object(client, 'register_file') as mock_register_file, \
+		     patch.object(client, 'lookup_file', side_effect=Exception), \
+		     patch.object(client, 'get_piece', side_effect=lambda m, i, p, r: data[i * 4:i * 4 + 4]) as mock_get_piece:
+			assert client.get_file_in_pieces(manifest, '/install/foo.rpm', local_file, 'hash')
+
+		assert [ args[0][1] for args in mock_get_piece.call_args_list ] == [1]
+		assert (tmp_path / 'install' / 'foo.rpm').read_bytes() == data
+		assert not (tmp_path / 'install' / 'foo.rpm.part').exists()
+		assert not (tmp_path / 'install' / 'foo.rpm.pieces').exists()
+		mock_register_file.assert_called_with(80, 'hash')
+
+	def test_get_piece_locally_partial(self, client, tmp_path):
+		"""Test that a host still downloading a file serves the pieces it has."""
+		client.client_settings['LOCAL_SAVE_LOCATION'] = str(tmp_path)
+		(tmp_path / 'install' / 'x').mkdir(parents=True)
+		(tmp_path / 'install' / 'x' / 'foo.rpm.part').write_bytes(b'abcd\0\0\0\0')
+		client.write_pieces(str(tmp_path / 'install' / 'x' / 'foo.rpm'), manifest_of(b'abcdefgh', 4), {0})
+
+		app = client.app.test_client()
+
+		res = app.get('/piece/0/install/x/foo.rpm?piece_size=4')
+		assert res.status_code == 200
+		assert res.data == b'abcd'
+
+		assert app.get('/piece/1/install/x/foo.rpm?piece_size=4').status_code == 404
+		assert app.get('/piece/0/install/x/foo.rpm?piece_size=8').status_code == 404
+		assert app.get('/piece/0/install/x/foo.rpm').status_code == 404
+		assert app.get('/piece/0/install/x/foo.rpm?piece_size=-4').status_code == 404
+
+	def test_get_piece_locally_outside(self, client, tmp_path):
+		"""Test that only the files under the save location are served."""
+		client.client_settings['LOCAL_SAVE_LOCATION'] = str(tmp_path / 'save')
+		(tmp_path / 'save' / 'install' / 'x').mkdir(parents=True)
+		(tmp_path / 'secret').write_bytes(b'abcd')
+
+		app = client.app.test_client()
+
+		res = app.get('/piece/0/install/x/%2E%2E/%2E%2E/%2E%2E/secret?piece_size=4')
+		assert res.status_code == 404
+
+	def test_get_piece_locally_piece_size(self, client, tmp_path):
+		client.client_settings['LOCAL_SAVE_LOCATION'] = str(tmp_path)
+		(tmp_path / 'install' / 'x').mkdir(parents=True)
+		(tmp_path / 'install' / 'x' / 'foo.rpm').write_bytes(b'abcdefgh')
+
+		app = client.app.test_client()
+
+		with patch.object(client, 'PIECE_SIZE', 4):
+			assert app.get('/piece/1/install/x/foo.rpm?piece_size=4').data == b'efgh'
+			assert app.get('/piece/0/install/x/foo.rpm?piece_size=8').status_code == 404
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import sys
+from unittest.mock import call, patch
+
+import pytest
+
+sys.path.append('/opt/stack/bin')
+import ludicrousServer
+
+
+@pytest.fixture
+def ludicredis():
+	with patch.object(ludicrousServer, 'ludicredis') as mock_ludicredis:
+		yield mock_ludicredis
+
+
+@pytest.fixture
+def app():
+	return ludicrousServer.app.test_client()
+
+
+class TestLudicrousServer:
+
+	@patch.object(ludicrousServer, 'PIECE_SIZE', 4)
+	def test_pieces(self, ludicredis, app, tmp_path):
+		(tmp_path / 'install').mkdir()
+		(tmp_path / 'install' / 'foo.rpm').write_bytes(b'abcdefghij')
+		ludicredis.get.return_value = None
+
+		with patch.object(ludicrousServer, 'ROOT_DIR', str(tmp_path)):
+			res = app.get('/pieces/install/foo.rpm')
+
+		assert res.status_code == 200
+		assert res.json['size'] == 10
+		assert res.json['piece_size'] == 4
+		assert res.json['pieces'] == [
+			hashlib.sha256(piece).hexdigest() for piece in (b'abcd', b'efgh', b'ij')
+		]
+
+		# The hashes are kept for the next host
+		key, cached = ludicredis.set.call_args[0]
+		assert key == 'ludicrous:pieces:%s/install/foo.rpm' % tmp_path
+		assert json.loads(cached) == res.json
+
+	def test_pieces_cached(self, ludicredis, app, tmp_path):
+		(tmp_path / 'foo.rpm').write_bytes(b'abcdefghij')
+		st = (tmp_path / 'foo.rpm').stat()
+		cached = {'success': True, 'size': 10, 'mtime': st.st_mtime, 'piece_size': 4, 'pieces': ['x']}
+		ludicredis.get.return_value = json.dumps(cached).encode()
+
+		with patch.object(ludicrousServer, 'ROOT_DIR', str(tmp_path)):
+			res = app.get('/pieces/foo.rpm')
+
+		assert res.json == cached
+		ludicredis.set.assert_not_called()
+
+	def test_pieces_changed_file(self, ludicredis, app, tmp_path):
+		(tmp_path / 'foo.rpm').write_bytes(b'abcdefghij')
+		cached = {'success': True, 'size': 10, 'mtime': 0, 'piece_size': 4, 'pieces': ['x']}
+		ludicredis.get.return_value = json.dumps(cached).encode()
+
+		with patch.object(ludicrousServer, 'ROOT_DIR', str(tmp_path)):
+			res = app.get('/pieces/foo.rpm')
+
+		assert res.json['pieces'] != ['x']
+		ludicredis.set.assert_called_once()
+
+	@pytest.mark.parametrize('path', ('missing.rpm', '../outside.rpm', 'install'))
+	def test_pieces_not_found(self, ludicredis, app, tmp_path, path):
+		(tmp_path / 'root' / 'install').mkdir(parents=True)
+		(tmp_path / 'outside.rpm').write_bytes(b'abcd')
+
+		with patch.object(ludicrousServer, 'ROOT_DIR', str(tmp_path / 'root')):
+			res = app.get('/pieces/%s' % path)
+
+		assert res.status_code == 404
+		ludicredis.get.assert_not_called()
+
+	@patch('ludicrousServer.random', return_value=0)
+	@patch('ludicrousServer.get_locality')
+	def test_find_peers(self, mock_get_locality, mock_random, ludicredis):
+		ludicredis.srandmember.return_value = [
+			b'10.1.1.1', b'10.1.1.2', b'10.1.1.3', b'10.1.1.4', b'10.1.1.5',
+		]
+		ludicredis.pipeline.return_value.execute.return_value = [
+			[b'80', b'81', None, b'80', b'80'],
+			[None, b'3', b'1', b'20', None],
+		]
+		mock_get_locality.return_value = {
+			'10.1.1.1': ('0', 'switch-0'),
+			'10.1.1.2': ('1', 'switch-1'),
+			'10.1.1.3': ('1', 'switch-1'),
+			'10.1.1.4': ('1', 'switch-1'),
+			'10.1.1.5': ('1', 'switch-2'),
+			'10.1.1.9': ('1', 'switch-1'),
+		}
+
+		peers = ludicrousServer.find_peers('ludicrous:hash', '10.1.1.9')
+
+		# The same switch first, then the same rack, the least busy
+		# first; a peer at its limit only if there is no other.
+		assert peers == ['10.1.1.3:80', '10.1.1.2:81', '10.1.1.5:80']
+		pipe = ludicredis.pipeline.return_value
+		assert [ args[0][1] for args in pipe.hincrby.call_args_list ] == ['10.1.1.3', '10.1.1.2', '10.1.1.5']
+		ludicredis.srandmember.assert_called_once_with('ludicrous:hash', ludicrousServer.CANDIDATE_PEERS)
+
+	@patch('ludicrousServer.get_locality')
+	def test_find_peers_none(self, mock_get_locality, ludicredis):
+		ludicredis.srandmember.return_value = [b'10.1.1.1']
+
+		assert ludicrousServer.find_peers('ludicrous:hash', '10.1.1.1') == []
+		ludicredis.pipeline.assert_not_called()
+
+	def test_peerdone(self, ludicredis, app):
+		ludicredis.smembers.return_value = [b'ludicrous:a', b'ludicrous:b:partial']
+		pipe = ludicredis.pipeline.return_value
+
+		res = app.delete('/peerdone', environ_base={'REMOTE_ADDR': '10.1.1.1'})
+
+		assert res.json['success']
+		ludicredis.smembers.assert_called_once_with('ludicrous:host:10.1.1.1')
+		assert pipe.srem.call_args_list == [
+			call(b'ludicrous:a', '10.1.1.1'),
+			call(b'ludicrous:b:partial', '10.1.1.1'),
+		]
+		pipe.delete.assert_called_once_with('ludicrous:host:10.1.1.1')
+		pipe.execute.assert_called_once()
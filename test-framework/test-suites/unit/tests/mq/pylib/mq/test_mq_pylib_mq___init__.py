@@ -0,0 +1,89 @@
+import json
+import pytest
+from stack.mq import Message, Receiver, Counters, decodeMessages, encodeBatch
+
+class TestMessage:
+	"""A test case for the message queue messages."""
+
+	def test_str(self):
+		"""The payload is encoded once and spliced into the header."""
+		message = Message({'state': 'online'}, channel='health', source='10.1.1.1')
+		assert json.loads(str(message)) == {
+			'channel': 'health',
+			'payload': {'state': 'online'},
+			'ttl': 30,
+			'source': '10.1.1.1',
+		}
+
+		message.addHop().setChannel(None)
+		assert json.loads(str(message))['hops'] == 1
+		assert json.loads(str(message.setPayload('offline')))['payload'] == 'offline'
+		assert json.loads(str(Message('x', ttl=-1)))  == {'payload': 'x', 'ttl': -1}
+		assert json.loads(str(Message(ttl=-1))) == {'ttl': -1}
+
+class TestReceiver:
+	"""A test case for decoding the datagrams received by the message queue daemons."""
+
+	def test_decode(self):
+		receiver = Receiver.__new__(Receiver)
+		receiver.bad = 0
+		addr = ('10.1.1.1', 1234)
+
+		msgs = receiver.decode(b'health online', addr)
+		assert [(m.getChannel(), m.getPayload(), m.getSource()) for m in msgs] == [('health', 'online', '10.1.1.1')]
+
+		batch = encodeBatch([str(Message(str(i), channel='health')) for i in range(3)])
+		msgs = receiver.decode(batch, ('127.0.0.1', 1234))
+		assert [m.getPayload() for m in msgs] == ['0', '1', '2']
+		assert all(m.getTime() and not m.getSource() for m in msgs)
+		assert receiver.bad == 0
+
+	def test_decode_bad(self):
+		"""Elements of a batch that are not messages are skipped and counted."""
+		receiver = Receiver.__new__(Receiver)
+		receiver.bad = 0
+		addr = ('10.1.1.1', 1234)
+
+		msgs = receiver.decode(b'[{"channel": "health", "payload": "a"}, 1, "x", {"payload": "b"}]', addr)
+		assert [m.getPayload() for m in msgs] == ['a', 'b']
+		assert receiver.bad == 2
+
+		assert receiver.decode(b'online', addr) == []
+		assert receiver.bad == 3
+
+class TestDecodeMessages:
+	"""A test case for decoding json messages."""
+
+	@pytest.mark.parametrize('text', (
+		'{"channel": "health", "payload": {"state": "online", "n": [1, 2.5, null]}, "ttl": 10}',
+		' { "payload" : "x\\"}" , "id":1 } ',
+		'[]',
+		'[{}, {"payload": [1, {"a": "b"}]}]',
+		'{"payload": "\\u00e9t\\u00e9"}',
+	))
+	def test_decode(self, text):
+		"""Messages are decoded just like json.loads() decodes them."""
+		data = json.loads(text)
+		msgs = decodeMessages(text)
+		if not isinstance(data, list):
+			data = [data]
+		assert [json.loads(str(m)) for m in msgs] == [json.loads(str(Message(message=d))) for d in data]
+		assert [m.getPayload() for m in msgs] == [d.get('payload') for d in data]
+
+	def test_payload_kept(self):
+		"""The payload text is spliced in unchanged when the message is forwarded."""
+		msg, = decodeMessages('{"channel": "health", "payload": {"b": 1,   "a": 2}}', channel='other')
+		assert msg.getChannel() == 'other'
+		assert str(msg.addHop()) == '{"channel": "other", "hops": 1, "ttl": 30, "payload": {"b": 1,   "a": 2}}'
+		assert json.loads(str(msg.setPayload('x')))['payload'] == 'x'
+
+	@pytest.mark.parametrize('text', ('', 'health online', '{"a": 1', '{"a" 1}', '[{"a": 1} {}]', '{} {}', '1'))
+	def test_not_json(self, text):
+		with pytest.raises(ValueError):
+			decodeMessages(text)
+
+def test_counters():
+	counters = Counters()
+	counters.add('health', 'received', 3)
+	counters.add('health', 'forwarded')
+	assert counters.get() == {'health': {'received': 3, 'forwarded': 1, 'dropped': 0}}
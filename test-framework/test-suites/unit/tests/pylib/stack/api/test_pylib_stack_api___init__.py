@@ -0,0 +1,72 @@
+import io
+from unittest.mock import patch, MagicMock
+import pytest
+import stack.api
+
+class TestApi:
+	"""Test case for running stack commands from python"""
+
+	@pytest.fixture
+	def stack_path(self, tmp_path):
+		stack_path = tmp_path / 'stack'
+		stack_path.touch()
+		with patch.object(stack.api, '__stack__', str(stack_path)):
+			yield
+
+	@patch.object(stack.api, '_connect')
+	def test_call_in_process(self, mock_connect, stack_path):
+		mock_module = MagicMock()
+		mock_module.Command.return_value.runWrapper.return_value = True
+		mock_module.Command.return_value.rows = [{'host': 'backend-0-0'}]
+		mock_module.Command.return_value.getText.return_value = None
+
+		with patch('importlib.import_module', return_value = mock_module) as mock_import:
+			assert stack.api.Call('list host', ['a:backend']) == [{'host': 'backend-0-0'}]
+
+		mock_import.assert_called_once_with('stack.commands.list.host')
+		mock_module.Command.assert_called_once_with(mock_connect.return_value)
+		mock_module.Command.return_value.runWrapper.assert_called_once_with(
+			'list host', ['a:backend', 'output-format=binary']
+		)
+		assert stack.api.ReturnCode() == 0
+
+	@patch.object(stack.api, '_connect')
+	def test_call_in_process_fails(self, mock_connect, stack_path, capsys):
+		mock_module = MagicMock()
+		mock_module.Command.return_value.runWrapper.side_effect = stack.api.CommandError('cmd', 'bad host')
+
+		with patch('importlib.import_module', return_value = mock_module):
+			assert stack.api.Call('list host', ['x'], stderr = False) == []
+			assert stack.api.ReturnCode() == 255
+			assert capsys.readouterr().err == ''
+
+			assert stack.api.Call('list host', ['x']) == []
+			assert 'bad host' in capsys.readouterr().err
+
+	@patch.object(stack.api, '_connect')
+	@patch('subprocess.Popen')
+	def test_call_subprocess(self, mock_popen, mock_connect, stack_path):
+		"""Commands other than list commands are run as the stack command."""
+		mock_popen.return_value.stdout = io.StringIO('a\nb\n')
+		mock_popen.return_value.stderr = io.StringIO('')
+		mock_popen.return_value.wait.return_value = 0
+
+		with patch('importlib.import_module') as mock_import:
+			assert stack.api.Call('report host', ['a']) == ['a', 'b', '']
+
+		mock_import.assert_not_called()
+		mock_connect.assert_not_called()
+		assert mock_popen.call_args[0][0][1:] == ['report', 'host', 'a']
+
+	@patch.object(stack.api, 'InProcess', False)
+	@patch('subprocess.Popen')
+	def test_iterate_subprocess(self, mock_popen, stack_path):
+		rows = '[\n\t{\n\t\t"host": "a",\n\t\t"rack": 0\n\t},\n\t{\n\t\t"host": "b [,]"\n\t}\n]\n'
+		mock_popen.return_value.stdout = io.StringIO(rows)
+		mock_popen.return_value.wait.return_value = 0
+
+		with patch.object(mock_popen.return_value.stdout, 'read', side_effect = list(rows) + ['']):
+			assert list(stack.api.Iterate('list.host')) == [{'host': 'a', 'rack': 0}, {'host': 'b [,]'}]
+
+		assert mock_popen.call_args[0][0][1:] == ['list', 'host', 'output-format=json']
+		assert stack.api.ReturnCode() == 0
@@ -0,0 +1,16 @@
+from stack.cond import EvalCondExpr, CondExprNames
+import pytest
+
+@pytest.mark.parametrize("cond, names", [
+	('appliance == "backend"', {"appliance"}),
+	('rack == "0" and box.name in ["default"]', {"rack", "box.name"}),
+	('any(x for x in [rack])', {"any", "rack"}),
+	("", set()),
+	('appliance ==', None),
+])
+def test_cond_expr_names(cond, names):
+	assert CondExprNames(cond) == names
+
+def test_eval_cond_expr():
+	assert EvalCondExpr('rack == "0" and managed', {"rack": "0", "managed": "true"})
+	assert not EvalCondExpr('missing', {})
@@ -0,0 +1,103 @@
+import os
+import sys
+import pytest
+from unittest.mock import MagicMock, patch
+from stack.evaluate import EvalExecutor
+
+class TestEvalExecutor:
+	"""Test case for the eval and report executor"""
+
+	@pytest.fixture
+	def executor(self):
+		executor = EvalExecutor()
+		yield executor
+		executor.close()
+
+	def test_python_worker(self, executor):
+		rc, out, err = executor.run(sys.executable, 'import os, sys\nprint("out")\nos.system("echo sub")\nsys.stderr.write("err")\n')
+		assert (rc, out, err) == (0, b"out\nsub\n", b"err")
+
+		# The worker is kept for the next eval
+		assert len(executor.idle[sys.executable]) == 1
+		assert executor.run(sys.executable, "import sys\nsys.exit(3)")[0] == 3
+		assert b"ValueError" in executor.run(sys.executable, "raise ValueError")[2]
+		assert len(executor.idle[sys.executable]) == 1
+
+	def test_python_worker_resets_state(self, executor):
+		executor.run(sys.executable, 'import os, sys\nos.environ["FOO"] = "bar"\nsys.path.append("foo")\nos.chdir("/")')
+		rc, out, err = executor.run(sys.executable, 'import os, sys\nprint(os.environ.get("FOO"), "foo" in sys.path, os.getcwd())')
+		assert out.split() == [b"None", b"False", os.getcwd().encode()]
+
+	def test_python_worker_exits(self, executor, tmp_path):
+		"""A script that kills its worker fails, and is not run a second time."""
+		ran = tmp_path / "ran"
+		rc, out, err = executor.run(sys.executable, f"import os\nopen({str(ran)!r}, 'a').write('x')\nos._exit(0)", cache = False)
+		assert rc != 0 and b"python worker exited" in err
+		assert ran.read_text() == "x"
+
+		# The next script gets a new worker
+		assert executor.run(sys.executable, "print(1)", cache = False) == (0, b"1\n", b"")
+
+	def test_dead_idle_worker(self, executor):
+		"""A worker that died while idle has not run the script, which is run on its own."""
+		executor.run(sys.executable, "pass")
+		worker, = executor.idle[sys.executable]
+		worker.process.kill()
+		worker.process.wait()
+		assert executor.run(sys.executable, "print(2)", cache = False) == (0, b"2\n", b"")
+
+	def test_memo_is_bounded(self, executor):
+		rcl = MagicMock()
+		rcl.command.side_effect = lambda command, args: args[0]
+		executor.size = 3
+		for host in range(10):
+			executor.report(rcl, "report.host", [f"backend-0-{host}"], "base.xml")
+		assert len(executor.memo) == 3
+		assert len(executor.getTimings()) == 1
+
+		# Expired results are dropped when new ones are remembered
+		executor.ttl = 0
+		executor.report(rcl, "report.host", ["backend-0-10"], "base.xml")
+		assert len(executor.memo) == 1
+
+	def test_memo(self, executor):
+		script = 'import random\nprint(random.random())'
+		assert executor.run(sys.executable, script) == executor.run(sys.executable, script)
+		assert executor.run(sys.executable, script) != executor.run(sys.executable, script, cache = False)
+
+		executor.ttl = 0
+		assert executor.run(sys.executable, script) != executor.run(sys.executable, script)
+
+	def test_clear(self, executor):
+		rcl = MagicMock()
+		rcl.command.side_effect = ["a", "b"]
+		assert executor.report(rcl, "report.host", ["backend-0-0"]) == "a"
+		assert executor.report(rcl, "report.host", ["backend-0-0"]) == "a"
+		executor.clear()
+		assert executor.report(rcl, "report.host", ["backend-0-0"]) == "b"
+
+	@patch(target = "subprocess.Popen", autospec = True)
+	def test_failures_are_not_remembered(self, mock_popen, executor):
+		mock_popen.return_value.communicate.return_value = (b"", b"error")
+		mock_popen.return_value.returncode = 1
+		executor.run("sh", "false")
+		executor.run("sh", "false")
+		assert mock_popen.call_count == 2
+
+	def test_report(self, executor):
+		rcl = MagicMock()
+		rcl.command.return_value = ""
+		assert executor.report(rcl, "report.host", ["backend-0-0"], "base.xml") == ""
+		assert executor.report(rcl, "report.host", ["backend-0-0"], "base.xml") == ""
+		rcl.command.assert_called_once_with("report.host", ["backend-0-0"])
+
+		(filename, label, stats), = executor.getTimings()
+		assert (filename, label, stats["count"], stats["cached"]) == ("base.xml", "report host", 2, 1)
+
+	def test_uncached_sections_are_counted(self, executor):
+		rcl = MagicMock()
+		rcl.command.return_value = ""
+		executor.report(rcl, "report.host", ["backend-0-0"])
+		assert executor.uncached == 0
+		executor.report(rcl, "report.host", ["backend-0-0"], cache=False)
+		assert executor.uncached == 1
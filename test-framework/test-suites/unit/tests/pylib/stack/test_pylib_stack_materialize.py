@@ -0,0 +1,97 @@
+import os
+import stat
+import pytest
+from unittest.mock import patch
+import stack.materialize
+from stack.materialize import Materializer, Unsupported
+
+class TestMaterializer:
+	"""Test case for writing report output files in-process"""
+
+	@pytest.fixture
+	def materializer(self, tmp_path):
+		materializer = Materializer(root=str(tmp_path))
+		materializer.RCS = str(tmp_path / 'no-rcs')
+		return materializer
+
+	def test_write(self, materializer, tmp_path):
+		text = '<stack:file stack:name="/etc/hosts" stack:perms="0640">\n127.0.0.1 localhost\n</stack:file>\n'
+
+		assert materializer.run(text) == ['/etc/hosts']
+		assert (tmp_path / 'etc/hosts').read_text() == '127.0.0.1 localhost\n'
+		assert stat.S_IMODE(os.stat(tmp_path / 'etc/hosts').st_mode) == 0o640
+
+		# Nothing changed, nothing is written
+		inode = os.stat(tmp_path / 'etc/hosts').st_ino
+		assert materializer.run(text) == []
+		assert os.stat(tmp_path / 'etc/hosts').st_ino == inode
+
+		# The permissions alone changed
+		assert materializer.run(text.replace('0640', '0644')) == ['/etc/hosts']
+
+	@patch.object(stack.materialize, 'umask', 0o027)
+	def test_new_file_mode(self, materializer, tmp_path):
+		"""New files get the umask read at import, the umask is never set while writing."""
+		with patch('os.umask') as mock_umask:
+			materializer.write(str(tmp_path / 'new'), b'x')
+
+		mock_umask.assert_not_called()
+		assert stat.S_IMODE(os.stat(tmp_path / 'new').st_mode) == 0o640
+
+	def test_heredoc_newlines(self, materializer, tmp_path):
+		materializer.run('<stack:file stack:name="/a">one</stack:file>'
+				 '<stack:file stack:name="/b"><![CDATA[\n\ntwo\n]]></stack:file>')
+		assert (tmp_path / 'a').read_text() == 'one\n'
+		assert (tmp_path / 'b').read_text() == '\ntwo\n'
+
+	def test_append_and_touch(self, materializer, tmp_path):
+		(tmp_path / 'c').write_text('keep\n')
+		assert materializer.run('<stack:file stack:name="/c"/>') == []
+		assert (tmp_path / 'c').read_text() == 'keep\n'
+
+		assert materializer.run('<stack:file stack:name="/d">one</stack:file>'
+					'<stack:file stack:name="/d" stack:mode="append">two</stack:file>') == ['/d']
+		assert (tmp_path / 'd').read_text() == 'one\ntwo\n'
+
+	def test_symlink(self, materializer, tmp_path):
+		(tmp_path / 'target').write_text('old\n')
+		os.symlink(tmp_path / 'target', tmp_path / 'link')
+		materializer.run('<stack:file stack:name="/link">new</stack:file>')
+		assert os.path.islink(tmp_path / 'link')
+		assert (tmp_path / 'target').read_text() == 'new\n'
+
+	def test_shell(self, materializer, tmp_path):
+		materializer.run('<stack:file stack:name="/e">e</stack:file>\ncp %s %s\n' %
+				 (tmp_path / 'e', tmp_path / 'f'))
+		assert (tmp_path / 'f').read_text() == 'e\n'
+
+	def test_shell_state(self, materializer, tmp_path):
+		"""Test that the shell sections share one shell, like the whole report piped into one."""
+		materializer.run(
+			'cd %s\nX=x\n'
+			'<stack:file stack:name="/e">e</stack:file>\n'
+			'cat e > f\necho $X > g\n' % tmp_path)
+		assert (tmp_path / 'f').read_text() == 'e\n'
+		assert (tmp_path / 'g').read_text() == 'x\n'
+
+	def test_shell_exit(self, materializer, tmp_path):
+		"""Test that nothing after the shell exits is done."""
+		materializer.run(
+			'<stack:file stack:name="/e">e</stack:file>\n'
+			'exit 1\n'
+			'<stack:file stack:name="/f">f</stack:file>\n'
+			'touch %s\n' % (tmp_path / 'g'))
+		assert (tmp_path / 'e').exists()
+		assert not (tmp_path / 'f').exists()
+		assert not (tmp_path / 'g').exists()
+
+	@pytest.mark.parametrize('text', [
+		'<stack:file stack:name="/g" stack:vars="expanded">$HOME</stack:file>',
+		'<stack:file stack:name="/g" stack:expr="date"/>',
+		'<stack:script>date</stack:script>',
+		'<stack:file stack:name="/g">&undefined;</stack:file>',
+	])
+	def test_unsupported(self, materializer, tmp_path, text):
+		with pytest.raises(Unsupported):
+			materializer.run(text)
+		assert not (tmp_path / 'g').exists()
@@ -1,7 +1,9 @@
+import json
 import pytest
-from unittest.mock import patch
-from stack.profile import Pass1NodeHandler
+from unittest.mock import patch, MagicMock
+from stack.profile import Pass1NodeHandler, GraphHandler, GraphCache, ProfileCache, NodeTokenizer, Node
 from stack.util import KickstartNodeError
+from stack.evaluate import EvalExecutor
 
 class Pass1NodeHandlerUnderTest(Pass1NodeHandler):
 	"""Class override to mock __init__ to remove required dependencies."""
@@ -24,3 +26,218 @@ def test_endTag_stack_eval_command_failure(mock_popen):
 
 	with pytest.raises(KickstartNodeError):
 		test_node_handler.endTag_stack_eval(ns="foo", tag="bar")
+
+class TestGraphCache:
+	"""Test case for the compiled graph cache"""
+
+	ATTRS = {"os": "redhat", "arch": "x86_64", "appliance": "backend", "box": "default"}
+
+	@pytest.fixture
+	def graph(self, tmp_path):
+		graph = tmp_path / "graph"
+		graph.mkdir()
+		(graph / "default.xml").write_text(
+			'<?xml version="1.0" standalone="no"?>\n'
+			'<graph>\n'
+			'<order head="HEAD"><tail>base</tail></order>\n'
+			'<edge from="backend" to="base"/>\n'
+			'<edge from="backend"><to cond="appliance == \'frontend\'">server</to></edge>\n'
+			'<edge from="backend" to="client" cond="appliance == \'backend\'"/>\n'
+			'</graph>\n'
+		)
+		(graph / "site.xml").write_text(
+			'<graph>\n'
+			'<edge from="backend" to="&box;-site"/>\n'
+			'</graph>\n'
+		)
+		return graph
+
+	def edges(self, handler):
+		return sorted(
+			(e.parent.name, e.child.name, e.getConditional())
+			for e in handler.getMainGraph().getEdges()
+		)
+
+	def parse(self, graph, cache):
+		handler = GraphHandler(self.ATTRS)
+		handler.parseGraph(str(graph), cache)
+		return handler
+
+	def test_compiled_graph_matches_parsed(self, graph, tmp_path):
+		cache = GraphCache(str(tmp_path / "cache"))
+		parsed = self.parse(graph, None)
+		assert self.edges(self.parse(graph, cache)) == self.edges(parsed)
+
+		# The second time the graph comes from the compiled file
+		with patch.object(GraphCache, "compile") as mock_compile:
+			assert self.edges(self.parse(graph, cache)) == self.edges(parsed)
+			mock_compile.assert_not_called()
+
+		assert ("backend", "client", "appliance == 'backend'") in self.edges(parsed)
+		assert ("backend", "default-site", "") in self.edges(parsed)
+		assert not any(child == "server" for parent, child, cond in self.edges(parsed))
+
+	def test_dynamic_files_are_not_compiled(self, graph, tmp_path):
+		cache = GraphCache(str(tmp_path / "cache"))
+		files = dict(cache.load(str(graph)))
+		assert files[str(graph / "site.xml")] is None
+		assert files[str(graph / "default.xml")]
+
+	def test_changed_graph_is_recompiled(self, graph, tmp_path):
+		cache = GraphCache(str(tmp_path / "cache"))
+		cache.load(str(graph))
+		compiled, = cache.getCompiled()
+		assert cache.isCurrent(compiled)
+
+		(graph / "extra.xml").write_text('<graph><edge from="backend" to="extra"/></graph>\n')
+		assert not cache.isCurrent(compiled)
+		assert ("backend", "extra", "") in self.edges(self.parse(graph, cache))
+
+	def test_bad_compiled_graph_is_recompiled(self, graph, tmp_path):
+		"""Anything that is not a JSON compiled graph (e.g. a pickle) is never loaded."""
+		cache = GraphCache(str(tmp_path / "cache"))
+		cache.load(str(graph))
+		filename = cache.getFilename(str(graph))
+		with open(filename, "wb") as f:
+			f.write(b"\x80\x04\x95\x00\x00\x00\x00\x00\x00\x00\x00}\x94.")
+
+		assert cache.read(filename) is None
+		assert ("backend", "default-site", "") in self.edges(self.parse(graph, cache))
+		assert json.load(open(filename))["version"] == GraphCache.VERSION
+
+	def test_invalidate(self, graph, tmp_path):
+		cache = GraphCache(str(tmp_path / "cache"))
+		cache.load(str(graph))
+		assert cache.invalidate([str(tmp_path / "nothing")]) == 0
+		assert cache.invalidate([str(graph)]) == 1
+		assert cache.getCompiled() == []
+
+class TestProfileCache:
+	"""Test case for the cached host profiles"""
+
+	ATTRS = {"os": "redhat", "box": "default", "nukedisks": "false"}
+	TABLES = (("cluster.nodes", 1234), ("cluster.networks", 5678))
+
+	@pytest.fixture
+	def pallet(self, tmp_path):
+		pallet = tmp_path / "pallet"
+		(pallet / "graph" / "default").mkdir(parents=True)
+		(pallet / "nodes").mkdir()
+		(pallet / "graph" / "default" / "default.xml").write_text("<graph/>")
+		(pallet / "nodes" / "base.xml").write_text("<stack:stack/>")
+		return pallet
+
+	def fingerprint(self, pallet, attrs=ATTRS, tables=TABLES):
+		return ProfileCache("unused").fingerprint(attrs, tables, [str(pallet)])
+
+	def test_hit_and_miss(self, pallet, tmp_path):
+		cache = ProfileCache(str(tmp_path / "cache"))
+		fingerprint = self.fingerprint(pallet)
+		assert cache.get("backend-0-0", fingerprint) is None
+
+		cache.put("backend-0-0", fingerprint, "<profile/>")
+		assert cache.get("backend-0-0", fingerprint) == "<profile/>"
+		assert cache.get("backend-0-0", "stale") is None
+		assert cache.getStats() == {"backend-0-0": [1, 2]}
+
+	@pytest.mark.parametrize("contents", [
+		b"\x80\x04\x95\x00\x00\x00\x00\x00\x00\x00\x00}\x94.",
+		b"not json",
+		b'{"version": 1, "host": "backend-0-0", "fingerprint": "f", "time": 0, "profile": ["x"]}',
+		b'["backend-0-0"]',
+	])
+	def test_bad_entry_is_a_miss(self, tmp_path, contents):
+		"""Anything that is not a JSON profile entry (e.g. a pickle) is never loaded."""
+		cache = ProfileCache(str(tmp_path / "cache"))
+		cache.put("backend-0-0", "f", "<profile/>")
+		(tmp_path / "cache" / "backend-0-0.profile").write_bytes(contents)
+
+		assert cache.get("backend-0-0", "f") is None
+		assert cache.getEntries() == []
+
+	@pytest.mark.parametrize("change", ["attrs", "tables", "nodes", "graph", "cart"])
+	def test_fingerprint_changes(self, pallet, change):
+		before = self.fingerprint(pallet)
+		attrs, tables = self.ATTRS, self.TABLES
+
+		if change == "attrs":
+			attrs = dict(attrs, nukedisks="true")
+		elif change == "tables":
+			tables = (("cluster.nodes", 1234), ("cluster.networks", 0))
+		elif change == "nodes":
+			(pallet / "nodes" / "base.xml").write_text("<stack:stack></stack:stack>")
+		elif change == "graph":
+			(pallet / "graph" / "default" / "site.xml").write_text("<graph/>")
+		elif change == "cart":
+			(pallet / "RPMS").mkdir()
+
+		assert self.fingerprint(pallet, attrs, tables) != before
+
+	def test_fingerprint_is_stable(self, pallet):
+		assert self.fingerprint(pallet) == self.fingerprint(pallet, dict(reversed(list(self.ATTRS.items()))))
+
+	def test_invalidate(self, pallet, tmp_path):
+		cache = ProfileCache(str(tmp_path / "cache"))
+		for host in ["backend-0-0", "backend-0-1"]:
+			cache.put(host, "fingerprint", "<profile/>")
+			cache.get(host, "fingerprint")
+
+		assert cache.invalidate(["backend-0-0"]) == 1
+		assert [entry["host"] for entry in cache.getEntries()] == ["backend-0-1"]
+		assert cache.getStats() == {"backend-0-1": [1, 0]}
+
+		assert cache.invalidate() == 1
+		assert cache.getEntries() == []
+		assert cache.getStats() == {}
+
+
+class TestNodeTokenizer:
+	"""Test case for replaying cached node file tokens"""
+
+	ATTRS = {"os": "redhat", "hostname": "backend-0-0", "rack": "0", "quoted": "a&#x22;b"}
+
+	@pytest.fixture
+	def nodes(self, tmp_path):
+		(tmp_path / "nodes").mkdir()
+		(tmp_path / "nodes" / "backend.xml").write_text(
+			'<?xml version="1.0" standalone="no"?>\n'
+			'<stack:stack>\n'
+			'<stack:script stack:stage="install-post">\n'
+			'echo &hostname; &undefined; &quoted; &amp; &lt;done&gt;\n'
+			'</stack:script>\n'
+			'<stack:report stack:name="never" stack:cond="rack == \'1\'">&hostname;</stack:report>\n'
+			'<stack:report stack:name="host">&hostname; &quoted;</stack:report>\n'
+			'</stack:stack>\n'
+		)
+		(tmp_path / "nodes" / "attrs.xml").write_text(
+			'<stack:stack>\n'
+			'<stack:script stack:stage="&hostname;">true</stack:script>\n'
+			'</stack:stack>\n'
+		)
+		return tmp_path
+
+	def expand(self, nodes, name, tokenize):
+		rcl = MagicMock()
+		rcl.command.return_value = "report"
+		handler = GraphHandler(self.ATTRS, directories = [str(nodes)], tokenize = tokenize)
+		node = Node(name)
+		with patch("stack.evaluate.executor", EvalExecutor(ttl = 0)):
+			handler.parseNode(node, True, rcl)
+		return node.getXML(), rcl.command.call_args_list
+
+	def test_replay_matches_parse(self, nodes):
+		NodeTokenizer.cache.clear()
+		parsed = self.expand(nodes, "backend", False)
+		assert self.expand(nodes, "backend", True) == parsed
+		assert 'echo backend-0-0  a"b &amp; &lt;done&gt;' in parsed[0]
+		assert [args for (command, args), kwargs in parsed[1]] == [["backend-0-0", " ", 'a"b']]
+
+	def test_tokens_are_cached(self, nodes):
+		filename = str(nodes / "nodes" / "backend.xml")
+		tokens = NodeTokenizer.getTokens(filename, "xmlns:stack='http://www.stacki.com'")
+		assert tokens is not None
+		assert NodeTokenizer.getTokens(filename, "xmlns:stack='http://www.stacki.com'") is tokens
+
+	def test_attribute_entities_are_parsed(self, nodes):
+		assert NodeTokenizer.getTokens(str(nodes / "nodes" / "attrs.xml"), "") is None
+		assert 'stack:stage="backend-0-0"' in self.expand(nodes, "attrs", True)[0]
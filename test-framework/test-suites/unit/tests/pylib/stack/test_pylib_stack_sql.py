@@ -0,0 +1,74 @@
+from stack.sql import SelectCache, sql_read_tables, sql_write_tables
+import pytest
+
+class TestSelectCache:
+	"""Test case for the table aware select cache"""
+
+	def test_hit_and_miss_counters(self):
+		cache = SelectCache()
+		assert cache.get("foo") is None
+		cache.put("foo", (("a",),), {"nodes"})
+		assert cache.get("foo") == (("a",),)
+		assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+	def test_invalidate_only_readers(self):
+		cache = SelectCache()
+		cache.put("hosts", (), {"nodes", "appliances"})
+		cache.put("attrs", (), {"attributes", "scope_map"})
+		cache.put("unknown", (), None)
+
+		assert cache.invalidate({"attributes"}) == 2
+		assert "hosts" in cache
+		assert "attrs" not in cache
+		assert "unknown" not in cache
+
+	def test_invalidate_everything(self):
+		cache = SelectCache()
+		cache.put("hosts", (), {"nodes"})
+		cache.put("attrs", (), {"attributes"})
+		assert cache.invalidate() == 2
+		assert len(cache) == 0
+
+	def test_lru_bound(self):
+		cache = SelectCache(maxsize = 2)
+		cache.put("a", (), {"nodes"})
+		cache.put("b", (), {"nodes"})
+		cache.get("a")
+		cache.put("c", (), {"nodes"})
+		assert "a" in cache
+		assert "b" not in cache
+		assert cache.stats()["evictions"] == 1
+		# the evicted key must not be left behind in the table index
+		assert cache.readers["nodes"] == {"a", "c"}
+
+	@pytest.mark.parametrize("command, tables", [
+		("name from nodes where name=%s", {"nodes"}),
+		("n.name, a.name from nodes n, appliances a where n.appliance=a.id", {"nodes", "appliances"}),
+		(
+			"(SELECT nodes.name FROM nodes INNER JOIN shadow.attributes ON x) UNION (SELECT id FROM cluster.boxes)",
+			{"nodes", "shadow.attributes", "boxes"}
+		),
+		("count(*)", None),
+	])
+	def test_sql_read_tables(self, command, tables):
+		assert sql_read_tables(command, "cluster") == tables
+
+	@pytest.mark.parametrize("command, tables", [
+		("insert into attributes (name) values (%s)", {"attributes"}),
+		("INSERT INTO shadow.attributes(scope_map_id, name, value) VALUES (%s, %s, %s)", {"shadow.attributes"}),
+		("update nodes set rack=%s where name=%s", {"nodes"}),
+		("update nodes n, networks i set i.ip=NULL where n.id=i.node", {"nodes", "networks"}),
+		("delete from switchports where switch=(select id from nodes where name=%s)", {"switchports"}),
+		("delete from networks where id=%s", {"networks", "aliases", "ib_memberships", "switchports"}),
+		("select name from nodes", set()),
+		("commit", set()),
+		("checksum table nodes, networks", set()),
+		("drop table foo", None),
+	])
+	def test_sql_write_tables(self, command, tables):
+		assert sql_write_tables(command, "cluster") == tables
+
+	def test_delete_cascades(self):
+		"""Deleting a host removes its interfaces and attributes through the foreign keys."""
+		tables = sql_write_tables("delete from nodes where id=%s")
+		assert {"networks", "scope_map", "attributes", "shadow.attributes", "switchports"} <= tables
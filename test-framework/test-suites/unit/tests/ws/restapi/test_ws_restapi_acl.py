@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from stack.restapi.acl import CommandMatcher, commandMatch
+
+
+@pytest.fixture
+def model():
+	model = MagicMock()
+	model.objects.aggregate.return_value = {'count': 2, 'last': 2}
+	model.objects.values.return_value = [{'command': 'list host *'}, {'command': 'sync.*'}]
+	return model
+
+
+class TestCommandMatch:
+
+	@pytest.mark.parametrize('command, mod, expected', (
+		('list host *', 'list.host.attr', True),
+		('list host', 'list.host', True),
+		('list host', 'list.host.attr', False),
+		('sync.*', 'sync.config', True),
+		('sync.*', 'list.sync', False),
+	))
+	def test_commandMatch(self, command, mod, expected):
+		assert commandMatch(command, mod) == expected
+
+
+class TestCommandMatcher:
+
+	def test_match(self, model):
+		matcher = CommandMatcher(model)
+
+		assert matcher.match('list.host.attr')
+		assert matcher.match('sync.config')
+		assert not matcher.match('list.appliance')
+
+		# The list is read once while it doesn't change
+		model.objects.values.assert_called_once_with('command')
+		assert model.objects.aggregate.call_count == 3
+
+	@pytest.mark.parametrize('stamp', (
+		{'count': 1, 'last': 2},
+		{'count': 2, 'last': 3},
+	))
+	def test_match_changed(self, model, stamp):
+		matcher = CommandMatcher(model)
+		assert not matcher.match('list.appliance')
+
+		model.objects.aggregate.return_value = stamp
+		model.objects.values.return_value = [{'command': 'list appliance'}]
+
+		assert matcher.match('list.appliance')
+		assert not matcher.match('sync.config')
+		assert model.objects.values.call_count == 2
@@ -0,0 +1,92 @@
+from unittest.mock import MagicMock, call, patch
+
+import pytest
+
+from stack.restapi.pool import ConnectionPool
+
+
+@pytest.fixture
+def mock_connect():
+	with patch('stack.restapi.pool.get_mysql_connection', autospec=True) as mock_connect:
+		mock_connect.side_effect = lambda user, password: MagicMock()
+		yield mock_connect
+
+
+class TestConnectionPool:
+
+	def test_connection_reused(self, mock_connect):
+		pool = ConnectionPool()
+
+		with pool.connection('nobody', '') as first:
+			pass
+		with pool.connection('nobody', '') as second:
+			pass
+
+		assert first is second
+		mock_connect.assert_called_once_with('nobody', '')
+		first.rollback.assert_has_calls([call(), call()])
+		first.ping.assert_called_once_with(reconnect=True)
+		first.close.assert_not_called()
+
+	def test_connection_per_user(self, mock_connect):
+		pool = ConnectionPool()
+
+		with pool.connection(None, None) as root:
+			pass
+		with pool.connection('nobody', '') as nobody:
+			pass
+
+		assert root is not nobody
+		assert mock_connect.call_count == 2
+
+	def test_rollback_fails(self, mock_connect):
+		"""Test that a connection that cannot be rolled back is not kept."""
+		pool = ConnectionPool()
+
+		with pool.connection() as first:
+			first.rollback.side_effect = Exception
+		with pool.connection() as second:
+			pass
+
+		assert first is not second
+		first.close.assert_called_once_with()
+
+	def test_command_fails(self, mock_connect):
+		"""Test that the connection of a command that failed is not kept."""
+		pool = ConnectionPool()
+
+		with pytest.raises(ValueError):
+			with pool.connection() as first:
+				raise ValueError
+
+		first.close.assert_called_once_with()
+		first.rollback.assert_not_called()
+		assert pool.idle == {}
+
+	def test_ping_fails(self, mock_connect):
+		"""Test that a connection the server dropped is replaced."""
+		pool = ConnectionPool()
+
+		with pool.connection() as first:
+			pass
+		first.ping.side_effect = Exception
+		with pool.connection() as second:
+			pass
+
+		assert first is not second
+		first.close.assert_called_once_with()
+
+	def test_size(self, mock_connect):
+		pool = ConnectionPool(size=1)
+
+		first = pool.acquire()
+		second = pool.acquire()
+		pool.release(first)
+		pool.release(second)
+
+		assert pool.idle == {(None, None): [first]}
+		second.close.assert_called_once_with()
+
+		pool.close()
+		assert pool.idle == {}
+		first.close.assert_called_once_with()
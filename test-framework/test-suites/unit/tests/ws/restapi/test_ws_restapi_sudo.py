@@ -0,0 +1,123 @@
+import io
+import struct
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from stack.restapi.sudo import SudoWorker, SudoWorkerPool, recv, send
+
+
+def frames(*messages):
+	stream = io.BytesIO()
+	for message in messages:
+		send(stream, message)
+	stream.seek(0)
+	return stream
+
+
+@pytest.fixture
+def mock_popen():
+	with patch('subprocess.Popen', autospec=True) as mock_popen:
+		mock_popen.return_value.poll.return_value = None
+		mock_popen.return_value.stdin = io.BytesIO()
+		yield mock_popen
+
+
+class TestFraming:
+
+	def test_send_recv(self):
+		stream = frames({'command': 'sync.config', 'args': ['a']}, {'rc': 0})
+
+		assert recv(stream) == {'command': 'sync.config', 'args': ['a']}
+		assert recv(stream) == {'rc': 0}
+		assert recv(stream) is None
+
+	def test_send(self):
+		stream = io.BytesIO()
+		send(stream, {'rc': 0})
+
+		assert stream.getvalue() == struct.pack('!I', 9) + b'{"rc": 0}'
+
+	@pytest.mark.parametrize('data', (b'\0\0', struct.pack('!I', 9) + b'{"rc"'))
+	def test_recv_truncated(self, data):
+		assert recv(io.BytesIO(data)) is None
+
+
+class TestSudoWorker:
+
+	def test_run(self, mock_popen):
+		mock_popen.return_value.stdout = frames(
+			{'ready': True},
+			{'rc': 0, 'output': 'out', 'error': ''},
+			{'rc': 1, 'output': '', 'error': 'err'},
+		)
+		worker = SudoWorker()
+
+		assert worker.run('sync.config', ['a']) == (0, 'out', '')
+		assert worker.run('load', []) == (1, '', 'err')
+
+		# One worker for both commands
+		mock_popen.assert_called_once()
+		stdin = io.BytesIO(mock_popen.return_value.stdin.getvalue())
+		assert recv(stdin) == {'command': 'sync.config', 'args': ['a']}
+		assert recv(stdin) == {'command': 'load', 'args': []}
+
+	def test_run_not_started(self, mock_popen):
+		"""Test that there is no result when the worker can't be started."""
+		mock_popen.return_value.stdout = io.BytesIO()
+
+		assert SudoWorker().run('sync.config', []) is None
+
+	def test_run_fails(self, mock_popen):
+		"""Test that a command is not run again when the worker fails while running it."""
+		mock_popen.return_value.stdout = frames({'ready': True})
+		worker = SudoWorker()
+
+		assert worker.run('sync.config', []) == (1, '', 'sudo worker failed running sync config')
+		assert worker.process is None
+		assert mock_popen.call_count == 1
+
+
+class TestSudoWorkerPool:
+
+	def test_run_concurrently(self):
+		"""Test that a long command doesn't hold up the others."""
+		started = threading.Event()
+		finish = threading.Event()
+
+		def run(worker, command, args):
+			if command == 'sync.config':
+				started.set()
+				finish.wait(5)
+			return (0, command, '')
+
+		pool = SudoWorkerPool(size=2)
+		with patch.object(SudoWorker, 'run', autospec=True, side_effect=run):
+			thread = threading.Thread(target=pool.run, args=('sync.config', []))
+			thread.start()
+			assert started.wait(5)
+
+			assert pool.run('load', []) == (0, 'load', '')
+			assert pool.run('load', []) == (0, 'load', '')
+
+			finish.set()
+			thread.join(5)
+
+		assert pool.workers == 2
+		assert len(pool.idle) == 2
+
+	def test_run_waits(self):
+		"""Test that a command waits for a worker when all of them are busy."""
+		pool = SudoWorkerPool(size=1)
+		results = []
+
+		with patch.object(SudoWorker, 'run', autospec=True, return_value=(0, '', '')):
+			threads = [ threading.Thread(target=lambda: results.append(pool.run('load', []))) for i in range(4) ]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join(5)
+
+		assert results == [(0, '', '')] * 4
+		assert pool.workers == 1
@@ -0,0 +1,77 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+SUDOERS = """# Stacki - SUDO Access to run commands as Apache
+Cmnd_Alias STACK_CMDS = /opt/stack/bin/stack sync *, \\
+	/opt/stack/bin/stack remove host *, \\
+	/opt/stack/bin/stack list host switch *
+Cmnd_Alias STACK_WORKER = /opt/stack/sbin/ws-sudo-worker ""
+Defaults!STACK_CMDS, STACK_WORKER !requiretty
+apache ALL = (root) NOPASSWD:STACK_CMDS, STACK_WORKER
+"""
+
+
+@pytest.fixture
+def worker():
+	loader = importlib.machinery.SourceFileLoader('ws_sudo_worker', '/opt/stack/sbin/ws-sudo-worker')
+	spec = importlib.util.spec_from_loader('ws_sudo_worker', loader)
+	module = importlib.util.module_from_spec(spec)
+
+	# The worker sets up Django for the commands it runs
+	with patch.dict(sys.modules, {'stack.django_env': MagicMock()}):
+		loader.exec_module(module)
+	return module
+
+
+@pytest.fixture
+def sudoers(tmp_path):
+	path = tmp_path / 'stacki_ws'
+	path.write_text(SUDOERS)
+	path.chmod(0o400)
+
+	# The file written by root, whoever runs the tests
+	real_fstat = os.fstat
+	def fstat(fd):
+		st = real_fstat(fd)
+		return os.stat_result((st.st_mode, st.st_ino, st.st_dev, st.st_nlink, 0) + tuple(st)[5:])
+
+	with patch('os.fstat', side_effect=fstat):
+		yield str(path)
+
+
+class TestWsSudoWorker:
+
+	def test_sudo_commands(self, worker, sudoers):
+		assert worker.sudoCommands(sudoers) == [
+			'/opt/stack/bin/stack sync *',
+			'/opt/stack/bin/stack remove host *',
+			'/opt/stack/bin/stack list host switch *',
+		]
+
+	@pytest.mark.parametrize('command, args, expected', (
+		('sync.config', [], True),
+		('sync.host.config', ['backend-0-0'], True),
+		('remove.host', ['backend-0-0'], True),
+		('list.host.switch', ['switch-0-0'], True),
+		('list.host', ['backend-0-0'], False),
+		('load', ['file=foo.json'], False),
+		('run.host', ['a', 'command=id'], False),
+	))
+	def test_allowed(self, worker, sudoers, command, args, expected):
+		assert worker.allowed(command, args, sudoers) == expected
+
+	def test_allowed_writable(self, worker, sudoers):
+		"""Test that nothing is allowed from a sudoers file anyone but root can change."""
+		os.chmod(sudoers, 0o664)
+
+		assert worker.sudoCommands(sudoers) == []
+		assert not worker.allowed('sync.config', [], sudoers)
+
+	def test_allowed_missing(self, worker, tmp_path):
+		assert not worker.allowed('sync.config', [], str(tmp_path / 'stacki_ws'))
@@ -0,0 +1,76 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Micro-benchmark of Command.call() for a "list host attr" sized result.
+# Compares handing the rows back in-process against the marshal round
+# trip call() used to do. No database is needed, the sub-command is a
+# synthetic one that outputs HOSTS x ATTRS rows.
+#
+# usage: call-overhead.py [hosts] [attrs] [runs]
+
+import sys
+import time
+import types
+import marshal
+import stack.commands
+
+hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+attrs = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+runs  = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+rows = [
+	(f'backend-{i // 40}-{i % 40}', 'host', 'var', f'attr.{j}', f'value-{j}')
+	for i in range(hosts) for j in range(attrs)
+]
+
+
+class Command(stack.commands.Command):
+
+	def run(self, params, args):
+		self.beginOutput()
+		for row in rows:
+			self.addOutput(row[0], row[1:])
+		self.endOutput(header=['host', 'scope', 'type', 'attr', 'value'])
+
+
+# Register the synthetic command as stack.commands.benchmark
+
+module = types.ModuleType('stack.commands.benchmark')
+module.Command = Command
+sys.modules[module.__name__] = module
+stack.commands.benchmark = module
+
+caller = stack.commands.Command(None)
+caller.hasAccess = lambda name: True
+Command.hasAccess = lambda self, name: True
+
+
+def marshalled():
+	return marshal.loads(caller.command('benchmark', ['output-format=binary']))
+
+
+def inprocess():
+	return caller.call('benchmark')
+
+
+assert marshalled() == inprocess()
+
+print(f'{hosts} hosts x {attrs} attrs = {len(rows)} rows, best of {runs}')
+results = {}
+for name, func in (('marshal', marshalled), ('in-process', inprocess)):
+	best = None
+	for i in range(runs):
+		t0 = time.time()
+		func()
+		t = time.time() - t0
+		if best is None or t < best:
+			best = t
+	results[name] = best
+	print(f'{name.ljust(12)} {best:.3f}s')
+
+print(f'speedup      {results["marshal"] / results["in-process"]:.2f}x')
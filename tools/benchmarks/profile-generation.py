@@ -0,0 +1,80 @@
+#! /opt/stack/bin/python3
+#
+# @copyright@
+# Copyright (c) 2006 - 2019 Teradata
+# All rights reserved. Stacki(r) v5.x stacki.com
+# https://github.com/Teradata/stacki/blob/master/LICENSE.txt
+# @copyright@
+#
+# Benchmark of the per host node file expansion done by list node xml,
+# parsing every node file for every host versus replaying the cached
+# node file tokens. Evals are not run (they are the same either way),
+# so this measures the XML processing only. No database is needed.
+#
+# The default graph is the stock backend graph of this source tree,
+# pass pallet directories (e.g. /export/stack/pallets/stacki/...) to
+# use those instead.
+#
+# usage: profile-generation.py [hosts] [directory ...]
+
+import os
+import sys
+import time
+import stack.profile
+
+hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+directories = sys.argv[2:]
+if not directories:
+	top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+	directories = [ os.path.realpath(os.path.join(top, 'common')),
+			os.path.realpath(os.path.join(top, 'redhat')) ]
+
+
+def profile(hostname, tokenize):
+	attrs = {
+		'os':		'redhat',
+		'arch':		'x86_64',
+		'release':	'redhat7',
+		'appliance':	'backend',
+		'hostname':	hostname,
+		'hostaddr':	'10.1.1.1',
+		'graph':	'default',
+		'box':		'default',
+		'root':		'backend',
+	}
+
+	handler = stack.profile.GraphHandler(attrs, directories=directories,
+					     tokenize=tokenize)
+	for directory in directories:
+		graph = os.path.join(directory, 'graph')
+		if os.path.isdir(graph):
+			handler.parseGraph(graph)
+
+	xml = []
+	root = handler.getMainGraph().getNode('backend')
+	for node, cond in stack.profile.FrameworkIterator(handler.getMainGraph()).run(root):
+		if not stack.cond.EvalCondExpr(cond, attrs):
+			continue
+		try:
+			handler.parseNode(node, False)
+		except stack.util.KickstartNodeError:
+			continue
+		xml.append(node.getXML())
+
+	return xml
+
+
+for n in range(hosts):
+	name = f'backend-0-{n}'
+	assert profile(name, False) == profile(name, True)
+
+print(f'{hosts} hosts, {" ".join(directories)}')
+results = {}
+for name, tokenize in (('parse', False), ('tokens', True)):
+	t0 = time.time()
+	for n in range(hosts):
+		profile(f'backend-0-{n}', tokenize)
+	results[name] = (time.time() - t0) / hosts
+	print(f'{name.ljust(8)} {results[name] * 1000:.1f}ms per host')
+
+print(f'speedup  {results["parse"] / results["tokens"]:.2f}x')